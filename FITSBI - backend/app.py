@@ -1,18 +1,32 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import datetime, timedelta
 from typing import List, Optional
 import jwt
-from passlib.context import CryptContext
+import json
 from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
 from models import UserCreate, User, ChatMessage, DailyProgress
 from mongodb import MongoDB
 from chatbot import FitnessChatbot
+from jobs import job_runner
+from single_flight import turn_coordinator
+from llm_client import llm_client
+from progress_ingest import ingest_progress
+from progress_trends import SERIES_FIELDS, compute_trends
+from principal_cache import principal_cache
+from password_hasher import HasherBusy, password_hasher
+from responses import FastJSONResponse, dumps
+from metrics import REGISTRY, MetricsMiddleware
+from log_config import RequestIdMiddleware, configure_logging, get_logger, stop_logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
+configure_logging()
+logger = get_logger(__name__)
 
 app = FastAPI(title="Fitness AI Assistant")
 
@@ -29,18 +43,26 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type", "*"],
 )
+# Outermost, so latency covers CORS handling and the whole streamed body
+app.add_middleware(MetricsMiddleware)
+# Every log line written while serving a request carries its X-Request-ID
+app.add_middleware(RequestIdMiddleware)
 
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Initialize chatbot
 chatbot = FitnessChatbot()
 
+# Authenticated users are cached per token; drop them whenever their user document changes
+MongoDB.add_user_change_listener(principal_cache.invalidate_user)
+REGISTRY.gauge("auth_cache_entries", "Principals currently cached", lambda: principal_cache.stats()["size"])
+REGISTRY.gauge("auth_cache_hit_rate", "Share of token lookups served from the principal cache", lambda: principal_cache.stats()["hit_rate"])
+
 # Additional Models for Google Sync
 class GoogleSyncRequest(BaseModel):
     email: str
@@ -52,12 +74,30 @@ class GoogleSyncRequest(BaseModel):
 @app.on_event("startup")
 async def startup_db_client():
     await MongoDB.connect_to_database()
+    await job_runner.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await turn_coordinator.drain()  # Replies already sent whose turns are still being saved
+    await job_runner.stop()
+    await llm_client.close()
     await MongoDB.close_database_connection()
+    password_hasher.close()
+    stop_logging()
 
 # Helper functions
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def hasher_busy() -> HTTPException:
+    # Logins are shed rather than queued so a storm of them can't starve chat requests
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts right now, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -66,6 +106,11 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # A token verified recently skips the JWT decode and the user lookup
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -77,13 +122,31 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     user = await MongoDB.get_user(user_id)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
+    
+    principal = {key: value for key, value in user.items() if key != "password"}
+    principal_cache.put(token, principal, str(user["_id"]), payload.get("exp"))
+    return principal
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint: stage, endpoint, Mongo and LLM token metrics for this worker"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/auth-cache")
+async def auth_cache_stats():
+    """Hit rate and size of the authenticated-principal cache"""
+    return principal_cache.stats()
 
 # Authentication endpoints
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = await MongoDB.get_user_by_email(form_data.username)
-    if not user or not pwd_context.verify(form_data.password, user["password"]):
+    # OAuth-only accounts have no password and can't sign in with one
+    try:
+        verified = bool(user and user.get("password")) and await password_hasher.verify(form_data.password, user["password"])
+    except HasherBusy:
+        raise hasher_busy()
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -112,7 +175,7 @@ async def sync_google_user(request: GoogleSyncRequest):
             user_data = {
                 "email": request.email,
                 "name": request.name,
-                "password": pwd_context.hash("google-oauth"),  # Placeholder password for OAuth users
+                "password": None,  # OAuth users sign in through Google only
                 "provider": "google",
                 "google_id": request.google_id,
                 "age": 25,  # Default values - user can update these later
@@ -127,8 +190,15 @@ async def sync_google_user(request: GoogleSyncRequest):
             }
             
             # Create user in your database
-            new_user_id = await MongoDB.create_user(user_data)
-            user_id = str(new_user_id)
+            try:
+                new_user_id = await MongoDB.create_user(user_data)
+                user_id = str(new_user_id)
+            except DuplicateKeyError:
+                # A concurrent sign-in created this account first
+                existing_user = await MongoDB.get_user_by_email(request.email)
+                if not existing_user:
+                    raise
+                user_id = str(existing_user["_id"])
         
         # Generate JWT token using your existing function
         access_token = create_access_token(data={"sub": user_id})
@@ -140,7 +210,7 @@ async def sync_google_user(request: GoogleSyncRequest):
         }
         
     except Exception as e:
-        print(f"Google sync error: {e}")
+        logger.error("Google sync error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to sync Google user")
 
 # FIXED: User creation endpoint
@@ -152,14 +222,20 @@ async def create_user(user: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password
-    hashed_password = pwd_context.hash(user.password)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except HasherBusy:
+        raise hasher_busy()
     user_data = user.dict()
     user_data["password"] = hashed_password
     user_data["created_at"] = datetime.utcnow()
     user_data["last_login"] = datetime.utcnow()
     
-    # Create user in database
-    user_id = await MongoDB.create_user(user_data)
+    # Create user in database; the unique email index catches a concurrent sign-up the check above missed
+    try:
+        user_id = await MongoDB.create_user(user_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Get the created user
     created_user = await MongoDB.get_user(str(user_id))
@@ -182,13 +258,85 @@ async def chat_with_ai(user_id: str, message: str, current_user: User = Depends(
     response = await chatbot.generate_response(user_id, message)
     return {"response": response}
 
-@app.get("/chat/history/{user_id}")
-async def get_chat_history(user_id: str, limit: int = 50, current_user: User = Depends(get_current_user)):
+@app.post("/chat/{user_id}/stream")
+async def chat_with_ai_stream(user_id: str, message: str, request: Request, current_user: User = Depends(get_current_user)):
+    """Same as /chat/{user_id} but streams tokens as Server-Sent Events while the model generates"""
+    if str(current_user["_id"]) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to chat as this user")
+    
+    async def event_stream():
+        # Flush headers and a first frame right away so the client stops waiting on the connection
+        yield sse_event("start", {})
+        
+        stream = chatbot.generate_response_stream(user_id, message)
+        try:
+            async for delta in stream:
+                if await request.is_disconnected():
+                    break
+                yield sse_event("token", {"delta": delta})
+            else:
+                yield sse_event("done", {})
+        except Exception as e:
+            logger.error("Error streaming response: %s", e, extra={"user_id": user_id})
+            yield sse_event("error", {"detail": "Failed to generate response"})
+        finally:
+            await stream.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+CHAT_HISTORY_FIELDS = {"role", "content", "timestamp", "extracted_data", "interrupted", "user_id"}
+
+def parse_history_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Comma-separated `fields` query parameter, checked against what a chat message can hold"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = sorted(set(requested) - CHAT_HISTORY_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown history fields: {', '.join(unknown)}")
+    return requested
+
+@app.get("/chat/history/{user_id}", response_class=FastJSONResponse)
+async def get_chat_history(user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                           fields: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """One page of chat history, oldest message first.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the
+    page before it. `fields` is a comma-separated projection; by default
+    everything except `extracted_data` is returned.
+    """
     if str(current_user["_id"]) != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to view this user's chat history")
+    if not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200")
+    
+    try:
+        history, next_cursor = await MongoDB.get_chat_history_page(user_id, limit, cursor, parse_history_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(history, headers=headers)
+
+@app.get("/chat/history/{user_id}/export")
+async def export_chat_history(user_id: str, fields: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """The user's entire chat history as NDJSON, streamed straight off the Mongo cursor"""
+    if str(current_user["_id"]) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to export this user's chat history")
+    projected_fields = parse_history_fields(fields)
     
-    history = await MongoDB.get_user_chat_history(user_id, limit)
-    return history
+    async def ndjson_lines():
+        async for message in MongoDB.iter_chat_history(user_id, projected_fields):
+            yield dumps(message) + b"\n"
+    
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat-history-{user_id}.ndjson"'}
+    )
 
 # Progress tracking endpoints
 @app.post("/progress/{user_id}")
@@ -197,15 +345,57 @@ async def add_daily_progress(user_id: str, progress: DailyProgress, current_user
         raise HTTPException(status_code=403, detail="Not authorized to add progress for this user")
     
     progress_id = await MongoDB.save_daily_progress(user_id, progress.dict())
-    return {"id": progress_id}
+    return {"id": str(progress_id)}
+
+@app.post("/progress/{user_id}/bulk")
+async def bulk_ingest_progress(user_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    """Ingest a streamed NDJSON body of tracker records, one day per line.
 
-@app.get("/progress/{user_id}")
+    Records are validated and upserted per day in batches as the body
+    arrives. Invalid records are listed in the response by line number and
+    don't fail the upload.
+    """
+    if str(current_user["_id"]) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to add progress for this user")
+    
+    return await ingest_progress(user_id, request.stream())
+
+@app.get("/progress/{user_id}", response_class=FastJSONResponse)
 async def get_progress(user_id: str, start_date: datetime, end_date: datetime, current_user: User = Depends(get_current_user)):
     if str(current_user["_id"]) != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to view this user's progress")
     
     progress = await MongoDB.get_user_progress(user_id, start_date, end_date)
-    return progress
+    return FastJSONResponse(progress)
+
+@app.get("/progress/{user_id}/trends", response_class=FastJSONResponse)
+async def get_progress_trends(user_id: str, days: int = 365, current_user: User = Depends(get_current_user)):
+    """Rolling averages, weight trend, calorie balance and correlations over the last `days` days"""
+    if str(current_user["_id"]) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to view this user's progress")
+    if not 7 <= days <= 3650:
+        raise HTTPException(status_code=400, detail="days must be between 7 and 3650")
+    
+    # Read before the series, so a write landing mid-computation leaves this entry unused
+    version = await MongoDB.get_progress_version(user_id)
+    trends = await MongoDB.get_cached_trends(user_id, days, version)
+    if trends is None:
+        series = await MongoDB.get_progress_series(user_id, datetime.utcnow() - timedelta(days=days), SERIES_FIELDS)
+        trends = compute_trends(series)
+        await MongoDB.save_cached_trends(user_id, days, version, trends)
+    return FastJSONResponse(trends)
+
+@app.get("/stats/{user_id}", response_class=FastJSONResponse)
+async def get_stats(user_id: str, period: str = "day", days: int = 30, current_user: User = Depends(get_current_user)):
+    """Conversation and progress rollups per day or week, served from one indexed read"""
+    if str(current_user["_id"]) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to view this user's stats")
+    if period not in ("day", "week"):
+        raise HTTPException(status_code=400, detail="period must be 'day' or 'week'")
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    
+    return FastJSONResponse(await MongoDB.get_rollups(user_id, period, datetime.utcnow() - timedelta(days=days)))
 
 # Plan generation endpoints
 @app.post("/workout-plan/{user_id}")
@@ -0,0 +1,28 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from mongodb import MongoDB
+
+# Builds conversation_rollups for history written before rollups existed, and
+# repairs drift: python backfill_rollups.py --days 365 [--user <user_id>]
+async def backfill(days: int, user_id: str = None, chunk_days: int = 28):
+    await MongoDB.connect_to_database()
+    try:
+        end = datetime.utcnow()
+        start = end - timedelta(days=days)
+        written = 0
+        # Walk the range a few weeks at a time so each rebuild holds only that window's rollups in memory
+        while start < end:
+            chunk_end = min(start + timedelta(days=chunk_days), end)
+            written += await MongoDB.rebuild_rollups(start, chunk_end, user_id=user_id)
+            print(f"Rolled up {start:%Y-%m-%d} .. {chunk_end:%Y-%m-%d} ({written} rollups so far)")
+            start = chunk_end
+    finally:
+        await MongoDB.close_database_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild conversation and progress rollups")
+    parser.add_argument("--days", type=int, default=365, help="How far back to rebuild")
+    parser.add_argument("--user", default=None, help="Only rebuild this user's rollups")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.days, args.user))
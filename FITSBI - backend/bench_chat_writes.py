@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from mongodb import MongoDB
+from storage import scratch_backend
+
+# Written to a scratch database on the memory backend or a local mongod
+# (--storage motor), so real chat history is never touched
+BENCH_DATABASE = "fitness_ai_bench"
+CONCURRENT_USERS = 200
+TURNS_PER_USER = 10
+
+def p99(samples: list) -> float:
+    return statistics.quantiles(samples, n=100)[98]
+
+async def user_session(user_id: str, latencies: list):
+    """Persist both sides of each turn the way _finish_turn does, timing what the reply waits on"""
+    for turn in range(TURNS_PER_USER):
+        start = time.perf_counter()
+        await MongoDB.save_chat_message(user_id, {"role": "user", "content": f"message {turn}", "extracted_data": {}})
+        await MongoDB.save_chat_message(user_id, {"role": "assistant", "content": f"reply {turn} 💪"})
+        latencies.append((time.perf_counter() - start) * 1000)
+        history = await MongoDB.get_user_chat_history(user_id, limit=2)
+        assert [m["content"] for m in history] == [f"message {turn}", f"reply {turn} 💪"], "lost read-your-writes"
+
+async def run_mode(write_behind: bool) -> dict:
+    collection = await MongoDB.get_collection("chat_history")
+    await collection.drop()
+    await MongoDB.chat_buffer.stop()
+    if write_behind:
+        MongoDB.chat_buffer.start(collection)
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(user_session(f"bench-user-{i}", latencies) for i in range(CONCURRENT_USERS)))
+    await MongoDB.chat_buffer.stop()  # Count throughput only once every message is durable
+    elapsed = time.perf_counter() - start
+
+    written = await collection.count_documents({})
+    expected = CONCURRENT_USERS * TURNS_PER_USER * 2
+    assert written == expected, f"expected {expected} messages, found {written}"
+    await collection.drop()
+    return {"inserts_per_sec": written / elapsed, "p99_ms": p99(latencies), "p50_ms": statistics.median(latencies)}
+
+async def run_benchmark(args):
+    MongoDB.backend = scratch_backend(args.storage, args.mongodb_url)
+    await MongoDB.connect_to_database(BENCH_DATABASE, migrate=False)
+    try:
+        direct = await run_mode(write_behind=False)
+        buffered = await run_mode(write_behind=True)
+    finally:
+        await MongoDB.close_database_connection()
+
+    for label, result in (("insert_one per message", direct), ("write-behind buffer", buffered)):
+        print(f"{label:<24} {result['inserts_per_sec']:8.0f} inserts/sec   "
+              f"p50 {result['p50_ms']:6.2f} ms   p99 {result['p99_ms']:6.2f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chat_history insert throughput: insert_one per message vs the write-behind buffer")
+    parser.add_argument("--storage", choices=["memory", "motor"], default="memory")
+    parser.add_argument("--mongodb-url", default=os.getenv("BENCH_MONGODB_URL", "mongodb://127.0.0.1:27017"),
+                        help="a local mongod, with --storage motor")
+    asyncio.run(run_benchmark(parser.parse_args()))
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import sys
+import time
+import httpx
+from llm_client import LLMClient, LLMError
+from load_test import start_server, wait_until_up
+
+# Checks LLMClient's retry policy against fake_openai.py with failures
+# injected through its /faults endpoint: 429/5xx are retried, Retry-After is
+# waited out, client errors are not retried, and retries stop at max_retries
+# or at the call's deadline, whichever comes first.
+FAKE_OPENAI_PORT = 8902
+MESSAGES = [{"role": "user", "content": "How many rest days do I need?"}]
+
+class FakeServer:
+    def __init__(self, url: str):
+        self.url = url
+        self.http = httpx.AsyncClient(base_url=url)
+
+    async def faults(self, fail_next: int, status: int, retry_after=None):
+        await self.http.post("/faults", json={"fail_next": fail_next, "status": status, "retry_after": retry_after})
+
+    async def requests(self) -> int:
+        return (await self.http.get("/stats")).json()["requests"]
+
+async def scenario(server: FakeServer, name: str, client: LLMClient, call, expect_ok: bool,
+                   expect_requests: int, min_seconds: float = 0.0, max_seconds: float = None) -> bool:
+    before = await server.requests()
+    started = time.monotonic()
+    try:
+        await call(client)
+        ok = True
+    except LLMError:
+        ok = False
+    elapsed = time.monotonic() - started
+    requests = await server.requests() - before
+    await server.faults(0, 429)
+    await client.close()
+
+    passed = ok == expect_ok and requests == expect_requests and elapsed >= min_seconds
+    passed = passed and (max_seconds is None or elapsed <= max_seconds)
+    limits = f">= {min_seconds:g}s" + (f", <= {max_seconds:g}s" if max_seconds is not None else "")
+    print(f"{'✅' if passed else '❌'} {name:<44} {'ok' if ok else 'LLMError':<8} "
+          f"{requests} requests (expected {expect_requests})  {elapsed:.2f}s ({limits})")
+    return passed
+
+async def complete(client: LLMClient):
+    await client.complete(MESSAGES, call_site="retry_check")
+
+async def stream(client: LLMClient):
+    parts = [delta async for delta in client.stream(MESSAGES, call_site="retry_check")]
+    assert parts, "stream produced no tokens"
+
+async def run_checks(url: str) -> bool:
+    server = FakeServer(url)
+
+    def client(**options) -> LLMClient:
+        return LLMClient(base_url=f"{url}/v1", api_key="retry-check", base_delay=0.05, **options)
+
+    results = []
+    await server.faults(2, 429, retry_after=0.4)
+    results.append(await scenario(server, "429 x2 with Retry-After 0.4s, then ok", client(max_retries=3), complete,
+                                  expect_ok=True, expect_requests=3, min_seconds=0.8))
+    await server.faults(2, 503)
+    results.append(await scenario(server, "503 x2 without Retry-After, then ok", client(max_retries=3), complete,
+                                  expect_ok=True, expect_requests=3, max_seconds=1.0))
+    await server.faults(1, 400)
+    results.append(await scenario(server, "400 is not retried", client(max_retries=3), complete,
+                                  expect_ok=False, expect_requests=1, max_seconds=0.5))
+    await server.faults(1000, 500)
+    results.append(await scenario(server, "500 every time stops after max_retries=2", client(max_retries=2), complete,
+                                  expect_ok=False, expect_requests=3, max_seconds=1.0))
+    # Each retry waits 1s, so the third attempt at ~2s can't be followed by another within 2.5s
+    await server.faults(1000, 429, retry_after=1)
+    results.append(await scenario(server, "429 every time stops at the 2.5s deadline", client(max_retries=10, timeout=2.5), complete,
+                                  expect_ok=False, expect_requests=3, min_seconds=1.9, max_seconds=2.5))
+    await server.faults(1, 429, retry_after=0.2)
+    results.append(await scenario(server, "stream: 429 on open is retried", client(max_retries=3), stream,
+                                  expect_ok=True, expect_requests=2, min_seconds=0.2))
+    await server.http.aclose()
+    return all(results)
+
+async def main(args) -> int:
+    process = None
+    url = args.fake_url
+    if url is None:
+        process = start_server([
+            sys.executable, "fake_openai.py", "--port", str(FAKE_OPENAI_PORT),
+            "--latency-ms", "10", "--tokens-per-sec", "0", "--reply-tokens", "20",
+        ], None)
+        url = f"http://127.0.0.1:{FAKE_OPENAI_PORT}"
+    try:
+        if process is not None:
+            await wait_until_up(f"{url}/stats", process)
+        return 0 if await run_checks(url) else 1
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check LLMClient retries, Retry-After and deadlines against fake_openai.py")
+    parser.add_argument("--fake-url", default=None, help="use an already running fake_openai.py instead of starting one")
+    sys.exit(asyncio.run(main(parser.parse_args())))
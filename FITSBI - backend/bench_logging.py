@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from bson import ObjectId
+from log_config import configure_logging, stop_logging
+from mongodb import MongoDB
+from storage import MemoryBackend
+
+# get_user on the in-memory backend, so the database is not what's being
+# measured: with the prints it used to make, and with the same lines going
+# through the queue-backed logger at INFO and at sampled DEBUG. Output goes
+# to a pipe drained by a thread, like a container's stdout read by a log
+# shipper; --collector-delay-ms makes that reader slow.
+USERS = 1_000
+
+def legacy_prints(user_id: str):
+    """The lines get_user printed on every lookup before it used the logger"""
+    print(f"🔍 DEBUG: Looking for user_id: {user_id}")
+    print("✅ Found user by _id lookup")
+
+class PipeSink:
+    """A line-buffered text stream whose other end is read by a background thread"""
+
+    def __init__(self, read_delay: float):
+        read_fd, write_fd = os.pipe()
+        self.reader = os.fdopen(read_fd, "rb", buffering=0)
+        self.stream = os.fdopen(write_fd, "w", buffering=1)
+        self.read_delay = read_delay
+        self.bytes = 0
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        while True:
+            chunk = self.reader.read(4096)
+            if not chunk:
+                return
+            self.bytes += len(chunk)
+            if self.read_delay:
+                time.sleep(self.read_delay)
+
+    def close(self):
+        self.stream.close()
+        self._thread.join()
+        self.reader.close()
+
+async def time_lookups(user_ids: list, concurrency: int, before=None) -> dict:
+    timings = []
+    queue = list(user_ids)
+
+    async def worker():
+        while queue:
+            user_id = queue.pop()
+            start = time.perf_counter()
+            if before:
+                before(user_id)
+            user = await MongoDB.get_user(user_id)
+            timings.append((time.perf_counter() - start) * 1e6)
+            assert user is not None, f"seeded user {user_id} not found"
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        "lookups_per_s": len(timings) / elapsed,
+        "p50_us": statistics.median(timings),
+        "p99_us": timings[int(len(timings) * 0.99) - 1],
+    }
+
+async def run_benchmark(args) -> bool:
+    MongoDB.backend = MemoryBackend()
+    await MongoDB.connect_to_database()
+    collection = await MongoDB.get_collection("users")
+    user_ids = [ObjectId() for _ in range(USERS)]
+    await collection.insert_many([{"_id": user_id, "email": f"bench{i}@example.com"} for i, user_id in enumerate(user_ids)])
+    lookups = [str(user_ids[i % USERS]) for i in range(args.lookups)]
+    read_delay = args.collector_delay_ms / 1000
+
+    results = {}
+    sink = PipeSink(read_delay)
+    real_stdout, sys.stdout = sys.stdout, sink.stream
+    try:
+        results["print"] = await time_lookups(lookups, args.concurrency, before=legacy_prints)
+    finally:
+        sys.stdout = real_stdout
+        sink.close()
+
+    for name, levels in (("logger INFO", ""), ("logger DEBUG 1% sampled", "mongodb=DEBUG")):
+        sink = PipeSink(read_delay)
+        configure_logging(level="INFO", levels=levels, debug_sample_rate=0.01, stream=sink.stream)
+        try:
+            results[name] = await time_lookups(lookups, args.concurrency)
+        finally:
+            stop_logging()
+            logging.getLogger("mongodb").setLevel(logging.NOTSET)
+            sink.close()
+
+    await MongoDB.close_database_connection()
+
+    print(f"{args.lookups:,} get_user calls, {args.concurrency} concurrent, collector delay {args.collector_delay_ms:g} ms/4KB")
+    print(f"{'mode':<26} {'lookups/s':>10} {'p50 us':>8} {'p99 us':>9}")
+    for name, row in results.items():
+        print(f"{name:<26} {row['lookups_per_s']:>10,.0f} {row['p50_us']:>8.1f} {row['p99_us']:>9.1f}")
+    speedup = results["logger INFO"]["lookups_per_s"] / results["print"]["lookups_per_s"]
+    print(f"Logger at INFO vs prints: {speedup:.2f}x throughput")
+    return speedup >= 1.0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cost of get_user's logging: prints vs the queue-backed logger")
+    parser.add_argument("--lookups", type=int, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--collector-delay-ms", type=float, default=0.0, help="pause after each 4KB read by the log reader")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run_benchmark(args)) else 1)
@@ -0,0 +1,74 @@
+import asyncio
+import statistics
+import time
+from password_hasher import HasherBusy, PasswordHasher
+
+# A chat request is mostly awaited I/O; what a login storm can do to it is
+# hold the event loop. Chat latency is measured with no logins, with bcrypt
+# run inline in the handler (the old behaviour) and with the bounded pool.
+CHAT_REQUESTS = 300
+CHAT_INTERVAL = 0.01  # 100 chat requests/sec
+CHAT_IO = 0.02  # Awaited Mongo/LLM time per request in this model
+LOGIN_INTERVAL = 0.02  # 50 login attempts/sec for the whole run
+
+def p99(samples: list) -> float:
+    return statistics.quantiles(samples, n=100)[98]
+
+async def chat_request(latencies: list):
+    start = time.perf_counter()
+    await asyncio.sleep(CHAT_IO)
+    latencies.append((time.perf_counter() - start) * 1000)
+
+async def chat_traffic() -> list:
+    latencies = []
+    tasks = []
+    for _ in range(CHAT_REQUESTS):
+        tasks.append(asyncio.create_task(chat_request(latencies)))
+        await asyncio.sleep(CHAT_INTERVAL)
+    await asyncio.gather(*tasks)
+    return latencies
+
+async def login_inline(hasher: PasswordHasher, hashed: str):
+    await asyncio.sleep(0)
+    hasher.context.verify("hunter2", hashed)  # Blocks the loop for the whole bcrypt round
+
+async def login_pooled(hasher: PasswordHasher, hashed: str) -> bool:
+    try:
+        await hasher.verify("hunter2", hashed)
+        return True
+    except HasherBusy:
+        return False
+
+async def login_storm(login, hasher: PasswordHasher, hashed: str, until: asyncio.Future) -> list:
+    attempts = []
+    while not until.done():
+        attempts.append(asyncio.create_task(login(hasher, hashed)))
+        await asyncio.sleep(LOGIN_INTERVAL)
+    return await asyncio.gather(*attempts)
+
+async def run_mode(mode: str, hasher: PasswordHasher, hashed: str) -> dict:
+    chat = asyncio.ensure_future(chat_traffic())
+    outcomes = []
+    if mode != "no logins":
+        login = login_inline if mode == "inline" else login_pooled
+        outcomes = await login_storm(login, hasher, hashed, chat)
+    latencies = await chat
+    return {
+        "p50": statistics.median(latencies),
+        "p99": p99(latencies),
+        "logins_shed": sum(outcome is False for outcome in outcomes),
+    }
+
+async def run_benchmark():
+    hasher = PasswordHasher()
+    hashed = hasher.context.hash("hunter2")
+    try:
+        for mode in ("no logins", "inline", "pool"):
+            result = await run_mode(mode, hasher, hashed)
+            print(f"{mode:<10} chat p50 {result['p50']:7.1f} ms   p99 {result['p99']:7.1f} ms   "
+                  f"logins shed {result['logins_shed']}")
+    finally:
+        hasher.close()
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
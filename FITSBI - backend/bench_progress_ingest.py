@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from migrations import ensure_indexes
+from mongodb import MongoDB
+from progress_ingest import ingest_progress
+from storage import scratch_backend
+
+# Written to a scratch database on the memory backend or a local mongod
+# (--storage motor), so real progress data is never touched
+BENCH_DATABASE = "fitness_ai_bench"
+USERS = 100
+DAYS_PER_USER = 1000  # 100 x 1000 = 100k records
+CHUNK_BYTES = 64 * 1024  # Roughly what arrives per read from the request body
+INVALID_EVERY = 97  # Sprinkle in bad records to exercise per-record errors
+
+def upload_body(user_index: int) -> bytes:
+    start = datetime(2022, 1, 1)
+    lines = []
+    for day in range(DAYS_PER_USER):
+        if (user_index * DAYS_PER_USER + day) % INVALID_EVERY == 0:
+            lines.append('{"date": "not-a-date", "steps": -5}')
+            continue
+        lines.append(json.dumps({
+            "date": (start + timedelta(days=day)).isoformat(),
+            "steps": random.randint(2000, 15000),
+            "sleep_hours": round(random.uniform(5, 9), 1),
+            "weight": round(80 - day * 0.01 + random.uniform(-0.5, 0.5), 1),
+            "calories_consumed": random.randint(1800, 2800),
+            "calories_burned": random.randint(1900, 2900),
+            "source": "bench",
+        }))
+    return "\n".join(lines).encode()
+
+async def chunked(body: bytes):
+    for offset in range(0, len(body), CHUNK_BYTES):
+        yield body[offset:offset + CHUNK_BYTES]
+
+async def run_benchmark(args):
+    MongoDB.backend = scratch_backend(args.storage, args.mongodb_url)
+    await MongoDB.connect_to_database(BENCH_DATABASE, migrate=False)
+    try:
+        for collection_name in ("daily_progress", "conversation_rollups"):
+            await (await MongoDB.get_collection(collection_name)).drop()
+        await ensure_indexes(MongoDB.db)  # Per-day upserts need the (user_id, date) index, as in production
+        bodies = [upload_body(i) for i in range(USERS)]
+
+        received = failed = 0
+        start = time.perf_counter()
+        for i, body in enumerate(bodies):
+            report = await ingest_progress(f"bench-user-{i}", chunked(body))
+            received += report["received"]
+            failed += report["failed"]
+        elapsed = time.perf_counter() - start
+
+        stored = await (await MongoDB.get_collection("daily_progress")).count_documents({})
+        print(f"Ingested {received:,} records ({failed:,} rejected, {stored:,} days stored) in {elapsed:.1f}s")
+        print(f"Throughput: {received / elapsed:,.0f} records/sec")
+
+        # Re-uploading the same data must update in place, not duplicate days
+        await ingest_progress("bench-user-0", chunked(bodies[0]))
+        assert await (await MongoDB.get_collection("daily_progress")).count_documents({}) == stored, "re-upload duplicated days"
+
+        # ...and leave the rollups where a rebuild from the stored days puts them
+        rollups = await MongoDB.get_rollups("bench-user-0", "day", datetime(2000, 1, 1))
+        await MongoDB.rebuild_rollups(datetime(2000, 1, 1), datetime.utcnow(), user_id="bench-user-0")
+        rebuilt = await MongoDB.get_rollups("bench-user-0", "day", datetime(2000, 1, 1))
+        assert [{**r, "updated_at": None} for r in rollups] == [{**r, "updated_at": None} for r in rebuilt], \
+            "ingest rollups drifted from a rebuild"
+        print(f"Rollups match a rebuild across {len(rollups):,} days")
+    finally:
+        for collection_name in ("daily_progress", "conversation_rollups"):
+            await (await MongoDB.get_collection(collection_name)).drop()
+        await MongoDB.close_database_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NDJSON progress ingest throughput")
+    parser.add_argument("--storage", choices=["memory", "motor"], default="memory")
+    parser.add_argument("--mongodb-url", default=os.getenv("BENCH_MONGODB_URL", "mongodb://127.0.0.1:27017"),
+                        help="a local mongod, with --storage motor")
+    asyncio.run(run_benchmark(parser.parse_args()))
@@ -0,0 +1,78 @@
+import json
+import random
+import timeit
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from mongodb import MongoDB
+from responses import dumps
+
+# Micro-benchmarks of the read path for realistic document shapes: the old
+# str(type(...)) serializer + jsonable_encoder + json against the type-dispatch
+# serializer + orjson. Run: python bench_serialization.py
+ROUNDS = 200
+
+def legacy_serialize(doc):
+    """serialize_document as it was before the type-dispatch rewrite"""
+    if doc is None:
+        return None
+    if isinstance(doc, list):
+        return [legacy_serialize(item) for item in doc]
+    if isinstance(doc, dict):
+        serialized = {}
+        for key, value in doc.items():
+            if hasattr(value, '__class__') and 'ObjectId' in str(type(value)):
+                serialized[key] = str(value)
+            elif isinstance(value, (dict, list)):
+                serialized[key] = legacy_serialize(value)
+            else:
+                serialized[key] = value
+        return serialized
+    return doc
+
+def chat_page(count: int = 50) -> list:
+    now = datetime.utcnow()
+    messages = []
+    for i in range(count):
+        message = {
+            "_id": ObjectId(),
+            "user_id": "64b000000000000000000001",
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": "Leg day tomorrow, any tips for squats? 💪 " * random.randint(1, 6),
+            "timestamp": now - timedelta(minutes=count - i),
+        }
+        if i % 2 == 0:
+            message["extracted_data"] = {"weight": 72.5, "fitness_goals": ["muscle_gain"]}
+        messages.append(message)
+    return messages
+
+def progress_range(days: int = 365) -> list:
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": "64b000000000000000000001",
+            "date": start + timedelta(days=day),
+            "weight": 80 - day * 0.01,
+            "steps": random.randint(2000, 15000),
+            "sleep_hours": 7.5,
+            "calories_consumed": 2300,
+            "calories_burned": 2500,
+            "mood": "good",
+            "source": "watch",
+        }
+        for day in range(days)
+    ]
+
+def measure(label: str, documents: list):
+    old = timeit.timeit(lambda: json.dumps(jsonable_encoder(legacy_serialize(documents))).encode(), number=ROUNDS)
+    new = timeit.timeit(lambda: dumps(MongoDB.serialize_document(documents)), number=ROUNDS)
+    serialize_old = timeit.timeit(lambda: legacy_serialize(documents), number=ROUNDS)
+    serialize_new = timeit.timeit(lambda: MongoDB.serialize_document(documents), number=ROUNDS)
+    print(f"{label}")
+    print(f"  serialize_document   old {serialize_old / ROUNDS * 1e6:8.0f} µs   new {serialize_new / ROUNDS * 1e6:8.0f} µs")
+    print(f"  + encode response    old {old / ROUNDS * 1e6:8.0f} µs   new {new / ROUNDS * 1e6:8.0f} µs   ({old / new:.1f}x)")
+
+if __name__ == "__main__":
+    measure("Chat history page (50 messages)", chat_page())
+    measure("Progress range (365 days)", progress_range())
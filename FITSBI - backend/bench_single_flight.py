@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+from mongodb import MongoDB
+from single_flight import TurnCoordinator
+from storage import MemoryBackend
+
+# Two TurnCoordinators stand in for two workers: they share only the leases
+# collection (on the in-memory backend), exactly as separate processes would
+# share Mongo. The turn itself is a sleep standing in for extraction + LLM.
+
+class FakeTurns:
+    """Counts turn executions, how many of one user's turns overlap, and turns that started before the previous save"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.executions = 0
+        self.running = Counter()
+        self.unsaved = Counter()
+        self.max_overlap = 0
+        self.started_unsaved = 0
+
+    async def run(self, worker: TurnCoordinator, user_id: str, message: str) -> str:
+        self.executions += 1
+        self.started_unsaved += self.unsaved[user_id] > 0
+        self.running[user_id] += 1
+        self.max_overlap = max(self.max_overlap, self.running[user_id])
+        try:
+            await asyncio.sleep(self.seconds)
+            self.unsaved[user_id] += 1
+            worker.after_reply(self.save(user_id))
+            return f"reply to {message!r} #{self.executions}"
+        finally:
+            self.running[user_id] -= 1
+
+    async def save(self, user_id: str):
+        await asyncio.sleep(self.seconds / 4)
+        self.unsaved[user_id] -= 1
+
+async def duplicates(workers, users: int, copies: int, turn_seconds: float) -> bool:
+    """Every user sends the same message `copies` times at once, spread over the workers"""
+    turns = FakeTurns(turn_seconds)
+    calls = []
+    for user in range(users):
+        user_id = f"dup-user-{user}"
+        for copy in range(copies):
+            worker = workers[copy % len(workers)]
+            calls.append((user_id, worker.run(user_id, "I slept 7 hours", lambda w=worker, u=user_id: turns.run(w, u, "I slept 7 hours"))))
+    start = time.perf_counter()
+    replies = await asyncio.gather(*(call for _, call in calls))
+    elapsed = time.perf_counter() - start
+
+    by_user = {}
+    for (user_id, _), reply in zip(calls, replies):
+        by_user.setdefault(user_id, set()).add(reply)
+    consistent = all(len(replies) == 1 for replies in by_user.values())
+    print(f"Duplicates: {len(calls)} requests from {users} users -> {turns.executions} turns run "
+          f"(uncoordinated: {len(calls)}), one reply per user: {consistent}, {elapsed:.2f}s")
+    return turns.executions == users and consistent
+
+async def ordering(workers, messages: int, turn_seconds: float) -> bool:
+    """One user sends `messages` different messages at once, spread over the workers"""
+    turns = FakeTurns(turn_seconds)
+    user_id = "busy-user"
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        workers[i % len(workers)].run(user_id, f"message {i}", lambda i=i: turns.run(workers[i % len(workers)], user_id, f"message {i}"))
+        for i in range(messages)
+    ))
+    elapsed = time.perf_counter() - start
+    print(f"Ordering: {messages} different messages from one user -> {turns.executions} turns, "
+          f"at most {turns.max_overlap} at once, {turns.started_unsaved} started before the previous save, "
+          f"{elapsed:.2f}s (serial minimum {messages * turn_seconds:.2f}s)")
+    return turns.executions == messages and turns.max_overlap == 1 and turns.started_unsaved == 0
+
+async def repeats(workers, times: int, turn_seconds: float) -> bool:
+    """One user sends the same message `times` times, each after the previous reply: all are new turns"""
+    turns = FakeTurns(turn_seconds)
+    user_id = "repeat-user"
+    for i in range(times):
+        worker = workers[i % len(workers)]
+        await worker.run(user_id, "yes", lambda: turns.run(worker, user_id, "yes"))
+    print(f"Repeats: the same message sent {times} times in a row -> {turns.executions} turns")
+    return turns.executions == times
+
+async def run_benchmark(args) -> bool:
+    MongoDB.backend = MemoryBackend()
+    await MongoDB.connect_to_database()
+    workers = [TurnCoordinator() for _ in range(args.workers)]
+    try:
+        ok = await duplicates(workers, args.users, args.copies, args.turn_ms / 1000)
+        ok = await ordering(workers, args.messages, args.turn_ms / 1000) and ok
+        ok = await repeats(workers, 4, args.turn_ms / 1000) and ok
+    finally:
+        for worker in workers:
+            await worker.drain()
+        await MongoDB.close_database_connection()
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check single-flight dedup and per-user turn ordering across workers")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--copies", type=int, default=3, help="identical requests per user")
+    parser.add_argument("--messages", type=int, default=6, help="different messages sent at once by one user")
+    parser.add_argument("--turn-ms", type=float, default=200)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run_benchmark(args)) else 1)
@@ -0,0 +1,124 @@
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+from chatbot import FitnessChatbot
+from extraction_gate import RECORDED_SAMPLE
+from jobs import job_runner
+from llm_client import llm_client
+from mongodb import MongoDB
+from single_flight import turn_coordinator
+from storage import MemoryBackend
+
+# Assumed p50s for the fakes: Mongo calls against a same-region Atlas cluster,
+# and the provider's time for the extractor's 200-token JSON and a 600-token
+# reply. Each call sleeps a random ±JITTER around its p50, drawn per (run,
+# turn, call) so both modes of a run see the same latencies and the saving
+# measured is the overlap alone; the spread across runs shows the noise.
+USER_READ = 0.010
+HISTORY_READ = 0.030  # 12 messages, sorted, over the (user_id, timestamp) index
+CONTEXT_READ = 0.012
+WRITE = 0.015
+EXTRACTION_LATENCY = 0.45
+COMPLETION_LATENCY = 0.9
+JITTER = 0.3
+RUNS = 5
+
+USER = {
+    "_id": "64b000000000000000000001",
+    "name": "Bench",
+    "age": None,
+    "weight": 72.0,
+    "fitness_goals": ["muscle_gain"],
+    "profile_completion": 20.0,
+}
+# One turn per recorded (bot question, reply) pair, so the extraction gate
+# skips the LLM as often as it does in production
+TURNS = [(question, reply) for question, reply, _ in RECORDED_SAMPLE]
+
+current = {"run": 0, "turn": 0}
+extractions = 0
+
+async def fake_call(p50: float, result=None):
+    draw = random.Random(f"{current['run']}:{current['turn']}:{p50}")
+    await asyncio.sleep(p50 * draw.uniform(1 - JITTER, 1 + JITTER))
+    return result
+
+def history_for(question: str) -> list:
+    return [
+        {"role": "user", "content": "yo", "timestamp": datetime.utcnow()},
+        {"role": "assistant", "content": question, "timestamp": datetime.utcnow()},
+    ]
+
+async def fake_complete(messages, max_tokens=600, **kwargs):
+    # The extractor asks for 200 tokens; everything else is a main completion
+    global extractions
+    extraction = max_tokens == 200
+    extractions += extraction
+    content = '{"age": 22}' if extraction else "Let's get it 💪"
+    return await fake_call(EXTRACTION_LATENCY if extraction else COMPLETION_LATENCY,
+                           SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))]))
+
+async def fake_enqueue(*args, **kwargs):
+    return False
+
+async def run_turns(chatbot: FitnessChatbot, sequential: bool) -> float:
+    """Mean reply latency in ms over every turn"""
+    latencies = []
+    for current["turn"], (question, reply) in enumerate(TURNS):
+        with patch.object(MongoDB, "get_user_chat_history", lambda *a, **k: fake_call(HISTORY_READ, history_for(question))):
+            start = time.perf_counter()
+            await chatbot.generate_response(USER["_id"], reply, sequential=sequential)
+            latencies.append((time.perf_counter() - start) * 1000)
+            # A user reads the reply before sending the next message; the save finishes meanwhile
+            await turn_coordinator.drain()
+    return statistics.mean(latencies)
+
+async def run_benchmark():
+    patches = [
+        patch.object(MongoDB, "get_user", lambda user_id: fake_call(USER_READ, dict(USER))),
+        patch.object(MongoDB, "get_user_context", lambda *a, **k: fake_call(CONTEXT_READ, {"profile": "=== USER PROFILE ===\n", "journey": [], "daily": []})),
+        patch.object(MongoDB, "update_user_profile", lambda *a, **k: fake_call(WRITE, True)),
+        patch.object(MongoDB, "save_chat_message", lambda *a, **k: fake_call(WRITE, "id")),
+        patch.object(llm_client, "complete", fake_complete),
+        patch.object(job_runner, "enqueue", fake_enqueue),
+    ]
+    # Everything the turn reads or writes is faked; the real store only holds
+    # the turn and single-flight leases
+    MongoDB.backend = MemoryBackend()
+    await MongoDB.connect_to_database()
+    for p in patches:
+        p.start()
+    runs = []
+    try:
+        chatbot = FitnessChatbot()
+        for current["run"] in range(RUNS):
+            sequential = await run_turns(chatbot, sequential=True)
+            chatbot.stage_timings.clear()
+            concurrent = await run_turns(chatbot, sequential=False)
+            runs.append((sequential, concurrent))
+    finally:
+        for p in patches:
+            p.stop()
+        await MongoDB.close_database_connection()
+
+    print(f"{RUNS} runs of {len(TURNS)} turns in each mode; {extractions / (2 * RUNS * len(TURNS)):.0%} of turns called the extractor")
+    print("Run   sequential    graph   saved")
+    for i, (sequential, concurrent) in enumerate(runs, 1):
+        print(f"{i:>3}   {sequential:7.1f} ms  {concurrent:7.1f} ms  {sequential - concurrent:5.1f} ms")
+    saved = [sequential - concurrent for sequential, concurrent in runs]
+    print(f"Saved per turn: mean {statistics.mean(saved):.1f} ms ({statistics.mean(saved) / statistics.mean(s for s, _ in runs):.1%}), "
+          f"stdev across runs {statistics.stdev(saved):.1f} ms")
+    print("\nPer-stage duration (graph runs, mean ms):")
+    for stage, samples in chatbot.stage_timings.items():
+        print(f"  {stage:<16} {statistics.mean(samples) * 1000:7.1f}")
+
+    reports = chatbot.prompt_token_stats
+    print(f"\nPrompt tokens per turn: mean {statistics.mean(r.tokens_before for r in reports):.0f} before trimming, "
+          f"{statistics.mean(r.tokens_after for r in reports):.0f} sent (budget {reports[-1].budget})")
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
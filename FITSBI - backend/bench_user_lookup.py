@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from bson import ObjectId
+from mongodb import MongoDB
+from storage import scratch_backend
+
+# Seeded into a scratch database on the memory backend or a local mongod
+# (--storage motor); the shared cluster in MONGODB_URL is never used
+BENCH_DATABASE = "fitness_ai_bench"
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+LOOKUPS = 500
+MAX_GROWTH = 3.0  # p50 at the largest size may be at most 3x the smallest
+
+async def seed_users(collection, count: int):
+    """Top the collection up to `count` users, inserting in batches"""
+    existing = await collection.count_documents({})
+    batch = []
+    for i in range(existing, count):
+        batch.append({"_id": ObjectId(), "email": f"bench{i}@example.com", "name": f"Bench {i}"})
+        if len(batch) == 10_000:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+async def time_lookups(collection, user_ids: list) -> float:
+    """Return the median get_user latency in milliseconds"""
+    timings = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        user = await MongoDB.get_user(user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert user is not None, f"seeded user {user_id} not found"
+    return statistics.median(timings)
+
+async def run_benchmark(args):
+    MongoDB.backend = scratch_backend(args.storage, args.mongodb_url)
+    await MongoDB.connect_to_database(BENCH_DATABASE, migrate=False)  # _id lookups need no secondary index
+    results = {}
+
+    try:
+        collection = await MongoDB.get_collection("users")
+        await collection.drop()
+        for size in SIZES:
+            await seed_users(collection, size)
+            sample = await collection.aggregate([{"$sample": {"size": LOOKUPS}}]).to_list(length=LOOKUPS)
+            results[size] = await time_lookups(collection, [str(doc["_id"]) for doc in sample])
+            print(f"{size:>9,} users: p50 get_user = {results[size]:.2f} ms")
+        await collection.drop()
+    finally:
+        await MongoDB.close_database_connection()
+
+    growth = results[SIZES[-1]] / results[SIZES[0]]
+    print(f"Latency growth {SIZES[0]:,} -> {SIZES[-1]:,}: {growth:.2f}x (limit {MAX_GROWTH}x)")
+    return growth <= MAX_GROWTH
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="get_user latency as the users collection grows")
+    parser.add_argument("--storage", choices=["memory", "motor"], default="memory")
+    parser.add_argument("--mongodb-url", default=os.getenv("BENCH_MONGODB_URL", "mongodb://127.0.0.1:27017"),
+                        help="a local mongod, with --storage motor")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run_benchmark(args)) else 1)
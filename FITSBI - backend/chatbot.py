@@ -1,16 +1,26 @@
-import openai
+import asyncio
+import time
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
-import os
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional
 import json
-import re
 from models import ChatMessage, User, DailyProgress, DailySummary
-from mongodb import MongoDB
+from mongodb import MongoDB, UserSnapshot
+from jobs import job_runner
+from log_config import get_logger
+from single_flight import turn_coordinator
+from llm_client import llm_client
+from plan_cache import plan_fingerprint
+from pipeline import StageGraph
+from metrics import CHAT_PROMPT_TOKENS, CHAT_STAGE_SECONDS
+from fact_parser import parse_facts
+from extraction_gate import EXTRACTABLE_FIELDS, missing_profile_fields, should_extract
+from context_assembler import ContextAssembler, PromptReport
+from user_context import render_memory, render_profile
 
 load_dotenv()
-
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = get_logger(__name__)
 
 class FitnessChatbot:
     def __init__(self):
@@ -62,15 +72,45 @@ CONVERSATION STYLE:
             5: ["location", "occupation", "available_equipment"]  # Environmental factors
         }
 
-    async def _build_user_context(self, user_id: str) -> str:
+        # Recent per-stage durations (seconds) of generate_response, keyed by stage name
+        self.stage_timings: Dict[str, deque] = defaultdict(lambda: deque(maxlen=1000))
+
+        # How often each extraction gate outcome fired, keyed by GateDecision.reason
+        self.extraction_gate_stats: Dict[str, int] = {}
+
+        # Lays out each turn's prompt within CHAT_CONTEXT_TOKEN_BUDGET; one report per turn
+        self.context_assembler = ContextAssembler()
+        self.prompt_token_stats: deque = deque(maxlen=1000)
+
+        # Summaries run on the background job runner, never on the chat request path
+        job_runner.register("daily_summary", self._run_daily_summary_job)
+        job_runner.register("user_summary", self._run_user_summary_job)
+
+    async def _build_user_context(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> str:
         """Build comprehensive user context from profile, summaries, and recent history"""
-        user = await MongoDB.get_user(user_id)
+        snapshot = snapshot or UserSnapshot(user_id)
+        user = await snapshot.load()
         if not user:
             return "I apologize, but I'm having trouble processing your request right now. Please try again later."
 
+        # Materialized in Mongo and rebuilt on profile/summary writes, so this is one read
+        context = await MongoDB.get_user_context(user_id, user)
+        return context["profile"] + render_memory(context["journey"], context["daily"])
+
     async def generate_workout_plan(self, user_id: str) -> Dict:
-        """Generate a personalized workout plan"""
-        context = await self._build_user_context(user_id)
+        """Generate a personalized workout plan, reusing the cached one while the relevant profile is unchanged"""
+        snapshot = UserSnapshot(user_id)
+        user = await snapshot.load()
+        fingerprint = plan_fingerprint("workout", user) if user else None
+        if fingerprint:
+            try:
+                cached_plan = await MongoDB.get_cached_plan(user_id, "workout", fingerprint)
+                if cached_plan:
+                    return cached_plan
+            except Exception as e:
+                logger.error("Error reading plan cache: %s", e)
+        
+        context = await self._build_user_context(user_id, snapshot)
         
         messages = [
             {"role": "system", "content": self.system_prompt},
@@ -79,8 +119,9 @@ CONVERSATION STYLE:
         ]
 
         try:
-            response = await openai.ChatCompletion.acreate(
+            response = await llm_client.complete(
                 model="gpt-4.1-nano",
+                call_site="workout_plan",
                 messages=messages,
                 temperature=0.7,
                 max_tokens=1000
@@ -93,15 +134,32 @@ CONVERSATION STYLE:
                 "personalization_notes": f"Generated based on user profile completion and current fitness level"
             }
             
+            if fingerprint:
+                try:
+                    await MongoDB.save_cached_plan(user_id, "workout", fingerprint, workout_plan)
+                except Exception as e:
+                    logger.error("Error writing plan cache: %s", e)
+            
             return workout_plan
             
         except Exception as e:
-            print(f"Error generating workout plan: {str(e)}")
+            logger.error("Error generating workout plan: %s", e, extra={"user_id": user_id})
             return None
 
     async def generate_diet_plan(self, user_id: str) -> Dict:
-        """Generate a personalized diet plan"""
-        context = await self._build_user_context(user_id)
+        """Generate a personalized diet plan, reusing the cached one while the relevant profile is unchanged"""
+        snapshot = UserSnapshot(user_id)
+        user = await snapshot.load()
+        fingerprint = plan_fingerprint("diet", user) if user else None
+        if fingerprint:
+            try:
+                cached_plan = await MongoDB.get_cached_plan(user_id, "diet", fingerprint)
+                if cached_plan:
+                    return cached_plan
+            except Exception as e:
+                logger.error("Error reading plan cache: %s", e)
+        
+        context = await self._build_user_context(user_id, snapshot)
         
         messages = [
             {"role": "system", "content": self.system_prompt},
@@ -110,8 +168,9 @@ CONVERSATION STYLE:
         ]
 
         try:
-            response = await openai.ChatCompletion.acreate(
+            response = await llm_client.complete(
                 model="gpt-4.1-nano",
+                call_site="diet_plan",
                 messages=messages,
                 temperature=0.7,
                 max_tokens=1000
@@ -124,113 +183,28 @@ CONVERSATION STYLE:
                 "personalization_notes": f"Generated based on user dietary restrictions and fitness goals"
             }
             
+            if fingerprint:
+                try:
+                    await MongoDB.save_cached_plan(user_id, "diet", fingerprint, diet_plan)
+                except Exception as e:
+                    logger.error("Error writing plan cache: %s", e)
+            
             return diet_plan
             
         except Exception as e:
-            print(f"Error generating diet plan: {str(e)}")
-            return None 
-
-        context = "=== USER PROFILE ===\n"
-        
-        # Basic Demographics
-        if user.get('name'):
-            context += f"Name: {user['name']}\n"
-        if user.get('age'):
-            context += f"Age: {user['age']}\n"
-        if user.get('gender'):
-            context += f"Gender: {user['gender']}\n"
-        if user.get('location'):
-            context += f"Location: {user['location']}\n"
-
-        # Physical Metrics
-        if user.get('height') or user.get('weight'):
-            context += "\nPhysical Metrics:\n"
-            if user.get('height'):
-                context += f"Height: {user['height']}cm\n"
-            if user.get('weight'):
-                context += f"Weight: {user['weight']}kg\n"
-            if user.get('target_weight'):
-                context += f"Target Weight: {user['target_weight']}kg\n"
-
-        # Fitness & Activity
-        if user.get('fitness_goals'):
-            context += f"\nFitness Goals: {', '.join(user['fitness_goals'])}\n"
-        if user.get('activity_level'):
-            context += f"Activity Level: {user['activity_level']}\n"
-        if user.get('workout_frequency'):
-            context += f"Workout Frequency: {user['workout_frequency']} times/week\n"
-
-        # Health Considerations
-        health_info = []
-        if user.get('medical_conditions'):
-            health_info.append(f"Medical Conditions: {', '.join(user['medical_conditions'])}")
-        if user.get('injuries'):
-            health_info.append(f"Injuries: {', '.join(user['injuries'])}")
-        if user.get('medications'):
-            health_info.append(f"Medications: {', '.join(user['medications'])}")
-        if health_info:
-            context += f"\nHealth Considerations:\n" + "\n".join(health_info) + "\n"
-
-        # Lifestyle
-        lifestyle_info = []
-        if user.get('sleep_hours'):
-            lifestyle_info.append(f"Sleep: {user['sleep_hours']} hours/night")
-        if user.get('stress_level'):
-            lifestyle_info.append(f"Stress Level: {user['stress_level']}")
-        if user.get('occupation'):
-            lifestyle_info.append(f"Occupation: {user['occupation']}")
-        if lifestyle_info:
-            context += f"\nLifestyle:\n" + "\n".join(lifestyle_info) + "\n"
-
-        # Diet & Nutrition
-        if user.get('dietary_restrictions') or user.get('food_allergies'):
-            context += "\nNutrition:\n"
-            if user.get('dietary_restrictions'):
-                context += f"Dietary Restrictions: {', '.join(user['dietary_restrictions'])}\n"
-            if user.get('food_allergies'):
-                context += f"Food Allergies: {', '.join(user['food_allergies'])}\n"
-
-        # Equipment & Preferences
-        if user.get('available_equipment') or user.get('gym_access') is not None:
-            context += "\nFitness Resources:\n"
-            if user.get('available_equipment'):
-                context += f"Equipment: {', '.join(user['available_equipment'])}\n"
-            if user.get('gym_access') is not None:
-                context += f"Gym Access: {'Yes' if user['gym_access'] else 'No'}\n"
-
-        # Profile completion status
-        completion = user.get('profile_completion', 0)
-        context += f"\nProfile Completion: {completion:.0f}%\n"
+            logger.error("Error generating diet plan: %s", e, extra={"user_id": user_id})
+            return None
 
-        # Get user summary (long-term memory)
-        user_summary = await MongoDB.get_user_summary(user_id)
-        if user_summary:
-            context += f"\n=== USER JOURNEY SUMMARY ===\n"
-            context += f"{user_summary.get('overall_summary', '')}\n"
-            if user_summary.get('recent_patterns'):
-                context += f"\nRecent Patterns: {user_summary['recent_patterns']}\n"
-            if user_summary.get('goals_progress'):
-                context += f"Goals Progress: {user_summary['goals_progress']}\n"
-
-        # Get recent daily summaries
-        recent_summaries = await MongoDB.get_recent_daily_summaries(user_id, days=7)
-        if recent_summaries:
-            context += f"\n=== RECENT DAILY SUMMARIES ===\n"
-            for summary in recent_summaries[-3:]:  # Last 3 days
-                date_str = summary['date'].strftime('%Y-%m-%d')
-                context += f"{date_str}: {summary['summary_text']}\n"
-
-        return context
-
-    async def _identify_missing_data(self, user_id: str) -> Optional[str]:
+    async def _identify_missing_data(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> Optional[str]:
         """Identify the next most important piece of missing user data"""
-        incomplete_fields = await MongoDB.get_incomplete_profile_fields(user_id)
+        snapshot = snapshot or UserSnapshot(user_id)
+        user = await snapshot.load()
+        incomplete_fields = await MongoDB.get_incomplete_profile_fields(user_id, user=user)
         
         if not incomplete_fields:
             return None
 
         # Return a natural question for the highest priority missing field
-        user = await MongoDB.get_user(user_id)
         profile_completion = user.get('profile_completion', 0)
 
         # Early stage questions (0-30% complete)
@@ -267,27 +241,43 @@ CONVERSATION STYLE:
         try:
             # Get last few messages
             recent_history = await MongoDB.get_user_chat_history(user_id, limit=5, days_back=1)
-            
-            # Look for the last assistant message that contained a question
-            for msg in reversed(recent_history):
-                if msg['role'] == 'assistant' and ('?' in msg['content'] or any(keyword in msg['content'].lower() for keyword in ['tell me', 'what', 'how', 'could you', 'share', 'rate'])):
-                    return msg['content']
-            
-            return None
+            return self._last_bot_question_in(recent_history)
         except Exception as e:
-            print(f"Error getting last bot question: {e}")
+            logger.error("Error getting last bot question: %s", e)
             return None
 
+    def _last_bot_question_in(self, history: List[Dict[str, Any]]) -> Optional[str]:
+        """Find the last bot question within the last 5 messages of the past day of `history`"""
+        cutoff = datetime.utcnow() - timedelta(days=1)
+        recent_history = [
+            msg for msg in history[-5:]
+            if not isinstance(msg.get('timestamp'), datetime) or msg['timestamp'] >= cutoff
+        ]
+        
+        # Look for the last assistant message that contained a question
+        for msg in reversed(recent_history):
+            if msg['role'] == 'assistant' and ('?' in msg['content'] or any(keyword in msg['content'].lower() for keyword in ['tell me', 'what', 'how', 'could you', 'share', 'rate'])):
+                return msg['content']
+        
+        return None
+
     async def _extract_user_data_with_ai(self, user_message: str, last_question: str, current_user_data: Dict) -> Dict[str, Any]:
         """🔥 REVOLUTIONARY: Use AI to intelligently extract user data based on context and meaning"""
         try:
+            # Only the fields the extractor can fill; the rest of the user document is noise
+            known_fields = {
+                field: current_user_data[field]
+                for field in EXTRACTABLE_FIELDS
+                if current_user_data.get(field) not in (None, [], "")
+            }
+            
             # Create context for AI extraction
             extraction_prompt = f"""You are a data extraction AI that analyzes fitness conversations to extract structured user information.
 
 CONTEXT:
 - Last bot question: "{last_question}"
 - User's response: "{user_message}"
-- Current user data: {json.dumps(current_user_data, default=str)}
+- Current user data: {json.dumps(known_fields, default=str)}
 
 EXTRACTION RULES:
 1. Extract data based on MEANING and CONTEXT, not just keywords
@@ -318,8 +308,9 @@ OUTPUT FORMAT: Return ONLY a JSON object with extracted fields. If nothing can b
 
 ANALYZE: {user_message}"""
 
-            response = await openai.ChatCompletion.acreate(
+            response = await llm_client.complete(
                 model="gpt-4.1-nano",
+                call_site="extraction",
                 messages=[{"role": "user", "content": extraction_prompt}],
                 temperature=0.1,
                 max_tokens=200
@@ -341,16 +332,16 @@ ANALYZE: {user_message}"""
                 validated_data = self._validate_extracted_data(extracted_data)
                 
                 if validated_data:
-                    print(f"🤖 AI extracted: {validated_data}")
+                    logger.debug("AI extracted profile fields", extra={"fields": sorted(validated_data)})
                 
                 return validated_data
                 
             except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}, Raw response: {ai_response}")
+                logger.warning("Extractor returned invalid JSON (%d chars): %s", len(ai_response), e)
                 return {}
                 
         except Exception as e:
-            print(f"Error in AI extraction: {e}")
+            logger.error("Error in AI extraction: %s", e)
             return {}
 
     def _validate_extracted_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -442,18 +433,28 @@ ANALYZE: {user_message}"""
 
     async def _extract_user_data(self, user_message: str, current_user_data: Dict, user_id: str) -> Dict[str, Any]:
         """🔥 ENHANCED: Smart AI-powered data extraction"""
-        extracted_data = {}
-        
         # Get context from last bot question
         last_question = await self._get_last_bot_question(user_id)
+        return await self._extract_user_data_for_question(user_message, current_user_data, last_question)
+
+    async def _extract_user_data_for_question(self, user_message: str, current_user_data: Dict, last_question: Optional[str]) -> Dict[str, Any]:
+        """Extract profile data from a message, given the bot question it answers (if any)"""
+        extracted_data = {}
         
-        if last_question:
-            # 🔥 NEW: Use AI for intelligent extraction
-            ai_extracted = await self._extract_user_data_with_ai(user_message, last_question, current_user_data)
-            extracted_data.update(ai_extracted)
+        # Local parsing for explicit statements; often enough to skip the LLM entirely
+        basic_extracted = self._extract_explicit_data(user_message, current_user_data)
         
-        # Fallback to basic pattern matching for explicit statements
-        basic_extracted = self._extract_explicit_data(user_message.lower(), current_user_data)
+        if last_question:
+            # Only pay for the LLM round trip when the message can plausibly carry profile data
+            decision = should_extract(user_message, last_question, missing_profile_fields(current_user_data))
+            reason = decision.reason
+            if decision.extract and decision.target_field in basic_extracted:
+                reason = "parsed_locally"  # The answer to the question was already parsed
+            self.extraction_gate_stats[reason] = self.extraction_gate_stats.get(reason, 0) + 1
+            if decision.extract and reason != "parsed_locally":
+                # 🔥 NEW: Use AI for intelligent extraction
+                ai_extracted = await self._extract_user_data_with_ai(user_message, last_question, current_user_data)
+                extracted_data.update(ai_extracted)
         
         # Merge data (AI extraction takes priority)
         for key, value in basic_extracted.items():
@@ -462,97 +463,30 @@ ANALYZE: {user_message}"""
         
         return extracted_data
 
-    def _extract_explicit_data(self, message_lower: str, current_user_data: Dict) -> Dict[str, Any]:
-        """Basic pattern matching for explicit statements"""
-        extracted_data = {}
-
-        # Name extraction
-        name_patterns = [
-            r"(?:my name is|i'm|i am|call me)\s+([A-Za-z\s]+)",
-            r"name\s*:?\s*([A-Za-z\s]+)"
-        ]
-        for pattern in name_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                name = match.group(1).strip().title()
-                if 1 < len(name) < 50:
-                    extracted_data['name'] = name
-                break
-
-        # Age extraction (explicit)
-        age_patterns = [
-            r"\b(\d{1,2})\s*(?:years?\s*old|y/?o)\b",
-            r"\bi'?m\s*(\d{1,2})\b",
-            r"\bage\s*:?\s*(\d{1,2})\b"
-        ]
-        for pattern in age_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                age = int(match.group(1))
-                if 13 <= age <= 100:
-                    extracted_data['age'] = age
-                break
-
-        # Weight extraction (explicit with units)
-        weight_patterns = [
-            r"(\d+\.?\d*)\s*(?:kg|kilograms?)\b",
-            r"(\d+\.?\d*)\s*(?:lbs?|pounds?)\b",
-            r"weigh\s*(\d+\.?\d*)"
-        ]
-        for pattern in weight_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                weight = float(match.group(1))
-                if "lb" in pattern or "pound" in pattern:
-                    weight *= 0.453592
-                if 30 <= weight <= 300:
-                    extracted_data['weight'] = round(weight, 1)
-                break
-
-        # Height extraction (explicit with units)
-        height_patterns = [
-            r"(\d+)\s*(?:cm|centimeters?)\b",
-            r"(\d+\.?\d*)\s*(?:m|meters?)\b",
-            r"(\d+)\s*feet?\s*(\d+)\s*inch",
-            r"(\d+)'(\d+)"
-        ]
-        for pattern in height_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                if "feet" in pattern or "'" in pattern:
-                    feet = int(match.group(1))
-                    inches = int(match.group(2)) if match.group(2) else 0
-                    height_cm = (feet * 12 + inches) * 2.54
-                elif "m" in pattern and "cm" not in pattern:
-                    height_cm = float(match.group(1)) * 100
-                else:
-                    height_cm = float(match.group(1))
-                
-                if 100 <= height_cm <= 250:
-                    extracted_data['height'] = round(height_cm)
-                break
-
-        return extracted_data
+    def _extract_explicit_data(self, message: str, current_user_data: Dict) -> Dict[str, Any]:
+        """Unit-aware pattern matching for explicit statements (single compiled pass, see fact_parser)"""
+        return parse_facts(message)
 
-    async def _update_user_profile(self, user_id: str, extracted_data: Dict[str, Any]):
+    async def _update_user_profile(self, user_id: str, extracted_data: Dict[str, Any], current_user: Optional[Dict[str, Any]] = None):
         """Update user profile with extracted data"""
         if extracted_data:
-            success = await MongoDB.update_user_profile(user_id, extracted_data)
+            success = await MongoDB.update_user_profile(user_id, dict(extracted_data), current_user=current_user)
             if success:
-                print(f"Updated user profile: {extracted_data}")
+                logger.info("Updated user profile", extra={"user_id": user_id, "fields": sorted(extracted_data)})
                 return True
         return False
 
-    async def _should_collect_data(self, user_id: str) -> bool:
+    async def _should_collect_data(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> bool:
         """Determine if we should focus on data collection"""
-        user = await MongoDB.get_user(user_id)
+        snapshot = snapshot or UserSnapshot(user_id)
+        user = await snapshot.load()
         if not user:
             return True
         
         completion = user.get('profile_completion', 0)
         return completion < 70  # Collect data until 70% complete
 
-    async def _create_daily_summary(self, user_id: str):
+    async def _create_daily_summary(self, user_id: str, snapshot: Optional[UserSnapshot] = None):
         """Create daily summary at end of day"""
         today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
         
@@ -567,7 +501,7 @@ ANALYZE: {user_message}"""
             return  # No conversations today
 
         # Get user context for personalization
-        user_context = await self._build_user_context(user_id)
+        user_context = await self._build_user_context(user_id, snapshot)
         
         # Prepare conversation text for AI summarization
         conversation_text = ""
@@ -577,8 +511,9 @@ ANALYZE: {user_message}"""
 
         # Generate summary using AI
         try:
-            response = await openai.ChatCompletion.acreate(
+            response = await llm_client.complete(
                 model="gpt-4.1-nano",
+                call_site="daily_summary",
                 messages=[
                     {
                         "role": "system",
@@ -629,12 +564,13 @@ Write in 2nd person (you did, you mentioned, etc.)."""
             }
 
             await MongoDB.save_daily_summary(user_id, summary_data)
-            print(f"Created daily summary for user {user_id}")
+            logger.info("Created daily summary", extra={"user_id": user_id})
 
         except Exception as e:
-            print(f"Error creating daily summary: {e}")
+            logger.error("Error creating daily summary: %s", e, extra={"user_id": user_id})
+            raise  # Let the job runner retry
 
-    async def _update_user_summary(self, user_id: str):
+    async def _update_user_summary(self, user_id: str, snapshot: Optional[UserSnapshot] = None):
         """Update overall user summary weekly"""
         user_summary = await MongoDB.get_user_summary(user_id)
         last_update = user_summary.get('last_updated') if user_summary else None
@@ -650,7 +586,7 @@ Write in 2nd person (you did, you mentioned, etc.)."""
 
         # Get recent daily summaries and user context
         recent_summaries = await MongoDB.get_recent_daily_summaries(user_id, days=14)
-        user_context = await self._build_user_context(user_id)
+        user_context = await self._build_user_context(user_id, snapshot)
         
         # Prepare data for AI summarization
         summaries_text = ""
@@ -659,8 +595,9 @@ Write in 2nd person (you did, you mentioned, etc.)."""
             summaries_text += f"{date_str}: {summary['summary_text']}\n"
 
         try:
-            response = await openai.ChatCompletion.acreate(
+            response = await llm_client.complete(
                 model="gpt-4.1-nano",
+                call_site="user_summary",
                 messages=[
                     {
                         "role": "system",
@@ -702,100 +639,263 @@ This summary helps maintain continuity across conversations. Write in 3rd person
             }
 
             await MongoDB.save_user_summary(user_id, summary_data)
-            print(f"Updated user summary for user {user_id}")
+            logger.info("Updated user summary", extra={"user_id": user_id})
 
         except Exception as e:
-            print(f"Error updating user summary: {e}")
+            logger.error("Error updating user summary: %s", e, extra={"user_id": user_id})
+            raise  # Let the job runner retry
+
+    async def _run_daily_summary_job(self, user_id: str, payload: Dict[str, Any]):
+        await self._create_daily_summary(user_id)
+
+    async def _run_user_summary_job(self, user_id: str, payload: Dict[str, Any]):
+        await self._update_user_summary(user_id)
+
+    def _record_stage_timing(self, stage: str, seconds: float):
+        self.stage_timings[stage].append(seconds)
+        CHAT_STAGE_SECONDS.labels(stage).observe(seconds)
+
+    def _record_prompt_tokens(self, report: PromptReport):
+        self.prompt_token_stats.append(report)
+        CHAT_PROMPT_TOKENS.observe(report.tokens_after)
+        if report.tokens_after < report.tokens_before:
+            logger.info("Prompt trimmed to budget %d: %d -> %d tokens, dropped %s", report.budget, report.tokens_before, report.tokens_after, report.dropped)
+
+    def _turn_graph(self, user_id: str, user_message: str, sequential: bool = False) -> StageGraph:
+        """Express everything a chat turn needs before the main completion as a stage graph.
+
+        Stages and what they wait for:
+            user, history               -> nothing, so they load concurrently
+            stored_context              -> user (the materialized context, checked against its version)
+            last_question               -> history
+            extract                     -> user, last_question
+            profile                     -> extract (merges it into the snapshot in memory)
+            persist_profile             -> profile (the Mongo write, off the prompt's path)
+            context                     -> profile, stored_context (re-rendered only if extract changed it)
+            collect                     -> profile
+            messages                    -> context, stored_context, collect, history (token-budgeted)
+        """
+        snapshot = UserSnapshot(user_id)
+        graph = StageGraph(sequential=sequential, on_stage_done=self._record_stage_timing)
+
+        async def load_user(_):
+            user = await snapshot.load()
+            return dict(user) if user else {}
+
+        async def load_history(_):
+            # 🔥 THE MEMORY FIX: last 12 messages to avoid token limits; also used to find the last question
+            try:
+                return await MongoDB.get_user_chat_history(user_id, limit=12, days_back=7)
+            except Exception as e:
+                logger.error("Error loading chat history: %s", e, extra={"user_id": user_id})
+                return []  # Continue without history if there's an error
+
+        async def find_last_question(results):
+            return self._last_bot_question_in(results["history"])
+
+        async def load_stored_context(results):
+            if not results["user"]:
+                return {"profile": "", "journey": [], "daily": []}
+            return await MongoDB.get_user_context(user_id, results["user"])
+
+        async def extract(results):
+            # 🔥 REVOLUTIONARY: AI-powered data extraction
+            return await self._extract_user_data_for_question(user_message, results["user"], results["last_question"])
+
+        async def merge_profile(results):
+            before = results["user"]
+            if results["extract"] and snapshot.user is not None:
+                merged = {**before, **results["extract"]}
+                snapshot.apply({**results["extract"], **MongoDB.profile_completion_fields(merged)})
+            return before
+
+        async def persist_profile(results):
+            # Update profile if new data found
+            if results["extract"]:
+                await self._update_user_profile(user_id, results["extract"], current_user=results["profile"])
+
+        async def build_context(results):
+            if not snapshot.user:
+                return "I apologize, but I'm having trouble processing your request right now. Please try again later."
+            if results["extract"]:
+                # This turn changed the profile; the stored copy is rebuilt behind persist_profile
+                return render_profile(snapshot.user)
+            return results["stored_context"]["profile"]
+
+        async def collect(_):
+            # Check if we should focus on data collection
+            if await self._should_collect_data(user_id, snapshot):
+                return await self._identify_missing_data(user_id, snapshot)
+            return None
 
-    async def generate_response(self, user_id: str, user_message: str) -> str:
-        """Generate AI response with data collection and memory management"""
-        
-        # Get current user data
-        user = await MongoDB.get_user(user_id)
-        current_user_data = user if user else {}
-        
-        # 🔥 REVOLUTIONARY: AI-powered data extraction
-        extracted_data = await self._extract_user_data(user_message, current_user_data, user_id)
-        
-        # Update profile if new data found
-        if extracted_data:
-            await self._update_user_profile(user_id, extracted_data)
-        
-        # Build comprehensive context
-        context = await self._build_user_context(user_id)
-        
-        # Check if we should focus on data collection
-        should_collect = await self._should_collect_data(user_id)
-        missing_data_question = None
-        if should_collect:
-            missing_data_question = await self._identify_missing_data(user_id)
-        
-        # Prepare AI messages
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "system", "content": f"User Context:\n{context}"}
-        ]
+        async def build_messages(results):
+            # Add data collection guidance if needed
+            guidance = None
+            missing_data_question = results["collect"]
+            if missing_data_question and len(user_message.split()) < 10:
+                guidance = f"After responding to the user's message, naturally ask this important question: {missing_data_question}"
+
+            # Stable parts first (system prompt, profile) so the provider's prompt cache hits
+            messages, report = self.context_assembler.assemble(
+                system_prompt=self.system_prompt,
+                profile=results["context"],
+                user_message=user_message,
+                journey=results["stored_context"]["journey"],
+                daily=results["stored_context"]["daily"],
+                history=results["history"],
+                guidance=guidance
+            )
+            self._record_prompt_tokens(report)
+            return messages
+
+        graph.add("user", load_user)
+        graph.add("history", load_history)
+        graph.add("stored_context", load_stored_context, ["user"])
+        graph.add("last_question", find_last_question, ["history"])
+        graph.add("extract", extract, ["user", "last_question"])
+        graph.add("profile", merge_profile, ["user", "extract"])
+        graph.add("persist_profile", persist_profile, ["extract", "profile"])
+        graph.add("context", build_context, ["profile", "extract", "stored_context"])
+        graph.add("collect", collect, ["profile"])
+        graph.add("messages", build_messages, ["context", "stored_context", "collect", "history"])
+        return graph
+
+    async def _finish_turn(self, user_id: str, user_message: str, assistant_message: str, extracted_data: Dict[str, Any], interrupted: bool = False):
+        """Persist both sides of a finished turn and enqueue summary jobs"""
+        await MongoDB.save_chat_message(user_id, {
+            "role": "user",
+            "content": user_message,
+            "extracted_data": extracted_data
+        })
+        
+        assistant_record = {
+            "role": "assistant",
+            "content": assistant_message
+        }
+        if interrupted:
+            # The client disconnected mid-stream; keep what it was actually sent
+            assistant_record["interrupted"] = True
+        await MongoDB.save_chat_message(user_id, assistant_record)
         
-        # Add data collection guidance if needed
-        if missing_data_question and len(user_message.split()) < 10:
-            messages.append({
-                "role": "system", 
-                "content": f"After responding to the user's message, naturally ask this important question: {missing_data_question}"
-            })
+        if interrupted:
+            return
         
-        # 🔥 THE MEMORY FIX: Get and include recent chat history
+        # Queue summary work; at most one job per (user, day) is ever created
         try:
-            # Get recent conversation history (last 12 messages to avoid token limits)
-            recent_history = await MongoDB.get_user_chat_history(user_id, limit=12, days_back=7)
-            
-            # Add chat history to messages
-            for msg in recent_history:
-                if msg['role'] in ['user', 'assistant']:
-                    # Ensure proper role mapping for OpenAI
-                    role = 'assistant' if msg['role'] == 'assistant' else 'user'
-                    messages.append({
-                        "role": role,
-                        "content": msg['content']
-                    })
-                    
+            await job_runner.enqueue("daily_summary", user_id)
+            await job_runner.enqueue("user_summary", user_id)
         except Exception as e:
-            print(f"Error loading chat history: {e}")
-            # Continue without history if there's an error
-        
-        # Add the current user message last
-        messages.append({"role": "user", "content": user_message})
+            logger.error("Error enqueuing summary jobs: %s", e, extra={"user_id": user_id})
 
+    async def generate_response(self, user_id: str, user_message: str, sequential: bool = False) -> str:
+        """Generate AI response with data collection and memory management
+
+        One user's turns run one at a time across workers, and a duplicate of
+        a turn still in flight (a double tap, a client retry) gets that turn's
+        reply instead of paying for its own. The reply returns as soon as the
+        completion is done; the conversation is saved right after, before the
+        user's next turn starts.
+        """
         try:
-            response = await openai.ChatCompletion.acreate(
+            return await turn_coordinator.run(user_id, user_message, lambda: self._generate_turn(user_id, user_message, sequential))
+        except Exception as e:
+            logger.error("Error generating response: %s", e, extra={"user_id": user_id})
+            return
+
+    async def _generate_turn(self, user_id: str, user_message: str, sequential: bool = False) -> str:
+        graph = self._turn_graph(user_id, user_message, sequential=sequential)
+
+        async def complete(results):
+            response = await llm_client.complete(
                 model="gpt-4.1-nano",
-                messages=messages,
+                call_site="chat",
+                messages=results["messages"],
                 temperature=0.7,
                 max_tokens=600
             )
-            
-            assistant_message = response.choices[0].message.content
-            
+            return response.choices[0].message.content
+
+        async def save(results):
             # Save conversation
-            await MongoDB.save_chat_message(user_id, {
-                "role": "user",
-                "content": user_message,
-                "extracted_data": extracted_data
-            })
-            
-            await MongoDB.save_chat_message(user_id, {
-                "role": "assistant",
-                "content": assistant_message
-            })
+            await self._finish_turn(user_id, user_message, results["completion"], results["extract"])
+
+        graph.add("completion", complete, ["messages"])
+        graph.add("save", save, ["completion", "extract"])
+
+        try:
+            # The reply doesn't wait for persistence; the turn is held until it lands
+            results = await graph.run(targets=["completion"])
+            turn_coordinator.after_reply(self._finish_graph(graph, user_id))
+            return results["completion"]
             
-            # Trigger daily summary creation (runs async, doesn't block response)
+        except Exception as e:
+            logger.error("Error generating response: %s", e, extra={"user_id": user_id})
+            return
+
+    async def _finish_graph(self, graph: StageGraph, user_id: str):
+        try:
+            await graph.wait()
+        except Exception as e:
+            logger.error("Error saving turn: %s", e, extra={"user_id": user_id})
+
+    async def generate_response_stream(self, user_id: str, user_message: str) -> AsyncIterator[str]:
+        """Yield the assistant reply as text deltas while the model is still generating.
+
+        The finished message is persisted after the stream ends, without
+        holding up its end. If the consumer closes the generator early (client
+        disconnect), whatever was already sent is saved as an interrupted
+        message; the turn's task does that, so the cancellation can't cut the
+        write short.
+
+        The user's turn is held for the whole stream and until its message is
+        saved, so it is ordered with their other turns; streams are not shared
+        between duplicates.
+        """
+        async with turn_coordinator.streaming_turn(user_id) as turn_work:
+            graph = self._turn_graph(user_id, user_message)
+            results = await graph.run(targets=["messages"])
+            parts: List[str] = []
+            completed = False
+            stream = llm_client.stream(
+                model="gpt-4.1-nano",
+                call_site="chat",
+                messages=results["messages"],
+                temperature=0.7,
+                max_tokens=600
+            )
+
+            # Timed by hand under the stage names generate_response's graph uses
+            started = time.perf_counter()
             try:
-                await self._create_daily_summary(user_id)
-                await self._update_user_summary(user_id)
-            except Exception as e:
-                print(f"Background task error: {e}")
-            
-            return assistant_message
+                async for delta in stream:
+                    if not parts:
+                        self._record_stage_timing("first_token", time.perf_counter() - started)
+                    parts.append(delta)
+                    yield delta
+                completed = True
+                self._record_stage_timing("completion", time.perf_counter() - started)
             
+            finally:
+                assistant_message = "".join(parts)
+                if completed:
+                    # The stream ends now; the save runs after it, inside the turn
+                    turn_work.append(turn_coordinator.after_reply(self._finish_stream(graph, user_id, user_message, assistant_message)))
+                else:
+                    # Stop pulling tokens we will never send and release the LLM slot
+                    turn_work.append(turn_coordinator.after_reply(stream.aclose()))
+                    turn_work.append(turn_coordinator.after_reply(
+                        self._finish_interrupted_turn(graph, user_id, user_message, assistant_message)))
+
+    async def _finish_stream(self, graph: StageGraph, user_id: str, user_message: str, assistant_message: str):
+        await graph.wait()
+        saving = time.perf_counter()
+        await self._finish_turn(user_id, user_message, assistant_message, graph.results["extract"])
+        self._record_stage_timing("save", time.perf_counter() - saving)
+
+    async def _finish_interrupted_turn(self, graph: StageGraph, user_id: str, user_message: str, assistant_message: str):
+        try:
+            await graph.wait()
         except Exception as e:
-            print(f"Error generating response: {str(e)}")
-            return
\ No newline at end of file
+            logger.error("Error finishing interrupted turn: %s", e, extra={"user_id": user_id})
+        if assistant_message:
+            await self._finish_turn(user_id, user_message, assistant_message, graph.results.get("extract", {}), interrupted=True)
@@ -0,0 +1,141 @@
+import os
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from user_context import render_memory
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import tiktoken  # Optional: exact counts when installed, estimate otherwise
+except ImportError:
+    tiktoken = None
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000"))
+TOKENIZER_ENCODING = os.getenv("CHAT_TOKENIZER_ENCODING", "o200k_base")  # gpt-4.1 family
+
+# Chat formatting cost on top of the content: role and separators per
+# message, plus the tokens that prime the assistant's reply
+MESSAGE_OVERHEAD = 3
+REPLY_PRIMING = 3
+
+# History messages kept even when over budget, so the model still sees the
+# exchange the user is replying to
+MIN_HISTORY_MESSAGES = 2
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            logger.warning("Tokenizer %s unavailable, estimating token counts: %s", TOKENIZER_ENCODING, e)
+            return None
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Tokens in `text`; without tiktoken, a slight over-estimate from word pieces"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Short words and punctuation are one token each, long words split every ~6 chars
+    return sum(1 + len(piece) // 6 for piece in _PIECE.findall(text))
+
+def count_message_tokens(messages: Iterable[Dict[str, str]]) -> int:
+    return sum(MESSAGE_OVERHEAD + count_tokens(message["content"]) for message in messages) + REPLY_PRIMING
+
+class PromptReport(NamedTuple):
+    tokens_before: int  # Everything the turn had available, untrimmed
+    tokens_after: int  # What was actually sent
+    budget: int
+    dropped: Dict[str, int]  # Items removed per section
+
+class ContextAssembler:
+    """Lay out a turn's prompt within a token budget.
+
+    Messages go from most to least stable so the provider can reuse its
+    cached prefix across turns:
+
+        system prompt           static
+        user profile            changes only when the profile does
+        memory                  journey + daily summaries, changes ~daily
+        history                 slides every turn
+        collection guidance     per turn
+        current message
+
+    When the whole thing doesn't fit, sections are trimmed lowest priority
+    first: old history down to the last exchange, then daily summaries
+    (oldest first), then the journey summary's detail lines, then the rest
+    of the history. The system prompt, profile, guidance and the current
+    message are never trimmed.
+    """
+
+    def __init__(self, budget: Optional[int] = None):
+        self.budget = budget or CONTEXT_TOKEN_BUDGET
+
+    def assemble(
+        self,
+        system_prompt: str,
+        profile: str,
+        user_message: str,
+        journey: Optional[List[str]] = None,
+        daily: Optional[List[str]] = None,
+        history: Optional[List[Dict[str, Any]]] = None,
+        guidance: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, str]], PromptReport]:
+        journey = list(journey or [])
+        daily = list(daily or [])
+        turns = [
+            {"role": "assistant" if msg["role"] == "assistant" else "user", "content": msg["content"]}
+            for msg in (history or []) if msg["role"] in ("user", "assistant")
+        ]
+
+        tokens_before = count_message_tokens(self._layout(system_prompt, profile, user_message, journey, daily, turns, guidance))
+        dropped = {"history": 0, "daily_summaries": 0, "journey": 0}
+
+        # Count each trimmable item once; trimming subtracts instead of recounting
+        turn_tokens = [MESSAGE_OVERHEAD + count_tokens(turn["content"]) for turn in turns]
+        daily_tokens = [count_tokens(line) + 1 for line in daily]
+        journey_tokens = [count_tokens(line) + 1 for line in journey]
+        total = tokens_before
+
+        while total > self.budget and len(turns) > MIN_HISTORY_MESSAGES:
+            total -= turn_tokens.pop(0)
+            turns.pop(0)
+            dropped["history"] += 1
+        while total > self.budget and daily:
+            total -= daily_tokens.pop(0)
+            daily.pop(0)
+            dropped["daily_summaries"] += 1
+        while total > self.budget and len(journey) > 1:
+            total -= journey_tokens.pop()
+            journey.pop()
+            dropped["journey"] += 1
+        while total > self.budget and turns:
+            total -= turn_tokens.pop(0)
+            turns.pop(0)
+            dropped["history"] += 1
+
+        messages = self._layout(system_prompt, profile, user_message, journey, daily, turns, guidance)
+        report = PromptReport(tokens_before, count_message_tokens(messages), self.budget, dropped)
+        return messages, report
+
+    @staticmethod
+    def _layout(system_prompt, profile, user_message, journey, daily, turns, guidance) -> List[Dict[str, str]]:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": f"User Profile:\n{profile}"},
+        ]
+        memory = render_memory(journey, daily)
+        if memory:
+            messages.append({"role": "system", "content": f"Memory:{memory}"})
+        messages.extend(turns)
+        if guidance:
+            messages.append({"role": "system", "content": guidance})
+        messages.append({"role": "user", "content": user_message})
+        return messages
@@ -0,0 +1,170 @@
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from fact_parser import parse_facts
+
+# Fields the AI extractor knows how to fill, in the order it lists them
+EXTRACTABLE_FIELDS = [
+    "age", "weight", "height", "stress_level", "activity_level", "fitness_goals",
+    "workout_frequency", "sleep_hours", "gender", "name", "location",
+]
+
+# What a bot question is asking about, judged from its wording
+QUESTION_CUES = {
+    "age": re.compile(r"\bage\b|how old|birthday|years? young"),
+    "weight": re.compile(r"weigh|\bkg\b|\blbs?\b|scale"),
+    "height": re.compile(r"height|\btall\b|group.?pics|back row|middle.?row"),
+    "stress_level": re.compile(r"stress|mood scale|overwhelm"),
+    "activity_level": re.compile(r"activity level|how active|sedentary|desk job"),
+    "fitness_goals": re.compile(r"goal|bulk|shred|lose|gain|aiming|phase"),
+    "workout_frequency": re.compile(r"how often|days? (?:a|per) week|times? (?:a|per) week|how many days"),
+    "sleep_hours": re.compile(r"sleep|hours of rest|bed ?time"),
+    "gender": re.compile(r"gender|\bguy\b|\bgirl\b"),
+    "name": re.compile(r"your name|call you|who am i talking"),
+    "location": re.compile(r"city|where are you|where you at|location|region|based"),
+}
+
+# Evidence in the user's message that it carries a value for a field
+MESSAGE_CUES = {
+    "age": re.compile(r"\b\d{1,2}\s*(?:years?|yrs?|y/?o)\b|\bage\b|\bturn(?:ed|ing)?\s+\d{2}\b"),
+    "weight": re.compile(r"\d\s*(?:kg|kgs|kilos?|lbs?|pounds?|st|stone)\b|\bweigh"),
+    "height": re.compile(r"\d\s*(?:cm|m|ft|feet|foot|in|inch(?:es)?)\b|\d\s*'\s*\d|\btall\b|\bheight\b"),
+    "stress_level": re.compile(r"stress|\b(?:chill|calm|relaxed|overwhelmed|anxious|burn(?:ed|t) out)\b|\b\d{1,2}\s*/\s*10\b"),
+    "activity_level": re.compile(r"sedentary|desk|\bactive\b|couch|on my feet|athlete|\bgym\b|train(?:ing)?\b"),
+    "fitness_goals": re.compile(r"lose|losing|gain|bulk|shred|cut(?:ting)?\b|tone|strong|strength|endurance|stamina|flexib|fit(?:ter|ness)?\b|muscle|abs\b"),
+    "workout_frequency": re.compile(r"\d+\s*(?:x|times?|days?)\s*(?:a|per|/)?\s*(?:week|wk)|\b(?:once|twice|daily|every ?day)\b"),
+    "sleep_hours": re.compile(r"\d\s*(?:h|hrs?|hours?)\b|sleep"),
+    "gender": re.compile(r"\b(?:male|female|man|woman|guy|girl|dude|non.?binary|gender)\b"),
+    "name": re.compile(r"\bmy name\b|\bcall me\b|\bi'?m [a-z]+\b|\bname'?s\b"),
+    "location": re.compile(r"\bi live\b|\bfrom\b|\bbased in\b|\bliving in\b|\bin [a-z]+(?: [a-z]+)?$"),
+}
+
+NUMBER = re.compile(r"\d")
+WORD = re.compile(r"[a-z0-9']+")
+SELF_DISCLOSURE = re.compile(r"\b(?:i|i'm|im|i've|ive|my|me|mine)\b")
+
+# Replies that never carry profile data on their own
+FILLER = {
+    "ok", "okay", "k", "kk", "cool", "nice", "lol", "lmao", "haha", "hahaha", "thanks", "thank", "you",
+    "thx", "ty", "yes", "yeah", "yep", "yup", "no", "nope", "nah", "sure", "great", "awesome", "bet",
+    "sounds", "good", "gotcha", "alright", "hi", "hey", "hello", "bye", "wow", "omg", "fr", "facts",
+}
+
+QUESTION_STARTERS = ("what", "how", "why", "when", "where", "which", "who", "can", "could", "should",
+                     "would", "is", "are", "do", "does", "will", "any", "tips", "give", "tell me", "explain")
+
+class GateDecision(NamedTuple):
+    extract: bool
+    reason: str
+    target_field: Optional[str] = None
+
+def question_target(last_question: Optional[str]) -> Optional[str]:
+    """The profile field the bot's last question was fishing for, if any"""
+    if not last_question:
+        return None
+    question = last_question.lower()
+    for field, cue in QUESTION_CUES.items():
+        if cue.search(question):
+            return field
+    return None
+
+def missing_profile_fields(user: Dict[str, Any]) -> List[str]:
+    return [field for field in EXTRACTABLE_FIELDS if user.get(field) in (None, [], "")]
+
+def should_extract(user_message: str, last_question: Optional[str], missing_fields: Iterable[str]) -> GateDecision:
+    """Decide locally whether an LLM extraction round trip can find anything in this message.
+
+    The gate errs towards extracting: it only skips messages that are filler,
+    questions aimed at the bot, or statements with no cue for any field.
+    """
+    message = user_message.strip().lower()
+    words = WORD.findall(message)
+    if not words:
+        return GateDecision(False, "no_words")  # Emoji, punctuation or empty
+
+    target = question_target(last_question)
+    has_number = bool(NUMBER.search(message))
+
+    if all(word in FILLER for word in words) and not has_number:
+        return GateDecision(False, "filler", target)
+
+    asks_bot = message.endswith("?") or message.startswith(QUESTION_STARTERS)
+    if asks_bot and not SELF_DISCLOSURE.search(message):
+        return GateDecision(False, "question_to_bot", target)
+
+    # A short reply right after a targeted question is almost always the answer
+    if target and len(words) <= 8:
+        return GateDecision(True, "answers_question", target)
+
+    missing = set(missing_fields)
+    cued = [field for field, cue in MESSAGE_CUES.items() if cue.search(message)]
+    if target and target in cued:
+        return GateDecision(True, "target_cue", target)
+    if any(field in missing for field in cued):
+        return GateDecision(True, "missing_field_cue", target)
+    if has_number and cued:
+        return GateDecision(True, "numeric_cue", target)
+    if cued and SELF_DISCLOSURE.search(message):
+        return GateDecision(True, "self_disclosure", target)
+
+    return GateDecision(False, "no_cue", target)
+
+# Recorded (last bot question, user reply, whether the LLM extractor found anything)
+# pairs, used to report skip rate and accuracy: `python extraction_gate.py`
+RECORDED_SAMPLE = [
+    ("Could you tell me your age?", "22", True),
+    ("Could you tell me your age?", "lol", False),
+    ("Could you tell me your age?", "just turned 30 last week 🎉", True),
+    ("You more tall-at-the-back-of-group-pics or middle-row energy?", "back row fr, 6'2", True),
+    ("You more tall-at-the-back-of-group-pics or middle-row energy?", "middle row 😂", True),
+    ("You on that bulk, shred, or just-vibin' phase right now?", "shred for summer", True),
+    ("You on that bulk, shred, or just-vibin' phase right now?", "thanks 🔥", False),
+    ("How many hours of sleep do you typically get?", "like 6 on a good night", True),
+    ("How would you rate your current stress level? Low, moderate, high, or very high?", "honestly 8/10", True),
+    ("How would you rate your current stress level? Low, moderate, high, or very high?", "ok", False),
+    ("How many days per week would you like to work out?", "3x a week", True),
+    ("How many days per week would you like to work out?", "what split should I run if I only have dumbbells?", False),
+    ("What city or region are you in?", "I live in Pune", True),
+    ("Knees, shoulders, anything acting up like it's Monday?", "nah all good", False),
+    ("Knees, shoulders, anything acting up like it's Monday?", "can you give me a quick leg day for tomorrow?", False),
+    ("Mood scale: 1 to deadlifting your problems — where we at today?", "haha", False),
+    ("Mood scale: 1 to deadlifting your problems — where we at today?", "pretty stressed tbh, work is crazy", True),
+    ("Been racking plates for years or still figuring out which way the dumbbell curls?", "been lifting 3 years, gym 5 days a week", True),
+    ("Been racking plates for years or still figuring out which way the dumbbell curls?", "how do I fix my squat form? my knees cave in", False),
+    ("What are your main fitness goals?", "I want to lose like 5 kg and get stronger", True),
+    ("What are your main fitness goals?", "💪💪💪", False),
+    ("Could you share your current weight?", "82kg", True),
+    ("Could you share your current weight?", "why do you need that?", False),
+    ("What's your height?", "175 cm", True),
+    ("Any plans for the weekend?", "probably just chilling and watching movies with friends all day long", False),
+]
+
+def evaluate(sample=RECORDED_SAMPLE) -> Dict[str, float]:
+    """Skip rate and accuracy of the gate over recorded (question, reply, expected) triples.
+
+    Missed extractions (expected True, gate skipped) are counted separately
+    because they are the costly kind of error.
+    """
+    skipped = correct = missed = llm_calls = 0
+    for last_question, message, expected in sample:
+        decision = should_extract(message, last_question, EXTRACTABLE_FIELDS)
+        skipped += not decision.extract
+        # The chatbot also skips the LLM when the local parser already found the answer (given the message as typed)
+        llm_calls += decision.extract and decision.target_field not in parse_facts(message)
+        correct += decision.extract == expected
+        missed += expected and not decision.extract
+    total = len(sample)
+    return {
+        "samples": total,
+        "skip_rate": skipped / total,
+        "accuracy": correct / total,
+        "missed_extractions": missed,
+        "llm_call_rate": llm_calls / total,
+    }
+
+if __name__ == "__main__":
+    report = evaluate()
+    print(f"Samples: {report['samples']}")
+    print(f"Skip rate: {report['skip_rate']:.0%}")
+    print(f"Accuracy: {report['accuracy']:.0%}")
+    print(f"Missed extractions: {report['missed_extractions']}")
+    print(f"LLM extractor calls after local parsing: {report['llm_call_rate']:.0%}")
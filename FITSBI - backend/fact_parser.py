@@ -0,0 +1,363 @@
+import re
+from typing import Any, Callable, Dict, Optional
+
+# Unit conversions to the units the profile stores (kg, cm)
+LB_TO_KG = 0.453592
+STONE_TO_KG = 6.35029
+INCH_TO_CM = 2.54
+
+NUMBER_WORDS = {
+    "once": 1, "one": 1, "twice": 2, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+NUM = r"\d+(?:\.\d+)?"
+COUNT = r"\d{1,2}|one|two|three|four|five|six|seven"
+
+# One alternation, compiled once and scanned once per message. Each top-level
+# group names the fact it captures; finditer reports it as `lastgroup`
+# because the outer group is always the last one to close. Alternatives
+# that start earlier in the text win, and within one position the order
+# below decides, so the more specific phrasings come first.
+FACT_PATTERN = re.compile(r"""
+    (?P<target_weight>(?:(?:goal|target|dream)\s+is\s+to\s+weigh|\b(?:want(?:s|ed)?\s+to|wanna|would\s+like\s+to|trying\s+to|hop(?:e|ing)\s+to|aim(?:ing)?\s+to)\s+weigh|(?:goal|target|dream)\s*(?:weight)?\s*(?:is|of|:)?)\s*(?:about|around)?\s*(?P<tw_value>""" + NUM + r""")\s*(?P<tw_unit>kg|kgs|kilos?|kilograms?|lbs?|pounds?)?)
+  | (?P<goal_lose>\blos(?:e|ing)\s+(?:(?:some|a\s+bit\s+of|the)\s+)?(?:weight|fat|belly|(?:""" + NUM + r""")\s*(?:kg|kgs|kilos?|lbs?|pounds?))|\bfat\s*loss\b|\bshred(?:ding)?\b|\bcut(?:ting)?\s+(?:phase|season)|\bslim\s+down\b)
+  | (?P<goal_muscle>\b(?:build|gain|put\s+on|add)(?:ing)?\s+(?:some\s+)?(?:muscle|mass|size)|\bbulk(?:ing)?\b|\bget(?:ting)?\s+(?:bigger|jacked|swole|huge)|\bmuscle\s+gain)
+  | (?P<goal_strength>\bget(?:ting)?\s+stronger\b|\bstrength\b|\bpowerlift)
+  | (?P<goal_endurance>\bendurance\b|\bstamina\b|\b(?:half[- ])?marathon\b|\btriathlon\b|\b(?:5|10)k\s+(?:run|race)\b|\bcardio\s+fitness\b)
+  | (?P<goal_flexibility>\bflexib\w*|\bmobility\b|\bstretch(?:ing)?\s+more\b)
+  | (?P<goal_general>\bstay(?:ing)?\s+(?:fit|healthy|active)\b|\bget(?:ting)?\s+(?:fit|in\s+shape|healthier)\b|\bgeneral\s+fitness\b)
+  | (?P<height_ftin>(?<![\d.])(?P<hf_ft>[3-7])\s*(?:'|’|ft\b|feet\b|foot\b)\s*(?:(?P<hf_in>1[01]|\d)(?!\d)\s*(?:"|''|”|in\b|inch(?:es)?\b)?)?)
+  | (?P<height_cm>(?<![\d.])(?P<hc_value>\d{3}(?:\.\d)?)\s*(?:cm|cms|centimet(?:er|re)s?)\b)
+  | (?P<height_m>(?<![\d.])(?P<hm_value>[12]\.\d{1,2})\s*(?:m|meters?|metres?)\b)
+  | (?P<height_in>(?<![\d.])(?P<hi_value>\d{2})\s*(?:in|inches)\b\s*tall)
+  | (?P<weight_stone>(?<![\d.])(?P<ws_st>\d{1,2})\s*(?:st|stone)\b\s*(?:(?P<ws_lb>\d{1,2})\s*(?:lbs?|pounds?)?)?)
+  | (?P<weight_unit>(?<![\d.])(?P<wu_value>""" + NUM + r""")\s*(?P<wu_unit>kg|kgs|kilos?|kilograms?|lbs?|pounds?)\b)
+  | (?P<weight_verb>\bweigh(?:t|s|ing)?\s*(?:is|:|about|around|like)?\s*(?P<wv_value>""" + NUM + r""")\s*(?P<wv_unit>kg|kgs|kilos?|kilograms?|lbs?|pounds?)?)
+  | (?P<sleep_range>(?P<sr_low>\d{1,2}(?:\.\d)?)\s*(?:-|–|to)\s*(?P<sr_high>\d{1,2}(?:\.\d)?)\s*(?:h|hrs?|hours?)\b(?=[^.?!]{0,25}\bsleep)|\bsleep\w*[^.?!\d]{0,25}?(?P<sr_low2>\d{1,2}(?:\.\d)?)\s*(?:-|–|to)\s*(?P<sr_high2>\d{1,2}(?:\.\d)?))
+  | (?P<sleep_hours>(?P<sh_value>\d{1,2}(?:\.\d)?)\s*(?:h|hrs?|hours?)\b(?=[^.?!]{0,25}\bsleep)|\bsleep\w*[^.?!\d]{0,25}?(?P<sh_value2>\d{1,2}(?:\.\d)?)(?!\s*(?:/|out\s+of|x|times|days|am|pm|:)))
+  | (?P<workout_frequency>(?:(?:\b(?P<wf_count>""" + COUNT + r""")\s*(?:x|times?|days?|sessions?)|\b(?P<wf_word>once|twice))\s*(?:a|per|/|each|every)?\s*(?:week|wk)\b)|(?P<wf_daily>\b(?:train\w*|work(?:ing)?\s*out|workouts?|gym|exercis\w*|lift(?:ing)?|run(?:ning)?)\b[^.?!,]{0,20}?\b(?:every\s*day|daily)\b|\b(?:every\s*day|daily)\s+(?:workouts?|training|gym|exercise|runs?|lifting)\b))
+  | (?P<stress_scale>\bstress\w*[^.?!\d]{0,20}?(?P<ss_value>\d{1,2})\s*(?:/|out\s+of)\s*10\b|(?P<ss_value2>\d{1,2})\s*(?:/|out\s+of)\s*10[^.?!]{0,15}\bstress)
+  | (?P<stress_word>\bstress(?:ed)?(?:\s+level)?\s*(?:is|:|'s)?\s*(?:pretty|kinda|quite)?\s*(?P<sw_level>very\s+high|super\s+high|high|moderate|medium|mid|low)\b|(?P<sw_adverb>super|really|very|so|extremely|pretty|kinda|a\s+bit|not\s+(?:really|that|too)?)\s*stressed\b)
+  | (?P<activity>\bsedentary\b|\bdesk\s+job\b|\bcouch\s+potato\b|\b(?P<ac_degree>lightly|moderately|very|super|extremely|fairly|pretty)\s+active\b|\bathlete\b)
+  | (?P<age>(?<![\d.])(?P<ag_value>\d{2})\s*(?:years?\s*old|yrs?\s*old|y/?o|yo)\b|\bage\s*(?:is|:)?\s*(?P<ag_value2>\d{2})\b|\bi'?m\s+(?P<ag_value3>\d{2})\b(?!\s*(?:kg|kgs|kilos?|lbs?|pounds?|cm|%|/|x|times|hours?|hrs?|days?|weeks?|months?|min(?:ute)?s?\b|secs?\b|seconds?|miles?|mi\b|km\b|away|from|st\b|stone|'))|\bturn(?:ed|ing)\s+(?P<ag_value4>\d{2})\b)
+  | (?P<gender>\bi'?m\s+(?:a|an)\s+(?P<gd_value>male|female|man|woman|guy|girl|dude|non[- ]?binary)\b|\b(?:gender|sex)\s*(?:is|:)?\s*(?P<gd_value2>male|female|man|woman|non[- ]?binary|other))
+  | (?P<name>\b(?:my\s+name\s+is|my\s+name's|name's|call\s+me|name\s*:)\s+(?P<nm_value>[a-z][a-z'-]+(?:\s+[a-z][a-z'-]+)?))
+""", re.VERBOSE | re.IGNORECASE)
+
+GOAL_GROUPS = {
+    "goal_lose": "weight_loss",
+    "goal_muscle": "muscle_gain",
+    "goal_strength": "strength",
+    "goal_endurance": "endurance",
+    "goal_flexibility": "flexibility",
+    "goal_general": "general_fitness",
+}
+GENDERS = {"male": "male", "man": "male", "guy": "male", "dude": "male",
+           "female": "female", "woman": "female", "girl": "female", "other": "other"}
+STRESS_WORDS = {"low": "low", "moderate": "moderate", "medium": "moderate", "mid": "moderate",
+                "high": "high", "very high": "very_high", "super high": "very_high"}
+STRESS_ADVERBS = {"super": "very_high", "really": "very_high", "very": "very_high", "so": "very_high",
+                  "extremely": "very_high", "pretty": "high", "kinda": "moderate", "a bit": "moderate"}
+ACTIVITY_DEGREES = {"lightly": "lightly_active", "fairly": "moderately_active", "moderately": "moderately_active",
+                    "pretty": "very_active", "very": "very_active", "super": "extremely_active", "extremely": "extremely_active"}
+# Words that can follow "call me" / "my name is" without being a name
+LIFT_CONTEXT = re.compile(r"\b(?:bench\w*|squat\w*|deadlift\w*|lift\w*|press\w*|curl\w*|row\w*|pull\w*|push\w*|dumbbells?|barbell|kettlebell|plates?|sets?|reps?|pr|max)\b[^.?!]*$", re.IGNORECASE)
+# A fact stated about someone else ("my wife weighs 60kg") is not the user's
+THIRD_PARTY = re.compile(r"\b(?:my|his|her|their|our)\s+(?:wife|husband|son|daughter|kids?|child(?:ren)?|brother|sister|mom|mum|mother|dad|father|parents?|partner|girlfriend|boyfriend|gf|bf|friends?|roommate|coach|trainer|baby|dog|cat)\b[^.?!,;]*$", re.IGNORECASE)
+# Values the user no longer has: "used to weigh 100kg", "was 90kg last year". "now" and "but"
+# end the past clause, so "was 90kg last year, now 80kg" still yields 80
+PAST_CONTEXT = re.compile(r"\b(?:used\s+to|was|were|weighed|had\s+been|last\s+(?:year|month|week|summer|time)|ago|back\s+(?:in|then|when)|previously|in\s+(?:high\s+)?school|in\s+college)\b(?:(?!\b(?:now|currently|today|but)\b)[^.?!,;])*$", re.IGNORECASE)
+PAST_AFTER = re.compile(r"\s*(?:last\s+(?:year|month|week|summer)|(?:a|\w+)\s+(?:years?|months?|weeks?)\s+ago|back\s+then|before\b)", re.IGNORECASE)
+# "sleep around 11" is a bedtime, not a number of hours
+CLOCK_TIME_BEFORE = re.compile(r"\b(?:at|around|by|after|until|till|from|before|past)\s*(?:like\s+|about\s+)?$", re.IGNORECASE)
+# "want to weigh 70" without the phrasing target_weight catches ("want to eventually weigh 70") is still not the current weight
+WEIGHT_GOAL_CONTEXT = re.compile(r"\b(?:want\w*|wanna|goal|target|trying|hop(?:e|ing)|aim\w*|like\s+to|need\s+to|should)\b[^.?!,]*$", re.IGNORECASE)
+NOT_NAMES = {"tired", "bored", "good", "fine", "okay", "ok", "here", "back", "ready", "not", "just", "so", "very", "really",
+             "after", "later", "tomorrow", "when", "if", "before", "tonight", "asap", "anytime", "whenever"}
+
+def _number(text: Optional[str]) -> Optional[float]:
+    if text is None:
+        return None
+    text = text.lower()
+    return float(NUMBER_WORDS[text]) if text in NUMBER_WORDS else float(text)
+
+def _to_kg(value: float, unit: Optional[str]) -> float:
+    if unit and unit.lower().startswith(("lb", "pound")):
+        return value * LB_TO_KG
+    return value
+
+def _stress_from_scale(score: float) -> Optional[str]:
+    if not 0 <= score <= 10:
+        return None
+    if score <= 3:
+        return "low"
+    if score <= 6:
+        return "moderate"
+    if score <= 8:
+        return "high"
+    return "very_high"
+
+def _in_range(value: Optional[float], low: float, high: float) -> bool:
+    return value is not None and low <= value <= high
+
+# ---- One handler per top-level group: (match, facts) -> None ----
+def _target_weight(m, facts):
+    kg = _to_kg(float(m.group("tw_value")), m.group("tw_unit"))
+    if _in_range(kg, 30, 300):
+        facts.setdefault("target_weight", round(kg, 1))
+
+def _height_ftin(m, facts):
+    inches = int(m.group("hf_ft")) * 12 + int(m.group("hf_in") or 0)
+    cm = inches * INCH_TO_CM
+    if _in_range(cm, 100, 250):
+        facts.setdefault("height", round(cm))
+
+def _height_cm(m, facts):
+    cm = float(m.group("hc_value"))
+    if _in_range(cm, 100, 250):
+        facts.setdefault("height", round(cm))
+
+def _height_m(m, facts):
+    cm = float(m.group("hm_value")) * 100
+    if _in_range(cm, 100, 250):
+        facts.setdefault("height", round(cm))
+
+def _height_in(m, facts):
+    cm = int(m.group("hi_value")) * INCH_TO_CM
+    if _in_range(cm, 100, 250):
+        facts.setdefault("height", round(cm))
+
+def _weight_stone(m, facts):
+    kg = int(m.group("ws_st")) * STONE_TO_KG + int(m.group("ws_lb") or 0) * LB_TO_KG
+    if _in_range(kg, 30, 300):
+        facts["weight"] = round(kg, 1)
+
+def _weight_unit(m, facts):
+    # "benched 80kg" is a lift, not the user's body weight
+    if LIFT_CONTEXT.search(m.string, max(0, m.start() - 30), m.start()):
+        return
+    kg = _to_kg(float(m.group("wu_value")), m.group("wu_unit"))
+    if _in_range(kg, 30, 300):
+        facts["weight"] = round(kg, 1)
+
+def _weight_verb(m, facts):
+    if WEIGHT_GOAL_CONTEXT.search(m.string, max(0, m.start() - 30), m.start()):
+        return
+    kg = _to_kg(float(m.group("wv_value")), m.group("wv_unit"))  # No unit means kg
+    if _in_range(kg, 30, 300):
+        facts["weight"] = round(kg, 1)
+
+def _sleep_range(m, facts):
+    if m.group("sr_low2") and CLOCK_TIME_BEFORE.search(m.string, m.start(), m.start("sr_low2")):
+        return
+    low = float(m.group("sr_low") or m.group("sr_low2"))
+    high = float(m.group("sr_high") or m.group("sr_high2"))
+    hours = (low + high) / 2
+    if _in_range(hours, 3, 12):
+        facts.setdefault("sleep_hours", hours)
+
+def _sleep_hours(m, facts):
+    if m.group("sh_value2") and CLOCK_TIME_BEFORE.search(m.string, m.start(), m.start("sh_value2")):
+        return
+    hours = float(m.group("sh_value") or m.group("sh_value2"))
+    if _in_range(hours, 3, 12):
+        facts.setdefault("sleep_hours", hours)
+
+def _workout_frequency(m, facts):
+    count = 7 if m.group("wf_daily") else _number(m.group("wf_count") or m.group("wf_word"))
+    if _in_range(count, 0, 14):
+        facts.setdefault("workout_frequency", int(count))
+
+def _stress_scale(m, facts):
+    level = _stress_from_scale(float(m.group("ss_value") or m.group("ss_value2")))
+    if level:
+        facts.setdefault("stress_level", level)
+
+def _stress_word(m, facts):
+    if m.group("sw_level"):
+        level = STRESS_WORDS.get(" ".join(m.group("sw_level").lower().split()))
+    else:
+        adverb = " ".join(m.group("sw_adverb").lower().split())
+        level = "low" if adverb.startswith("not") else STRESS_ADVERBS.get(adverb)
+    if level:
+        facts.setdefault("stress_level", level)
+
+def _activity(m, facts):
+    degree = m.group("ac_degree")
+    text = m.group("activity").lower()
+    if degree:
+        level = ACTIVITY_DEGREES[degree.lower()]
+    elif "athlete" in text:
+        level = "extremely_active"
+    else:
+        level = "sedentary"
+    facts.setdefault("activity_level", level)
+
+def _age(m, facts):
+    value = m.group("ag_value") or m.group("ag_value2") or m.group("ag_value3") or m.group("ag_value4")
+    age = int(value)
+    if _in_range(age, 13, 100):
+        facts.setdefault("age", age)
+
+def _gender(m, facts):
+    value = (m.group("gd_value") or m.group("gd_value2")).lower()
+    facts.setdefault("gender", GENDERS.get(value, "other"))
+
+def _name(m, facts):
+    words = m.group("nm_value").split()
+    called = m.group("name").lower().startswith("call")
+    if words[0].lower() in NOT_NAMES:
+        return
+    if called and not words[0][0].isupper():  # "call me after work" is an instruction, "call me Sam" a name
+        return
+    if len(words) > 1 and (words[1].lower() in NOT_NAMES | {"and", "but", "im", "i'm", "i"} or called and not words[1][0].isupper()):
+        words = words[:1]
+    name = " ".join(words).title()
+    if 1 < len(name) < 50:
+        facts.setdefault("name", name)
+
+HANDLERS: Dict[str, Callable] = {
+    "target_weight": _target_weight,
+    "height_ftin": _height_ftin,
+    "height_cm": _height_cm,
+    "height_m": _height_m,
+    "height_in": _height_in,
+    "weight_stone": _weight_stone,
+    "weight_unit": _weight_unit,
+    "weight_verb": _weight_verb,
+    "sleep_range": _sleep_range,
+    "sleep_hours": _sleep_hours,
+    "workout_frequency": _workout_frequency,
+    "stress_scale": _stress_scale,
+    "stress_word": _stress_word,
+    "activity": _activity,
+    "age": _age,
+    "gender": _gender,
+    "name": _name,
+}
+
+def parse_facts(message: str) -> Dict[str, Any]:
+    """Extract every profile fact stated explicitly in `message` in a single regex pass.
+
+    Values come back in profile units (kg, cm, hours, sessions per week) and
+    already inside the ranges _validate_extracted_data accepts. When a field
+    is stated twice, the first mention wins, except weight, where the last
+    one is the most current; fitness goals accumulate. Facts about someone
+    else ("my son is 14") or the past ("used to weigh 100kg") are skipped.
+    Pass the message as typed: "call me" only takes a capitalised name.
+    """
+    facts: Dict[str, Any] = {}
+    goals = []
+    for m in FACT_PATTERN.finditer(message):
+        if THIRD_PARTY.search(message, max(0, m.start() - 40), m.start()):
+            continue
+        if PAST_CONTEXT.search(message, max(0, m.start() - 40), m.start()) or PAST_AFTER.match(message, m.end()):
+            continue
+        group = m.lastgroup
+        if group in GOAL_GROUPS:
+            if GOAL_GROUPS[group] not in goals:
+                goals.append(GOAL_GROUPS[group])
+        else:
+            HANDLERS[group](m, facts)
+    if goals:
+        facts["fitness_goals"] = goals
+    return facts
+
+# (message, expected facts) pairs used by `python fact_parser.py` to score accuracy
+CORPUS = [
+    ("i'm 24 years old", {"age": 24}),
+    ("im 31", {"age": 31}),
+    ("just turned 40", {"age": 40}),
+    ("age: 19", {"age": 19}),
+    ("i weigh 82kg", {"weight": 82.0}),
+    ("about 180 lbs right now", {"weight": 81.6}),
+    ("i'm 12 stone 4", {"weight": 78.0}),
+    ("my weight is 70.5", {"weight": 70.5}),
+    ("5'11", {"height": 180}),
+    ("i'm 6 ft 2 in", {"height": 188}),
+    ("175 cm", {"height": 175}),
+    ("1.82m tall", {"height": 182}),
+    ("5 foot 4", {"height": 163}),
+    ("i'm 6'0 and weigh 200 pounds", {"height": 183, "weight": 90.7}),
+    ("i sleep like 6 hours", {"sleep_hours": 6.0}),
+    ("usually 7-8 hours of sleep", {"sleep_hours": 7.5}),
+    ("I get about 5.5 hrs sleep on weeknights", {"sleep_hours": 5.5}),
+    ("i train 4x a week", {"workout_frequency": 4}),
+    ("gym twice a week", {"workout_frequency": 2}),
+    ("3 days per week", {"workout_frequency": 3}),
+    ("i run every day", {"workout_frequency": 7}),
+    ("stress is like 8/10", {"stress_level": "high"}),
+    ("stress level is low", {"stress_level": "low"}),
+    ("super stressed with exams", {"stress_level": "very_high"}),
+    ("not really stressed tbh", {"stress_level": "low"}),
+    ("desk job all day", {"activity_level": "sedentary"}),
+    ("i'm pretty active", {"activity_level": "very_active"}),
+    ("i'm a guy", {"gender": "male"}),
+    ("my name is alex", {"name": "Alex"}),
+    ("call me Sam", {"name": "Sam"}),
+    ("want to lose weight and get stronger", {"fitness_goals": ["weight_loss", "strength"]}),
+    ("bulking season", {"fitness_goals": ["muscle_gain"]}),
+    ("i want to lose 10 kg", {"fitness_goals": ["weight_loss"]}),
+    ("goal weight is 65kg", {"target_weight": 65.0}),
+    ("training for a marathon", {"fitness_goals": ["endurance"]}),
+    ("i'm tired", {}),
+    ("lol thanks 🔥", {}),
+    ("how many sets should i do for 3 exercises?", {}),
+    ("i did 100 pushups today", {}),
+    ("benched 80kg for 5 reps", {}),
+    ("i want to weigh 70kg", {"target_weight": 70.0}),
+    ("goal is to weigh 150 lbs", {"target_weight": 68.0}),
+    ("i'm in the gym daily", {"workout_frequency": 7}),
+    # Negatives: facts that look explicit but aren't the user's own
+    ("i drink 3 liters water every day", {}),
+    ("i'm 30 minutes from the gym", {}),
+    ("i'm 45 min away", {}),
+    ("my wife weighs 60kg", {}),
+    ("my son is 14 years old", {}),
+    ("call me after work", {}),
+    ("call me later", {}),
+    ("i want to eventually weigh 70", {}),
+    ("I used to weigh 100kg", {}),
+    ("i weighed 95kg two years ago", {}),
+    ("I sleep around 11", {}),
+    ("i go to sleep at 11 and wake at 7", {}),
+    # Only the current value of a changed weight
+    ("i was 90kg last year now 80kg", {"weight": 80.0}),
+    ("i'm 80kg now, was 90kg", {"weight": 80.0}),
+    ("i weigh 85kg, well 84kg this morning", {"weight": 84.0}),
+    ("i'm 25, 5'9, 150 lbs, trying to bulk", {"age": 25, "height": 175, "weight": 68.0, "fitness_goals": ["muscle_gain"]}),
+]
+
+def evaluate(corpus=CORPUS) -> Dict[str, float]:
+    """Exact-match accuracy per message and per expected field over `corpus`"""
+    exact = fields_total = fields_correct = 0
+    failures = []
+    for message, expected in corpus:
+        got = parse_facts(message)
+        exact += got == expected
+        if got != expected:
+            failures.append((message, expected, got))
+        for field, value in expected.items():
+            fields_total += 1
+            fields_correct += got.get(field) == value
+    return {
+        "messages": len(corpus),
+        "message_accuracy": exact / len(corpus),
+        "field_recall": fields_correct / fields_total if fields_total else 1.0,
+        "failures": failures,
+    }
+
+if __name__ == "__main__":
+    import timeit
+
+    report = evaluate()
+    print(f"Messages: {report['messages']}")
+    print(f"Exact-match accuracy: {report['message_accuracy']:.0%}")
+    print(f"Field recall: {report['field_recall']:.0%}")
+    for message, expected, got in report["failures"]:
+        print(f"  ✗ {message!r}: expected {expected}, got {got}")
+
+    messages = [message for message, _ in CORPUS]
+    runs = 200
+    seconds = timeit.timeit(lambda: [parse_facts(message) for message in messages], number=runs)
+    print(f"parse_facts: {seconds / (runs * len(messages)) * 1e6:.1f} µs/message")
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# A local OpenAI-compatible chat completions server for load tests, so runs
+# measure our code instead of the provider. Point the app at it with
+# OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "300"))  # Time to first token
+TOKENS_PER_SEC = float(os.getenv("FAKE_OPENAI_TOKENS_PER_SEC", "80"))  # Generation speed after the first token
+REPLY_TOKENS = int(os.getenv("FAKE_OPENAI_REPLY_TOKENS", "120"))  # Reply length, capped by the request's max_tokens
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))  # Share of requests answered with ERROR_STATUS instead
+ERROR_STATUS = int(os.getenv("FAKE_OPENAI_ERROR_STATUS", "429"))
+RETRY_AFTER = os.getenv("FAKE_OPENAI_RETRY_AFTER") or None  # Seconds sent as Retry-After with injected errors; unset sends none
+
+REPLY_WORDS = ("Great work staying consistent this week! Based on your goals I'd keep the three strength "
+               "sessions, add a short walk on rest days and aim for seven to eight hours of sleep. How did "
+               "your energy feel after yesterday's workout? ").split()
+
+app = FastAPI(title="Fake OpenAI")
+stats = {"requests": 0, "streams": 0, "completion_tokens": 0, "errors": 0}
+# Failure injection, changeable at runtime through POST /faults; `fail_next` fails that many requests outright
+faults = {"error_rate": ERROR_RATE, "status": ERROR_STATUS, "retry_after": RETRY_AFTER, "fail_next": 0}
+
+def reply_tokens(body: dict) -> list:
+    prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+    if "data extraction AI" in prompt:
+        # The profile extractor expects a bare JSON object back
+        return ['{"', 'sleep', '_hours', '":', ' 7', '}']
+    count = min(REPLY_TOKENS, body.get("max_tokens") or REPLY_TOKENS)
+    return [("" if i == 0 else " ") + REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(count)]
+
+def prompt_tokens(body: dict) -> int:
+    return sum(len(str(message.get("content", ""))) // 4 + 4 for message in body.get("messages", []))
+
+async def generate(tokens: list):
+    """Yield tokens paced like a real model: LATENCY_MS to the first one, then TOKENS_PER_SEC"""
+    await asyncio.sleep(LATENCY_MS / 1000)
+    interval = 1 / TOKENS_PER_SEC if TOKENS_PER_SEC > 0 else 0
+    started = time.monotonic()
+    for i, token in enumerate(tokens):
+        delay = started + i * interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield token
+
+def usage(body: dict, tokens: list) -> dict:
+    prompt = prompt_tokens(body)
+    return {"prompt_tokens": prompt, "completion_tokens": len(tokens), "total_tokens": prompt + len(tokens)}
+
+def injected_error() -> Optional[JSONResponse]:
+    """The error this request gets instead of a completion, if any"""
+    if faults["fail_next"] > 0:
+        faults["fail_next"] -= 1
+    elif not (faults["error_rate"] and random.random() < faults["error_rate"]):
+        return None
+    stats["errors"] += 1
+    headers = {} if faults["retry_after"] is None else {"retry-after": str(faults["retry_after"])}
+    error = {"message": "Injected failure", "type": "fake_openai_error", "param": None, "code": None}
+    return JSONResponse({"error": error}, status_code=faults["status"], headers=headers)
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    error = injected_error()
+    if error is not None:
+        return error
+    tokens = reply_tokens(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = body.get("model", "gpt-4.1-nano")
+    stats["completion_tokens"] += len(tokens)
+
+    if body.get("stream"):
+        stats["streams"] += 1
+
+        def chunk(choices: list, **extra) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                **extra,
+            }) + "\n\n"
+
+        def delta(content: dict, finish_reason=None) -> str:
+            return chunk([{"index": 0, "delta": content, "finish_reason": finish_reason}])
+
+        async def events():
+            yield delta({"role": "assistant", "content": ""})
+            async for token in generate(tokens):
+                yield delta({"content": token})
+            yield delta({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                # Like OpenAI: one last chunk with no choices and the usage totals
+                yield chunk([], usage=usage(body, tokens))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    content = "".join([token async for token in generate(tokens)])
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage(body, tokens),
+    }
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+@app.post("/faults")
+async def set_faults(request: Request):
+    """Change failure injection, e.g. {"fail_next": 2, "status": 503, "retry_after": 0.5}"""
+    faults.update(await request.json())
+    return faults
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible server for load tests")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--tokens-per-sec", type=float, default=TOKENS_PER_SEC)
+    parser.add_argument("--reply-tokens", type=int, default=REPLY_TOKENS)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE, help="share of requests that fail with --error-status")
+    parser.add_argument("--error-status", type=int, default=ERROR_STATUS)
+    parser.add_argument("--retry-after", default=RETRY_AFTER, help="Retry-After seconds sent with injected errors")
+    args = parser.parse_args()
+    LATENCY_MS, TOKENS_PER_SEC, REPLY_TOKENS = args.latency_ms, args.tokens_per_sec, args.reply_tokens
+    faults.update(error_rate=args.error_rate, status=args.error_status, retry_after=args.retry_after)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
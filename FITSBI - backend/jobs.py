@@ -0,0 +1,144 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from log_config import get_logger, request_id
+from metrics import JOB_SECONDS
+from mongodb import MongoDB
+from single_flight import exclusive
+
+logger = get_logger(__name__)
+
+JobHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+class JobRunner:
+    """In-process background job queue backed by the `jobs` collection.
+
+    Jobs are deduplicated per (kind, user, day): the job key doubles as the
+    Mongo `_id`, so enqueuing the same work twice in a day is a no-op even
+    across workers. Workers claim a job atomically before running it, failed
+    attempts are retried with exponential backoff, and anything still pending
+    or orphaned in `running` is picked up again after a restart.
+    """
+
+    def __init__(self, workers: int = None, max_attempts: int = None, base_delay: float = 5.0,
+                 queue_size: int = 1000, sweep_interval: float = 60.0, stale_after: timedelta = timedelta(minutes=10)):
+        self.worker_count = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.base_delay = base_delay
+        self.sweep_interval = sweep_interval
+        self.stale_after = stale_after
+        self.handlers: Dict[str, JobHandler] = {}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._queued = set()  # job keys currently sitting in the local queue
+        self._enqueued_today = set()  # skips the Mongo upsert for keys already seen today
+        self._today = None
+        self._tasks = []
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    @staticmethod
+    def job_key(kind: str, user_id: str, day: Optional[datetime] = None) -> str:
+        day = day or datetime.utcnow()
+        return f"{kind}:{user_id}:{day.strftime('%Y-%m-%d')}"
+
+    async def enqueue(self, kind: str, user_id: str, payload: Optional[Dict[str, Any]] = None) -> bool:
+        """Record a job and hand it to the workers; returns False if it was a duplicate"""
+        today = datetime.utcnow().date()
+        if today != self._today:
+            self._today = today
+            self._enqueued_today.clear()
+
+        key = self.job_key(kind, user_id)
+        if key in self._enqueued_today:
+            return False
+        self._enqueued_today.add(key)
+
+        created = await MongoDB.create_job(key, kind, user_id, payload or {})
+        if created:
+            self._offer(key)
+        return created
+
+    def _offer(self, key: str):
+        if key in self._queued:
+            return
+        try:
+            self._queue.put_nowait(key)
+            self._queued.add(key)
+        except asyncio.QueueFull:
+            pass  # Still pending in Mongo; the next sweep picks it up
+
+    async def start(self):
+        await MongoDB.reset_stale_jobs(datetime.utcnow() - self.stale_after)
+        await self._sweep_once()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        """Stop workers; jobs not yet finished stay persisted and resume on next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _sweep_once(self):
+        for job in await MongoDB.get_runnable_jobs(datetime.utcnow(), limit=self._queue.maxsize):
+            self._offer(job["_id"])
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self._sweep_once()
+            except Exception as e:
+                logger.error("Job sweep error: %s", e)
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            self._queued.discard(key)
+            try:
+                await self._run(key)
+            except Exception as e:
+                logger.error("Job runner error for %s: %s", key, e)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, key: str):
+        job = await MongoDB.claim_job(key)
+        if not job:
+            return  # Finished, failed, backing off, or claimed by another worker
+
+        request_id.set(key)  # Correlates the job's log lines; each worker task has its own context
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await MongoDB.finish_job(key, "failed", error=f"No handler for {job['kind']}")
+            return
+
+        started = time.perf_counter()
+        try:
+            # A stale-job reset can hand a slow job to a second worker; the lease keeps
+            # it to one run, so e.g. a daily summary is never generated twice at once
+            async with exclusive(f"job:{key}") as acquired:
+                if not acquired:
+                    return  # The holder marks it finished
+                await handler(job["user_id"], job.get("payload", {}))
+        except Exception as e:
+            JOB_SECONDS.labels(job["kind"], "error").observe(time.perf_counter() - started)
+            if job["attempts"] >= self.max_attempts:
+                logger.error("Job %s failed after %d attempts: %s", key, job["attempts"], e)
+                await MongoDB.finish_job(key, "failed", error=str(e))
+                return
+            # Full-jitter exponential backoff before the next attempt
+            delay = random.uniform(0, self.base_delay * 2 ** (job["attempts"] - 1))
+            await MongoDB.retry_job(key, datetime.utcnow() + timedelta(seconds=delay), error=str(e))
+            asyncio.get_running_loop().call_later(delay, self._offer, key)
+            return
+
+        JOB_SECONDS.labels(job["kind"], "ok").observe(time.perf_counter() - started)
+        await MongoDB.finish_job(key, "done")
+
+job_runner = JobRunner()
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
+from metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
+
+load_dotenv()
+
+DEFAULT_MODEL = "gpt-4.1-nano"
+
+class LLMError(Exception):
+    """Raised when a completion cannot be produced within its retries and deadline"""
+
+def _parse_model_limits(spec: str) -> Dict[str, int]:
+    """Parse "model=limit,model=limit" into a dict, ignoring malformed entries"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, limit = entry.partition("=")
+        if model and limit.isdigit():
+            limits[model.strip()] = int(limit)
+    return limits
+
+class LLMClient:
+    """One shared, pooled OpenAI client for every completion the app makes.
+
+    - a single httpx connection pool is reused across calls
+    - a global semaphore caps in-flight requests, and a per-model semaphore
+      caps each model separately
+    - 429, 5xx and connection errors are retried with full-jitter exponential
+      backoff, honouring Retry-After when the provider sends it
+    - every call has a deadline covering the wait for a slot, all attempts
+      and the backoff sleeps between them
+
+    Everything is configurable through LLM_* environment variables, and
+    OPENAI_BASE_URL points the client at a local OpenAI-compatible server.
+    Each call names its `call_site` so duration and billed tokens show up per
+    feature in /metrics; streams ask for a final usage chunk unless
+    LLM_STREAM_USAGE=0 (for servers that reject `stream_options`).
+    """
+
+    def __init__(self, max_concurrency: int = None, model_concurrency: Dict[str, int] = None,
+                 default_model_concurrency: int = None, timeout: float = None, max_retries: int = None,
+                 base_delay: float = 0.5, max_delay: float = 8.0, base_url: str = None, api_key: str = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+        self.model_concurrency = model_concurrency or _parse_model_limits(os.getenv("LLM_MODEL_CONCURRENCY", ""))
+        self.default_model_concurrency = default_model_concurrency or int(os.getenv("LLM_DEFAULT_MODEL_CONCURRENCY", str(self.max_concurrency)))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "30"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "3"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.stream_usage = os.getenv("LLM_STREAM_USAGE", "1") == "1"
+        self._client: Optional[AsyncOpenAI] = None
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self._model_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 10.0))
+            )
+            # Retries live here so they share the deadline and the semaphores
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=self.timeout,
+                http_client=http_client
+            )
+        return self._client
+
+    def _model_limit(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_limits:
+            limit = self.model_concurrency.get(model, self.default_model_concurrency)
+            self._model_limits[model] = asyncio.Semaphore(limit)
+        return self._model_limits[model]
+
+    @asynccontextmanager
+    async def _slots(self, model: str, deadline: float):
+        """Hold a global and a per-model slot; asyncio.TimeoutError if they don't free up before `deadline`"""
+        model_limit = self._model_limit(model)
+        await asyncio.wait_for(self._global_limit.acquire(), timeout=deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(model_limit.acquire(), timeout=deadline - time.monotonic())
+        except BaseException:
+            self._global_limit.release()
+            raise
+        try:
+            yield
+        finally:
+            model_limit.release()
+            self._global_limit.release()
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return isinstance(error, (APIConnectionError, asyncio.TimeoutError))
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        if isinstance(error, APIStatusError):
+            retry_after = error.response.headers.get("retry-after")
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), self.max_delay)
+        except ValueError:
+            pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _with_retries(self, model: str, deadline: float, call):
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError(f"LLM call to {model} exceeded its deadline")
+            try:
+                async with self._slots(model, deadline):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    return await asyncio.wait_for(call(), timeout=remaining)
+            except Exception as e:
+                if not self._is_retryable(e) or attempt >= self.max_retries:
+                    raise LLMError(f"LLM call to {model} failed: {e}") from e
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay >= deadline:
+                    raise LLMError(f"LLM call to {model} exceeded its deadline: {e}") from e
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _record_usage(call_site: str, usage):
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            # The SDK leaves fields its chunk model doesn't declare, like a stream's usage, as plain dicts
+            prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        else:
+            prompt, completion = usage.prompt_tokens, usage.completion_tokens
+        LLM_TOKENS.labels(call_site, "prompt").inc(prompt or 0)
+        LLM_TOKENS.labels(call_site, "completion").inc(completion or 0)
+
+    async def complete(self, messages: List[Dict[str, str]], model: str = DEFAULT_MODEL,
+                       temperature: float = 0.7, max_tokens: int = 600, timeout: float = None,
+                       call_site: str = "other", **kwargs: Any):
+        """Return the full chat completion response"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self._with_retries(model, deadline, lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            ))
+            outcome = "ok"
+        finally:
+            LLM_REQUEST_SECONDS.labels(call_site, outcome).observe(time.perf_counter() - started)
+        self._record_usage(call_site, getattr(response, "usage", None))
+        return response
+
+    async def stream(self, messages: List[Dict[str, str]], model: str = DEFAULT_MODEL,
+                     temperature: float = 0.7, max_tokens: int = 600, timeout: float = None,
+                     call_site: str = "other", **kwargs: Any) -> AsyncIterator[str]:
+        """Yield text deltas as they arrive.
+
+        Opening the stream is retried like any other call; once tokens have
+        been yielded a failure is raised instead, since the consumer has
+        already forwarded part of the reply. The concurrency slots are held
+        until the stream is exhausted or closed.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        if self.stream_usage:
+            # The provider then ends the stream with a chunk carrying `usage` and no choices
+            extra_body = dict(kwargs.pop("extra_body", None) or {})
+            extra_body.setdefault("stream_options", {"include_usage": True})
+            kwargs["extra_body"] = extra_body
+        attempt = 0
+        started = False
+        timer_started = time.perf_counter()
+        outcome = "closed"  # Left as is when the consumer stops early
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    outcome = "error"
+                    raise LLMError(f"LLM stream from {model} exceeded its deadline")
+                try:
+                    async with self._slots(model, deadline):
+                        response = await asyncio.wait_for(self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            stream=True,
+                            **kwargs
+                        ), timeout=max(deadline - time.monotonic(), 0.001))
+                        try:
+                            async for chunk in response:
+                                self._record_usage(call_site, getattr(chunk, "usage", None))
+                                if chunk.choices and chunk.choices[0].delta.content:
+                                    started = True
+                                    yield chunk.choices[0].delta.content
+                        finally:
+                            await response.response.aclose()
+                        outcome = "ok"
+                        return
+                except Exception as e:
+                    if started or not self._is_retryable(e) or attempt >= self.max_retries:
+                        outcome = "error"
+                        raise LLMError(f"LLM stream from {model} failed: {e}") from e
+                    delay = self._backoff(attempt, e)
+                    if time.monotonic() + delay >= deadline:
+                        outcome = "error"
+                        raise LLMError(f"LLM stream from {model} exceeded its deadline: {e}") from e
+                    attempt += 1
+                    await asyncio.sleep(delay)
+        finally:
+            LLM_REQUEST_SECONDS.labels(call_site, outcome).observe(time.perf_counter() - timer_started)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+llm_client = LLMClient()
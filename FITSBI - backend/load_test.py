@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from migrations import find_collection_scans
+
+# Drives the real FastAPI app with N concurrent simulated users doing a
+# sign-up/login -> chat -> history -> progress mix, against a local fake
+# OpenAI server (fake_openai.py) and the in-process memory storage backend
+# (or, with --storage motor, a scratch database on a local mongod).
+# Reports throughput and p50/p95/p99 per endpoint and exits non-zero when a
+# result regresses past the stored baseline for the same scenario, or when
+# there is no baseline for it unless --update-baseline records one. With
+# --storage motor it also explains the hot queries against the database the
+# app just migrated and filled, and fails on any collection scan.
+#
+#   python load_test.py --users 50 --turns 5
+#   python load_test.py --users 50 --turns 5 --update-baseline
+#   python load_test.py --storage motor --mongodb-url mongodb://127.0.0.1:27017
+APP_PORT = 8900
+FAKE_OPENAI_PORT = 8901
+SCRATCH_DATABASE = "fitness_ai_loadtest"  # With --storage motor; dropped before and after every run
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_test_baseline.json")
+PASSWORD = "load-test-password"
+MAX_AUTH_RETRIES = 5  # Sign-up and login are shed with 503 under a storm; clients retry after Retry-After
+
+def percentile(samples: List[float], pct: int) -> float:
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+class Recorder:
+    """Latency samples and error counts per endpoint"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.failures: Dict[str, Counter] = {}  # endpoint -> status code (or exception name) -> count
+
+    def record(self, endpoint: str, elapsed_ms: float, ok: bool, outcome: str = ""):
+        self.latencies.setdefault(endpoint, []).append(elapsed_ms)
+        if not ok:
+            self.failures.setdefault(endpoint, Counter())[outcome] += 1
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.record(endpoint, (time.perf_counter() - start) * 1000, False, type(e).__name__)
+            return None
+        self.record(endpoint, (time.perf_counter() - start) * 1000, response.is_success, str(response.status_code))
+        return response
+
+    async def stream(self, client: httpx.AsyncClient, endpoint: str, url: str, **kwargs) -> bool:
+        """Time a streamed response until its last byte, the way the chat UI waits on it"""
+        start = time.perf_counter()
+        try:
+            async with client.stream("POST", url, **kwargs) as response:
+                async for _ in response.aiter_bytes():
+                    pass
+                ok, outcome = response.is_success, str(response.status_code)
+        except httpx.HTTPError as e:
+            ok, outcome = False, type(e).__name__
+        self.record(endpoint, (time.perf_counter() - start) * 1000, ok, outcome)
+        return ok
+
+    def summary(self, elapsed: float) -> dict:
+        total = sum(len(samples) for samples in self.latencies.values())
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                "count": len(samples),
+                "error_rate": round(sum(self.failures.get(endpoint, Counter()).values()) / len(samples), 4),
+                "p50_ms": round(percentile(samples, 50), 1),
+                "p95_ms": round(percentile(samples, 95), 1),
+                "p99_ms": round(percentile(samples, 99), 1),
+            }
+        failures = {endpoint: dict(outcomes) for endpoint, outcomes in sorted(self.failures.items())}
+        return {"requests": total, "elapsed_s": round(elapsed, 2), "throughput_rps": round(total / elapsed, 1),
+                "endpoints": endpoints, "failures": failures}
+
+async def authed(recorder: Recorder, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+    """A sign-up or login request, retried when the password hasher sheds it"""
+    for _ in range(MAX_AUTH_RETRIES):
+        response = await recorder.request(client, endpoint, method, url, **kwargs)
+        if response is None or response.status_code != 503:
+            return response
+        await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+    return None
+
+def progress_entry(user_id: str, turn: int) -> dict:
+    return {
+        "user_id": user_id,
+        "date": (datetime.utcnow() - timedelta(days=turn)).isoformat(),
+        "weight": 80 - turn * 0.1,
+        "calories_consumed": 2200,
+        "calories_burned": 2400,
+        "workout_duration": 45,
+        "workout_type": "strength",
+        "steps": 8000 + turn * 100,
+        "water_intake": 2.5,
+        "sleep_hours": 7.5,
+        "sleep_quality": None,
+        "mood": "good",
+        "stress_level": None,
+        "energy_level": 7,
+        "notes": None,
+    }
+
+async def simulated_user(client: httpx.AsyncClient, recorder: Recorder, index: int, run_id: str, turns: int):
+    email = f"loadtest-{run_id}-{index}@example.com"
+    created = await authed(recorder, client, "POST /users/", "POST", "/users/",
+                           json={"email": email, "name": f"Load Test {index}", "password": PASSWORD})
+    if created is None or not created.is_success:
+        return
+    login = await authed(recorder, client, "POST /token", "POST", "/token",
+                         data={"username": email, "password": PASSWORD})
+    if login is None or not login.is_success:
+        return
+    user_id = created.json()["id"]
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    for turn in range(turns):
+        message = f"Turn {turn}: I slept about 7 hours and did a 45 minute workout, what should I do tomorrow?"
+        if turn % 2:
+            await recorder.stream(client, "POST /chat/{user_id}/stream", f"/chat/{user_id}/stream",
+                                  params={"message": message}, headers=headers)
+        else:
+            await recorder.request(client, "POST /chat/{user_id}", "POST", f"/chat/{user_id}",
+                                   params={"message": message}, headers=headers)
+        await recorder.request(client, "GET /chat/history/{user_id}", "GET", f"/chat/history/{user_id}",
+                               params={"limit": 20}, headers=headers)
+        await recorder.request(client, "POST /progress/{user_id}", "POST", f"/progress/{user_id}",
+                               json=progress_entry(user_id, turn), headers=headers)
+    await recorder.request(client, "GET /progress/{user_id}/trends", "GET", f"/progress/{user_id}/trends", headers=headers)
+    await recorder.request(client, "GET /stats/{user_id}", "GET", f"/stats/{user_id}", headers=headers)
+
+async def run_load(app_url: str, users: int, turns: int, ramp: float) -> dict:
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        tasks = []
+        for index in range(users):
+            tasks.append(asyncio.create_task(simulated_user(client, recorder, index, run_id, turns)))
+            await asyncio.sleep(ramp / users)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return recorder.summary(elapsed)
+
+def start_server(command: List[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+async def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode} during startup")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+def scenario_key(args) -> str:
+    """Baselines are only comparable for the same load shape and fake model speed"""
+    return f"{args.storage}:users={args.users},turns={args.turns},llm={args.llm_latency_ms:g}ms@{args.llm_tokens_per_sec:g}tps"
+
+def find_regressions(result: dict, baseline: dict, tolerance: float, slack_ms: float) -> List[str]:
+    regressions = []
+    if result["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput {result['throughput_rps']} rps < baseline {baseline['throughput_rps']} rps")
+    for endpoint, expected in baseline["endpoints"].items():
+        actual = result["endpoints"].get(endpoint)
+        if actual is None:
+            regressions.append(f"{endpoint}: no requests recorded")
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            # The absolute slack keeps scheduler jitter on millisecond endpoints from failing a run
+            if actual[metric] > expected[metric] * (1 + tolerance) + slack_ms:
+                regressions.append(f"{endpoint}: {metric} {actual[metric]} > baseline {expected[metric]}")
+        if actual["error_rate"] > expected["error_rate"] + 0.01:
+            regressions.append(f"{endpoint}: error rate {actual['error_rate']:.2%} > baseline {expected['error_rate']:.2%}")
+    return regressions
+
+def print_report(result: dict):
+    print(f"\n{result['requests']:,} requests in {result['elapsed_s']}s -> {result['throughput_rps']} req/s\n")
+    print(f"{'endpoint':<34} {'count':>6} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, row in result["endpoints"].items():
+        print(f"{endpoint:<34} {row['count']:>6} {row['error_rate']:>7.1%} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+    for endpoint, outcomes in result["failures"].items():
+        print(f"  failures on {endpoint}: " + ", ".join(f"{outcome} x{count}" for outcome, count in outcomes.items()))
+
+async def check_collection_scans(mongodb_url: str) -> List[dict]:
+    """find_collection_scans on the scratch database; the app under test created its indexes on startup"""
+    client = AsyncIOMotorClient(mongodb_url)
+    try:
+        return await find_collection_scans(client[SCRATCH_DATABASE])
+    finally:
+        client.close()
+
+async def main(args) -> int:
+    processes = []
+    app_url = args.app_url
+    scratch_mongo = args.app_url is None and args.storage == "motor"
+    collection_scans = []
+    try:
+        if scratch_mongo:
+            MongoClient(args.mongodb_url).drop_database(SCRATCH_DATABASE)
+        if app_url is None:
+            processes.append(start_server([
+                sys.executable, "fake_openai.py", "--port", str(FAKE_OPENAI_PORT),
+                "--latency-ms", str(args.llm_latency_ms), "--tokens-per-sec", str(args.llm_tokens_per_sec),
+            ], dict(os.environ)))
+            await wait_until_up(f"http://127.0.0.1:{FAKE_OPENAI_PORT}/stats", processes[-1])
+
+            app_env = dict(
+                os.environ,
+                OPENAI_BASE_URL=f"http://127.0.0.1:{FAKE_OPENAI_PORT}/v1",
+                OPENAI_API_KEY="load-test",
+                STORAGE_BACKEND=args.storage,
+                MONGODB_URL=args.mongodb_url,
+                MONGODB_DATABASE=SCRATCH_DATABASE,
+                MONGODB_TLS="0",
+            )
+            processes.append(start_server([
+                sys.executable, "-m", "uvicorn", "app:app", "--port", str(APP_PORT), "--log-level", "warning",
+            ], app_env))
+            app_url = f"http://127.0.0.1:{APP_PORT}"
+            await wait_until_up(f"{app_url}/openapi.json", processes[-1])
+
+        result = await run_load(app_url, args.users, args.turns, args.ramp)
+        if scratch_mongo:
+            collection_scans = await check_collection_scans(args.mongodb_url)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=30)
+        if scratch_mongo:
+            MongoClient(args.mongodb_url).drop_database(SCRATCH_DATABASE)
+
+    print_report(result)
+    if scratch_mongo:
+        for scan in collection_scans:
+            print(f"❌ COLLSCAN on {scan['collection']} for {scan['filter']}: {scan['stages']}")
+        if collection_scans:
+            return 1
+        print("\n✅ Every hot query is served by an index")
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    key = scenario_key(args)
+
+    if args.update_baseline:
+        baselines[key] = result
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline for {key}")
+        return 0
+
+    if key not in baselines:
+        # Nothing to compare against is a failure, or a gate with no baseline would always pass
+        print(f"\n❌ No baseline for {key} in {args.baseline}; run with --update-baseline to record one")
+        return 1
+    regressions = find_regressions(result, baselines[key], args.tolerance, args.slack_ms)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) against the {key} baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print(f"\n✅ Within {args.tolerance:.0%} of the {key} baseline")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API with simulated users")
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="chat/history/progress rounds per user")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="fake model time to first token")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=80, help="fake model generation speed")
+    parser.add_argument("--storage", choices=["memory", "motor"], default="memory", help="storage backend for the app under test")
+    parser.add_argument("--mongodb-url", default=os.getenv("LOAD_TEST_MONGODB_URL", "mongodb://127.0.0.1:27017"))
+    parser.add_argument("--app-url", default=None, help="test an already running app instead of starting one")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a result is a regression")
+    parser.add_argument("--slack-ms", type=float, default=25, help="latency increase always allowed on top of --tolerance")
+    parser.add_argument("--update-baseline", action="store_true", help="record this run as the scenario's baseline")
+    sys.exit(asyncio.run(main(parser.parse_args())))
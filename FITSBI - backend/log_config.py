@@ -0,0 +1,188 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # Per-module overrides, e.g. "mongodb=DEBUG,llm_client=WARNING"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" for collectors, "text" for a terminal
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))  # Share of enabled logger.debug calls kept
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# httpx logs every request at INFO, i.e. one line per LLM call; LOG_LEVELS can still lower it
+DEFAULT_LEVELS = {"httpx": logging.WARNING, "httpcore": logging.WARNING}
+
+# Correlates every record logged while serving one request, including from tasks it spawns
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse "module=LEVEL,module=LEVEL" into logger levels, ignoring malformed entries"""
+    levels = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = entry.partition("=")
+        level = logging.getLevelName(level.strip().upper())
+        if name and isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and any `extra=` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+        return f"{line} {fields}" if fields else line
+
+class SampledLogger(logging.Logger):
+    """A logger whose debug() keeps only `debug_sample_rate` of its calls.
+
+    The draw happens before a record is built, so a high-frequency debug line
+    costs next to nothing even with DEBUG switched on for its module, and
+    doesn't flood the queue.
+    """
+
+    debug_sample_rate = LOG_DEBUG_SAMPLE_RATE
+
+    def debug(self, msg, *args, **kwargs):
+        if self.isEnabledFor(logging.DEBUG) and (self.debug_sample_rate >= 1 or random.random() < self.debug_sample_rate):
+            self._log(logging.DEBUG, msg, args, **kwargs)
+
+def get_logger(name: str) -> logging.Logger:
+    """logging.getLogger for app modules: the logger it creates samples debug()"""
+    manager = logging.Logger.manager
+    previous = manager.loggerClass
+    manager.loggerClass = SampledLogger
+    try:
+        return logging.getLogger(name)
+    finally:
+        manager.loggerClass = previous
+
+class ContextFilter(logging.Filter):
+    """Stamps the request id on each record; runs on the caller, before the queue.
+
+    It has to be read here because the listener thread doesn't share the
+    request's context.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting them or ever blocking.
+
+    The stock QueueHandler formats the message on the caller so records can
+    be pickled; this queue is in-process, so formatting moves to the listener.
+    Arguments must therefore not be mutated after the call. When the queue is
+    full the record is dropped and counted instead of stalling the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+
+def configure_logging(level: str = None, levels: str = None, log_format: str = None,
+                      debug_sample_rate: float = None, stream=None) -> NonBlockingQueueHandler:
+    """Route the root logger through a bounded queue drained by a background thread; safe to call twice"""
+    global _listener, _handler
+    if _handler is not None:
+        return _handler
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if (log_format or LOG_FORMAT) == "text" else JsonFormatter())
+
+    if debug_sample_rate is not None:
+        SampledLogger.debug_sample_rate = debug_sample_rate
+    _handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    _handler.addFilter(ContextFilter())
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level or LOG_LEVEL)
+    root.addHandler(_handler)
+    for name, module_level in {**DEFAULT_LEVELS, **parse_levels(LOG_LEVELS if levels is None else levels)}.items():
+        logging.getLogger(name).setLevel(module_level)
+    return _handler
+
+def stop_logging():
+    """Write out everything still queued and stop the listener thread"""
+    global _listener, _handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_handler)
+    _listener = None
+    _handler = None
+
+class RequestIdMiddleware:
+    """ASGI middleware binding `request_id` for the request and echoing it back.
+
+    An incoming X-Request-ID (from a proxy or the client) is reused so logs
+    line up across services; otherwise a short random id is generated.
+    """
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(self.header, b"").decode("latin-1")
+        value = incoming if 0 < len(incoming) <= 64 and incoming.isprintable() else uuid.uuid4().hex[:16]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(self.header, value.encode("latin-1"))]
+            await send(message)
+
+        token = request_id.set(value)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
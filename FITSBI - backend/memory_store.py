@@ -0,0 +1,759 @@
+import random
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+# An in-process stand-in for the slice of the Motor API that MongoDB,
+# migrations and the write buffer use: the same filter, update, projection
+# and sort semantics, the same result and error types (unique indexes raise
+# DuplicateKeyError, bulk writes BulkWriteError), with no network in between.
+# Documents are copied in and out, so callers can't mutate stored state.
+DUPLICATE_KEY = 11000
+INDEX_NOT_FOUND = 27
+
+def _clone(value):
+    value_type = type(value)
+    if value_type is dict:
+        return {key: _clone(item) for key, item in value.items()}
+    if value_type is list or value_type is tuple:
+        return [_clone(item) for item in value]
+    return value  # Scalars, datetimes and ObjectIds are immutable
+
+# ============ VALUE ORDERING ============
+# Mongo only compares values within a type bracket and sorts brackets in a
+# fixed order; a missing field behaves like null.
+def _bracket(value) -> int:
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, (list, tuple)):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+def _sort_key(value) -> Tuple[int, Any]:
+    bracket = _bracket(value)
+    if bracket == 1:
+        return (1, 0)
+    if bracket in (4, 5, 10):
+        return (bracket, repr(value))
+    return (bracket, value)
+
+def _get_path(document: Dict[str, Any], path: str) -> Tuple[bool, Any]:
+    """(present, value) for a dotted path"""
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+def _set_path(document: Dict[str, Any], path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+def _unset_path(document: Dict[str, Any], path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+# ============ FILTERS ============
+_TYPE_ALIASES = {
+    "string": (str,), "double": (float,), "int": (int,), "long": (int,), "number": (int, float),
+    "bool": (bool,), "date": (datetime,), "objectId": (ObjectId,), "object": (dict,),
+    "array": (list,), "null": (type(None),),
+}
+
+def _is_operator_dict(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+def _same(a, b) -> bool:
+    return _bracket(a) == _bracket(b) and a == b
+
+def _equals(present: bool, value, target) -> bool:
+    if target is None:
+        return not present or value is None
+    if _same(value, target):
+        return True
+    return isinstance(value, list) and any(_same(item, target) for item in value)
+
+def _compare(present: bool, value, target, test) -> bool:
+    candidates = value if isinstance(value, list) else [value]
+    return any(_bracket(item) == _bracket(target) and test(_sort_key(item), _sort_key(target)) for item in candidates)
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+def _match_operator(present: bool, value, operator: str, argument) -> bool:
+    if operator == "$eq":
+        return _equals(present, value, argument)
+    if operator == "$ne":
+        return not _equals(present, value, argument)
+    if operator in _COMPARISONS:
+        return _compare(present, value, argument, _COMPARISONS[operator])
+    if operator == "$in":
+        return any(_equals(present, value, target) for target in argument)
+    if operator == "$nin":
+        return not any(_equals(present, value, target) for target in argument)
+    if operator == "$exists":
+        return present == bool(argument)
+    if operator == "$type":
+        types = _TYPE_ALIASES.get(argument)
+        if types is None:
+            raise OperationFailure(f"unknown $type alias: {argument}")
+        return present and isinstance(value, types) and (bool in types or not isinstance(value, bool))
+    if operator == "$not":
+        return not _match_field(present, value, argument)
+    raise OperationFailure(f"unknown operator: {operator}")
+
+def _match_field(present: bool, value, condition) -> bool:
+    if _is_operator_dict(condition):
+        return all(_match_operator(present, value, operator, argument) for operator, argument in condition.items())
+    return _equals(present, value, condition)
+
+def matches(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    """Whether `document` satisfies a Mongo filter"""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, clause) for clause in condition):
+                return False
+        elif key.startswith("$"):
+            raise OperationFailure(f"unknown top level operator: {key}")
+        elif not _match_field(*_get_path(document, key), condition):
+            return False
+    return True
+
+# ============ UPDATES AND PROJECTIONS ============
+def _apply_update(document: Dict[str, Any], update: Dict[str, Any], inserting: bool) -> Dict[str, Any]:
+    """A new document with `update` applied; a plain document replaces everything but `_id`"""
+    if not any(key.startswith("$") for key in update):
+        replaced = _clone(update)
+        if "_id" in document:
+            if "_id" in replaced and not _same(replaced["_id"], document["_id"]):
+                raise OperationFailure("the (immutable) field '_id' was found to have been altered")
+            replaced["_id"] = document["_id"]
+        return replaced
+
+    updated = _clone(document)
+    for operator, fields in update.items():
+        if operator == "$setOnInsert" and not inserting:
+            continue
+        for path, argument in fields.items():
+            if operator in ("$set", "$setOnInsert"):
+                _set_path(updated, path, _clone(argument))
+            elif operator == "$currentDate":
+                now = datetime.utcnow()
+                _set_path(updated, path, now.replace(microsecond=now.microsecond // 1000 * 1000))  # BSON dates hold milliseconds
+            elif operator == "$unset":
+                _unset_path(updated, path)
+            elif operator == "$inc":
+                present, current = _get_path(updated, path)
+                if present and (_bracket(current) != 2):
+                    raise OperationFailure(f"Cannot apply $inc to a value of non-numeric type at '{path}'")
+                _set_path(updated, path, (current if present else 0) + argument)
+            elif operator in ("$max", "$min"):
+                present, current = _get_path(updated, path)
+                if not present or (_sort_key(argument) > _sort_key(current)) == (operator == "$max") and argument != current:
+                    _set_path(updated, path, _clone(argument))
+            elif operator == "$push":
+                present, current = _get_path(updated, path)
+                _set_path(updated, path, (list(current) if present else []) + [_clone(argument)])
+            else:
+                raise OperationFailure(f"Unknown modifier: {operator}")
+    if "_id" in document and not _same(updated.get("_id"), document["_id"]):
+        raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+    return updated
+
+def _upsert_seed(query: Dict[str, Any]) -> Dict[str, Any]:
+    """The equality fields of a filter, which an upsert copies into the new document"""
+    seed: Dict[str, Any] = {}
+    for key, condition in query.items():
+        if key == "$and":
+            for clause in condition:
+                seed.update(_upsert_seed(clause))
+        elif key.startswith("$"):
+            continue
+        elif _is_operator_dict(condition):
+            if "$eq" in condition:
+                _set_path(seed, key, _clone(condition["$eq"]))
+        else:
+            _set_path(seed, key, _clone(condition))
+    return seed
+
+def project(document: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply an inclusion or exclusion projection on top-level fields"""
+    if not projection:
+        return document
+    include_id = bool(projection.get("_id", 1))
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if any(fields.values()) or (not fields and include_id):
+        return {key: value for key, value in document.items()
+                if (key == "_id" and include_id) or (key != "_id" and fields.get(key))}
+    return {key: value for key, value in document.items()
+            if key not in fields and (key != "_id" or include_id)}
+
+def _normalize_sort(key_or_list, direction=None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(key, order) for key, order in key_or_list]
+
+def sort_documents(documents: List[Dict[str, Any]], spec: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    # Ties keep insertion order, newest first under a descending leading key,
+    # the way a walk of our (field desc, _id desc) indexes returns them
+    if spec and spec[0][1] < 0:
+        documents.reverse()
+    # Stable sorts applied from the last key to the first give a multi-key order
+    for key, direction in reversed(spec):
+        documents.sort(key=lambda document: _sort_key(_get_path(document, key)[1]), reverse=direction < 0)
+    return documents
+
+def _hashable(value):
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+# ============ CURSORS ============
+class MemoryCursor:
+    """Lazily evaluated find() cursor supporting sort/skip/limit, to_list and async iteration"""
+
+    def __init__(self, collection: "MemoryCollection", query: Dict[str, Any], projection: Optional[Dict[str, Any]]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[Dict[str, Any]]] = None
+        self._position = 0
+
+    def sort(self, key_or_list, direction=None) -> "MemoryCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    def _evaluate(self) -> List[Dict[str, Any]]:
+        if self._results is None:
+            documents = self._collection._select(self._query)
+            if self._sort:
+                documents = sort_documents(documents, self._sort)
+            documents = documents[self._skip:]
+            if self._limit:
+                documents = documents[:self._limit]
+            self._results = [_clone(project(document, self._projection)) for document in documents]
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        results = self._evaluate()
+        end = len(results) if length is None else self._position + length
+        batch = results[self._position:end]
+        self._position += len(batch)
+        return batch
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        results = self._evaluate()
+        if self._position >= len(results):
+            raise StopAsyncIteration
+        self._position += 1
+        return results[self._position - 1]
+
+    async def explain(self) -> Dict[str, Any]:
+        stage = "IXSCAN" if self._collection._lookup_field(self._query) else "COLLSCAN"
+        return {"queryPlanner": {"winningPlan": {"stage": stage}}}
+
+class _ResultCursor(MemoryCursor):
+    """Cursor over precomputed documents, as returned by aggregate()"""
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self._results = documents
+        self._position = 0
+
+# ============ AGGREGATION ============
+def _evaluate_expression(document: Dict[str, Any], expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_path(document, expression[1:])[1]
+    if isinstance(expression, dict):
+        return {key: _evaluate_expression(document, value) for key, value in expression.items()}
+    return expression
+
+def _group(documents: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for document in documents:
+        group_id = _evaluate_expression(document, spec["_id"])
+        group = groups.setdefault(_hashable(group_id), {"_id": group_id})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (operator, expression), = accumulator.items()
+            value = _evaluate_expression(document, expression)
+            if operator == "$sum":
+                group[field] = group.get(field, 0) + (value if _bracket(value) == 2 else 0)
+            elif operator == "$push":
+                group.setdefault(field, []).append(value)
+            elif operator == "$first":
+                group.setdefault(field, value)
+            elif operator == "$last":
+                group[field] = value
+            elif operator in ("$max", "$min"):
+                if field not in group or (_sort_key(value) > _sort_key(group[field])) == (operator == "$max"):
+                    group[field] = value
+            else:
+                raise OperationFailure(f"unknown group operator '{operator}'")
+    return list(groups.values())
+
+def aggregate_documents(documents: List[Dict[str, Any]], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for stage in pipeline:
+        (name, argument), = stage.items()
+        if name == "$match":
+            documents = [document for document in documents if matches(document, argument)]
+        elif name == "$sort":
+            documents = sort_documents(documents, _normalize_sort(argument))
+        elif name == "$group":
+            documents = _group(documents, argument)
+        elif name == "$project":
+            documents = [project(document, argument) for document in documents]
+        elif name == "$sample":
+            documents = random.sample(documents, min(argument["size"], len(documents)))
+        elif name == "$skip":
+            documents = documents[argument:]
+        elif name == "$limit":
+            documents = documents[:argument]
+        elif name == "$count":
+            documents = [{argument: len(documents)}] if documents else []
+        else:
+            raise OperationFailure(f"Unrecognized pipeline stage name: '{name}'")
+    return documents
+
+# ============ COLLECTIONS ============
+class MemoryCollection:
+    """One collection: documents keyed by `_id` in insertion order, plus hash lookups.
+
+    Each declared index hashes its first field and, when compound, all of
+    its fields, so equality filters on them (user_id, email, user_id + date,
+    ...) touch only the matching documents instead of scanning the
+    collection. Unique indexes are enforced; TTL options are
+    accepted but documents are not reaped.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._documents: Dict[Any, Dict[str, Any]] = {}
+        self._sequence: Dict[Any, int] = {}  # _id -> insertion order, for natural order across lookups
+        self._inserted = 0
+        self._indexes: Dict[str, Dict[str, Any]] = {}  # name -> IndexModel document
+        self._lookups: Dict[Tuple[str, ...], Dict[tuple, Dict[Any, None]]] = {}  # fields -> values -> ordered set of _ids
+        self._arrays: Dict[Tuple[str, ...], Dict[Any, None]] = {}  # fields -> _ids with an array or document among them
+        self._unique: Dict[str, Dict[Any, Any]] = {}  # index name -> key tuple -> _id
+
+    # ---- index bookkeeping ----
+    def _index_keys(self, name: str, document: Dict[str, Any]) -> Any:
+        fields = self._indexes[name]["key"]
+        return tuple(_hashable(_get_path(document, field)[1]) for field in fields)
+
+    @staticmethod
+    def _lookup_key(document: Dict[str, Any], fields: Tuple[str, ...]) -> Optional[tuple]:
+        values = tuple(_get_path(document, field)[1] for field in fields)
+        # Arrays match on any element, so they can't be bucketed by value
+        return None if any(isinstance(value, (list, dict)) for value in values) else values
+
+    def _register(self, document: Dict[str, Any]):
+        key = document["_id"]
+        for fields, buckets in self._lookups.items():
+            lookup_key = self._lookup_key(document, fields)
+            if lookup_key is None:
+                self._arrays[fields][key] = None
+            else:
+                buckets.setdefault(lookup_key, {})[key] = None
+        for name, values in self._unique.items():
+            values[self._index_keys(name, document)] = key
+
+    def _unregister(self, document: Dict[str, Any]):
+        key = document["_id"]
+        for fields, buckets in self._lookups.items():
+            lookup_key = self._lookup_key(document, fields)
+            if lookup_key is None:
+                self._arrays[fields].pop(key, None)
+                continue
+            bucket = buckets.get(lookup_key)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del buckets[lookup_key]
+        for name, values in self._unique.items():
+            index_key = self._index_keys(name, document)
+            if values.get(index_key) == key:
+                del values[index_key]
+
+    def _check_unique(self, document: Dict[str, Any]):
+        for name, values in self._unique.items():
+            index_key = self._index_keys(name, document)
+            if index_key in values and values[index_key] != document["_id"]:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {name} dup key: "
+                    f"{ {field: _get_path(document, field)[1] for field in self._indexes[name]['key']} }",
+                    DUPLICATE_KEY
+                )
+
+    def _store(self, document: Dict[str, Any]):
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.name} index: _id_ dup key: {{ _id: {document['_id']!r} }}",
+                DUPLICATE_KEY
+            )
+        self._check_unique(document)
+        self._documents[document["_id"]] = document
+        self._sequence[document["_id"]] = self._inserted
+        self._inserted += 1
+        self._register(document)
+
+    def _replace(self, current: Dict[str, Any], updated: Dict[str, Any]):
+        self._check_unique(updated)
+        self._unregister(current)
+        self._documents[current["_id"]] = updated
+        self._register(updated)
+
+    def _remove(self, document: Dict[str, Any]):
+        self._unregister(document)
+        del self._documents[document["_id"]]
+        del self._sequence[document["_id"]]
+
+    # ---- query planning ----
+    @staticmethod
+    def _plain_equality(query: Dict[str, Any], field: str) -> bool:
+        condition = query.get(field)
+        return condition is not None and not isinstance(condition, (dict, list)) and _hashable(condition) is condition
+
+    def _lookup_field(self, query: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+        """The most selective indexed fields whose equality conditions narrow this query, if any"""
+        if self._plain_equality(query, "_id"):
+            return ("_id",)
+        for fields in self._lookups:  # Longest first
+            if all(self._plain_equality(query, field) for field in fields):
+                return fields
+        return None
+
+    def _select(self, query: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Stored documents matching `query`, in natural (insertion) order; not copied"""
+        query = query or {}
+        fields = self._lookup_field(query)
+        if fields == ("_id",):
+            document = self._documents.get(query["_id"])
+            candidates = [document] if document is not None else []
+        elif fields is not None:
+            keys = list(self._lookups[fields].get(tuple(query[field] for field in fields), ()))
+            if self._arrays[fields]:
+                keys = sorted(keys + list(self._arrays[fields]), key=self._sequence.__getitem__)
+            candidates = [self._documents[key] for key in keys]
+        else:
+            candidates = list(self._documents.values())
+        return [document for document in candidates if matches(document, query)]
+
+    def _first(self, query: Dict[str, Any], sort=None) -> Optional[Dict[str, Any]]:
+        documents = self._select(query)
+        if sort and documents:
+            documents = sort_documents(documents, _normalize_sort(sort))
+        return documents[0] if documents else None
+
+    # ---- reads ----
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None,
+             sort=None, skip: int = 0, limit: int = 0, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(self, filter or {}, projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    async def find_one(self, filter=None, projection: Optional[Dict[str, Any]] = None, sort=None, **kwargs) -> Optional[Dict[str, Any]]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        document = self._first(filter or {}, sort)
+        return _clone(project(document, projection)) if document is not None else None
+
+    async def count_documents(self, filter: Dict[str, Any], **kwargs) -> int:
+        return len(self._select(filter))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._documents)
+
+    async def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+        values = {}
+        for document in self._select(filter):
+            present, value = _get_path(document, key)
+            for item in (value if isinstance(value, list) else [value]) if present else []:
+                values.setdefault(_hashable(item), item)
+        return list(values.values())
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> MemoryCursor:
+        documents = [_clone(document) for document in self._documents.values()]
+        return _ResultCursor(aggregate_documents(documents, pipeline))
+
+    # ---- writes ----
+    async def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        document.setdefault("_id", ObjectId())  # Like pymongo, the caller's document gets the _id
+        self._store(_clone(document))
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> InsertManyResult:
+        return self._insert_many(list(documents), ordered)
+
+    def _insert_many(self, documents: List[Dict[str, Any]], ordered: bool) -> InsertManyResult:
+        errors = []
+        inserted = 0
+        for index, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            try:
+                self._store(_clone(document))
+                inserted += 1
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError(self._bulk_details(nInserted=inserted, writeErrors=errors))
+        return InsertManyResult([document["_id"] for document in documents], True)
+
+    def _update(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool, multi: bool) -> Dict[str, Any]:
+        matched = self._select(query)
+        if not multi:
+            matched = matched[:1]
+        if not matched:
+            if not upsert:
+                return {"n": 0, "nModified": 0}
+            document = _apply_update(_upsert_seed(query), update, inserting=True)
+            document.setdefault("_id", ObjectId())
+            self._store(document)
+            return {"n": 1, "nModified": 0, "upserted": document["_id"]}
+        modified = 0
+        for current in matched:
+            updated = _apply_update(current, update, inserting=False)
+            if updated != current:
+                self._replace(current, updated)
+                modified += 1
+        return {"n": len(matched), "nModified": modified}
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    async def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    async def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False), True)
+
+    async def find_one_and_update(self, filter: Dict[str, Any], update: Dict[str, Any], projection: Optional[Dict[str, Any]] = None,
+                                  sort=None, upsert: bool = False, return_document: bool = ReturnDocument.BEFORE, **kwargs):
+        current = self._first(filter, sort)
+        if current is None:
+            if not upsert:
+                return None
+            document = _apply_update(_upsert_seed(filter), update, inserting=True)
+            document.setdefault("_id", ObjectId())
+            self._store(document)
+            return _clone(project(document, projection)) if return_document == ReturnDocument.AFTER else None
+        updated = _apply_update(current, update, inserting=False)
+        if updated != current:
+            self._replace(current, updated)
+        result = updated if return_document == ReturnDocument.AFTER else current
+        return _clone(project(result, projection))
+
+    async def find_one_and_delete(self, filter: Dict[str, Any], projection: Optional[Dict[str, Any]] = None, sort=None, **kwargs):
+        current = self._first(filter, sort)
+        if current is None:
+            return None
+        self._remove(current)
+        return project(current, projection)
+
+    def _delete(self, query: Dict[str, Any], multi: bool) -> int:
+        matched = self._select(query)
+        if not multi:
+            matched = matched[:1]
+        for document in matched:
+            self._remove(document)
+        return len(matched)
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=False)}, True)
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=True)}, True)
+
+    @staticmethod
+    def _bulk_details(**counts) -> Dict[str, Any]:
+        details = {"writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                   "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        details.update(counts)
+        return details
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        details = self._bulk_details()
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    document = request._doc
+                    document.setdefault("_id", ObjectId())
+                    self._store(_clone(document))
+                    details["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    result = self._update(request._filter, request._doc, request._upsert, multi=isinstance(request, UpdateMany))
+                    if "upserted" in result:
+                        details["nUpserted"] += 1
+                        details["upserted"].append({"index": index, "_id": result["upserted"]})
+                    else:
+                        details["nMatched"] += result["n"]
+                        details["nModified"] += result["nModified"]
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    details["nRemoved"] += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+                else:
+                    raise TypeError(f"{request!r} is not a valid request")
+            except OperationFailure as e:
+                details["writeErrors"].append({"index": index, "code": e.code, "errmsg": str(e), "op": request})
+                if ordered:
+                    break
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return BulkWriteResult(details, True)
+
+    # ---- indexes ----
+    async def create_indexes(self, indexes: List[IndexModel], **kwargs) -> List[str]:
+        names = []
+        for model in indexes:
+            spec = dict(model.document)
+            name = spec["name"]
+            names.append(name)
+            if name in self._indexes:
+                continue
+            if spec.get("unique"):
+                values = {}
+                for document in self._documents.values():
+                    key = tuple(_hashable(_get_path(document, field)[1]) for field in spec["key"])
+                    if key in values:
+                        raise OperationFailure(f"Index build failed: E11000 duplicate key error collection: {self.name} index: {name}", DUPLICATE_KEY)
+                    values[key] = document["_id"]
+                self._unique[name] = values
+            self._indexes[name] = spec
+            self._rebuild_lookups()
+        return names
+
+    async def create_index(self, keys, **kwargs) -> str:
+        return (await self.create_indexes([IndexModel(keys, **kwargs)]))[0]
+
+    async def drop_index(self, name: str, **kwargs):
+        if name not in self._indexes:
+            raise OperationFailure(f"index not found with name [{name}]", INDEX_NOT_FOUND)
+        del self._indexes[name]
+        self._unique.pop(name, None)
+        self._rebuild_lookups()
+
+    async def index_information(self) -> Dict[str, Dict[str, Any]]:
+        information = {"_id_": {"key": [("_id", 1)]}}
+        for name, spec in self._indexes.items():
+            information[name] = {**{key: value for key, value in spec.items() if key != "name"}, "key": list(spec["key"].items())}
+        return information
+
+    def _rebuild_lookups(self):
+        lookups = set()
+        for spec in self._indexes.values():
+            keys = tuple(spec["key"])
+            lookups.update({keys[:1], keys})
+        lookups.discard(("_id",))
+        self._lookups = {fields: {} for fields in sorted(lookups, key=len, reverse=True)}
+        self._arrays = {fields: {} for fields in self._lookups}
+        for name, values in self._unique.items():
+            values.clear()
+        for document in self._documents.values():
+            self._register(document)
+
+    async def drop(self):
+        self._documents.clear()
+        self._sequence.clear()
+        self._arrays.clear()
+        self._indexes.clear()
+        self._lookups.clear()
+        self._unique.clear()
+
+class MemoryDatabase:
+    """Collections are created on first access, like Mongo's"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def get_collection(self, name: str) -> MemoryCollection:
+        return self[name]
+
+    async def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    async def drop_collection(self, name: str):
+        self._collections.pop(name, None)
+
+class MemoryClient:
+    """Stand-in for AsyncIOMotorClient; databases live as long as the client"""
+
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    def get_database(self, name: str) -> MemoryDatabase:
+        return self[name]
+
+    async def drop_database(self, name: str):
+        self._databases.pop(name, None)
+
+    def close(self):
+        pass
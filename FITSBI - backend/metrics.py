@@ -0,0 +1,279 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bucket upper bounds in seconds; Prometheus adds +Inf itself
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metric:
+    """One named metric family; `labels(...)` hands out a child per label combination.
+
+    Children are cached, so the hot path is a dict lookup plus an add. Updates
+    happen on the event loop and are not locked.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            key = tuple(str(value) for value in values)
+            child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_number(child.value)}"
+                for key, child in self._children.items()]
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+class _Timer:
+    """`with histogram.labels(...).time():` observes the block's duration in seconds"""
+
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                labels = _label_text(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_number(child.sum)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Gauge(Metric):
+    """A value read from `function` at scrape time, e.g. a cache size; nothing is stored"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_number(self.function())}"]
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, documentation, function))
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# ============ APP METRICS ============
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time from request start to the last body byte, by route template",
+    ["method", "route", "status"])
+HTTP_REQUEST_MONGO_OPERATIONS = REGISTRY.histogram(
+    "http_request_mongo_operations", "Mongo round trips made while serving one request",
+    ["method", "route"], buckets=COUNT_BUCKETS)
+MONGO_OPERATIONS = REGISTRY.counter(
+    "mongo_operations_total", "Mongo operations issued through MongoDB.get_collection",
+    ["collection", "operation"])
+CHAT_STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_duration_seconds", "Duration of each stage of a chat turn", ["stage"])
+CHAT_PROMPT_TOKENS = REGISTRY.histogram(
+    "chat_prompt_tokens", "Estimated prompt size of each chat turn after budgeting", buckets=TOKEN_BUCKETS)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_request_duration_seconds", "LLM call duration including retries, by call site", ["call_site", "outcome"])
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "Tokens billed by the LLM provider, by call site", ["call_site", "kind"])
+JOB_SECONDS = REGISTRY.histogram(
+    "job_duration_seconds", "Background job run time", ["kind", "outcome"])
+SINGLE_FLIGHT_SHARED = REGISTRY.counter(
+    "single_flight_shared_total", "Duplicate chat turns served another call's reply: joined in-process (task) or read from Mongo (lease)",
+    ["source"])
+TURN_LOCK_WAIT_SECONDS = REGISTRY.histogram(
+    "turn_lock_wait_seconds", "Time a chat turn waited for the same user's earlier turns")
+
+# ============ PER-REQUEST MONGO ROUND TRIPS ============
+# A one-element list per request; tasks spawned by the request copy the
+# context, so their operations land in the same cell
+_request_mongo_operations: ContextVar[Optional[List[int]]] = ContextVar("request_mongo_operations", default=None)
+
+def start_request_mongo_count():
+    return _request_mongo_operations.set([0])
+
+def finish_request_mongo_count(token) -> int:
+    cell = _request_mongo_operations.get()
+    _request_mongo_operations.reset(token)
+    return cell[0] if cell else 0
+
+# Collection methods that talk to the server; find/aggregate count when the cursor is created
+ROUND_TRIP_METHODS = frozenset([
+    "find", "find_one", "count_documents", "estimated_document_count", "distinct", "aggregate",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete", "bulk_write",
+    "create_index", "create_indexes", "drop_index", "index_information", "drop",
+])
+
+class InstrumentedCollection:
+    """Wraps a collection so every server operation is counted, globally and for the current request"""
+
+    __slots__ = ("_collection", "_name")
+
+    def __init__(self, collection, name: str):
+        self._collection = collection
+        self._name = name
+
+    def __getattr__(self, attribute: str):
+        value = getattr(self._collection, attribute)
+        if attribute not in ROUND_TRIP_METHODS:
+            return value
+        counter = MONGO_OPERATIONS.labels(self._name, attribute)
+
+        def counted(*args, **kwargs):
+            counter.inc()
+            cell = _request_mongo_operations.get()
+            if cell is not None:
+                cell[0] += 1
+            return value(*args, **kwargs)
+        return counted
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request and counting its Mongo round trips.
+
+    Requests are labelled by route template (`/users/{user_id}`), not the raw
+    path, so the label set stays bounded; unmatched paths share one label.
+    Streaming responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        token = start_request_mongo_count()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            operations = finish_request_mongo_count(token)
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status_code[0])).observe(elapsed)
+            HTTP_REQUEST_MONGO_OPERATIONS.labels(scope["method"], route).observe(operations)
@@ -0,0 +1,243 @@
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from log_config import get_logger
+from rollups import progress_delta, rollup_updates
+
+logger = get_logger(__name__)
+
+# ============ INDEX DEFINITIONS ============
+# Every hot query in MongoDB should be served by one of these. create_indexes
+# is a no-op for an index that already exists with the same spec, so they are
+# safe to apply on every startup.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "chat_history": [
+        # Keyset pagination walks (timestamp, _id); the prefix still serves plain timestamp scans
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="user_timestamp_id"),
+    ],
+    "daily_summaries": [
+        IndexModel([("user_id", ASCENDING), ("date", DESCENDING)], name="user_date_unique", unique=True),
+    ],
+    "user_summaries": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "daily_progress": [
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING)], name="user_date_unique", unique=True),
+    ],
+    "conversation_rollups": [
+        IndexModel([("user_id", ASCENDING), ("period", ASCENDING), ("start", ASCENDING)], name="user_period_start"),
+    ],
+    "progress_trends": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("computed_at", ASCENDING)], name="computed_at_ttl", expireAfterSeconds=24 * 3600),
+    ],
+    "plan_cache": [
+        IndexModel([("user_id", ASCENDING), ("plan_type", ASCENDING), ("fingerprint", ASCENDING)], name="user_plan_fingerprint", unique=True),
+        IndexModel([("user_id", ASCENDING), ("plan_type", ASCENDING), ("last_accessed", DESCENDING)], name="user_plan_lru"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("run_after", ASCENDING)], name="status_run_after"),
+        # Finished jobs only matter for same-day dedup, so let Mongo reap them
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=2 * 24 * 3600),
+    ],
+    "leases": [
+        # Expiry is checked on every acquire; this only clears out abandoned keys
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=3600),
+    ],
+}
+
+# ============ DATA MIGRATIONS ============
+async def dedupe_daily_summaries(db):
+    """Keep only the newest daily summary per (user_id, date) so the unique index can build"""
+    pipeline = [
+        {"$sort": {"created_at": -1}},
+        {"$group": {"_id": {"user_id": "$user_id", "date": "$date"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    removed = 0
+    async for group in db["daily_summaries"].aggregate(pipeline):
+        result = await db["daily_summaries"].delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += result.deleted_count
+    logger.info("Removed %d duplicate daily summaries", removed)
+
+async def dedupe_user_summaries(db):
+    """Keep only the highest summary_version per user so the unique index can build"""
+    pipeline = [
+        {"$sort": {"summary_version": -1}},
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    removed = 0
+    async for group in db["user_summaries"].aggregate(pipeline):
+        result = await db["user_summaries"].delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += result.deleted_count
+    logger.info("Removed %d duplicate user summaries", removed)
+
+async def report_duplicate_emails(db):
+    """Duplicate accounts are never deleted automatically; list them so they can be merged by hand"""
+    pipeline = [
+        {"$group": {"_id": "$email", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    async for group in db["users"].aggregate(pipeline):
+        logger.warning("Duplicate accounts for %s: %s", group["_id"], [str(i) for i in group["ids"]])
+
+async def replace_chat_history_index(db):
+    """Build user_timestamp_id before dropping the user_timestamp index it supersedes"""
+    await db["chat_history"].create_indexes(INDEXES["chat_history"])
+    try:
+        await db["chat_history"].drop_index("user_timestamp")
+    except OperationFailure:
+        pass  # Never created on this database
+
+async def clear_oauth_placeholder_passwords(db):
+    """Google accounts were created with a hash of a shared placeholder password; remove it so it can't be used to sign in"""
+    result = await db["users"].update_many(
+        {"provider": "google", "password": {"$type": "string"}},
+        {"$set": {"password": None}}
+    )
+    logger.info("Cleared placeholder passwords on %d Google accounts", result.modified_count)
+
+async def dedupe_daily_progress(db):
+    """Merge each (user_id, date)'s progress documents into the oldest, then make user_date unique.
+
+    Later documents' values win field by field. Existing rollups are moved by
+    the difference, so they count the merged day once; missing ones are left
+    to backfill_rollups.py.
+    """
+    pipeline = [
+        {"$group": {"_id": {"user_id": "$user_id", "date": "$date"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    collection = db["daily_progress"]
+    removed = 0
+    async for group in collection.aggregate(pipeline):
+        documents = await collection.find({"_id": {"$in": group["ids"]}}).sort("_id", ASCENDING).to_list(length=None)
+        keep, *duplicates = documents
+        merged = dict(keep)
+        for document in duplicates:
+            merged.update({field: value for field, value in document.items() if field != "_id" and value is not None})
+        await collection.replace_one({"_id": keep["_id"]}, merged)
+        result = await collection.delete_many({"_id": {"$in": [document["_id"] for document in duplicates]}})
+        removed += result.deleted_count
+        delta = progress_delta(documents, merged)
+        if delta:
+            updates = rollup_updates(merged["user_id"], merged["date"], delta)
+            await db["conversation_rollups"].bulk_write([UpdateOne(query, update) for query, update in updates], ordered=False)
+    logger.info("Removed %d duplicate progress entries", removed)
+    try:
+        await collection.drop_index("user_date")
+    except OperationFailure:
+        pass  # Never created on this database
+    # Same keys as user_date, so it can only be built once that is gone
+    await collection.create_indexes(INDEXES["daily_progress"])
+
+# Applied in order, each at most once; progress is recorded in `schema_migrations`
+MIGRATIONS = [
+    ("0001_dedupe_daily_summaries", dedupe_daily_summaries),
+    ("0002_dedupe_user_summaries", dedupe_user_summaries),
+    ("0003_report_duplicate_emails", report_duplicate_emails),
+    ("0004_replace_chat_history_index", replace_chat_history_index),
+    ("0005_clear_oauth_placeholder_passwords", clear_oauth_placeholder_passwords),
+    ("0006_dedupe_daily_progress", dedupe_daily_progress),
+]
+
+async def apply_migrations(db) -> List[str]:
+    applied = {doc["_id"] async for doc in db["schema_migrations"].find({}, {"_id": 1})}
+    newly_applied = []
+    for migration_id, migration in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        await migration(db)
+        await db["schema_migrations"].update_one(
+            {"_id": migration_id},
+            {"$set": {"applied_at": datetime.utcnow()}},
+            upsert=True
+        )
+        newly_applied.append(migration_id)
+    return newly_applied
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create every declared index; a failure on one collection doesn't block the others"""
+    created = {}
+    for collection_name, indexes in INDEXES.items():
+        try:
+            created[collection_name] = await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            logger.error("Could not build indexes on %s: %s", collection_name, e)
+    return created
+
+async def run_migrations(db):
+    """Idempotent startup bootstrap: pending data migrations first, then indexes"""
+    newly_applied = await apply_migrations(db)
+    if newly_applied:
+        logger.info("Applied migrations: %s", ", ".join(newly_applied))
+    await ensure_indexes(db)
+
+# ============ QUERY PLAN CHECKS ============
+def _hot_queries() -> List[Dict[str, Any]]:
+    """Representative shapes of the queries MongoDB issues on the request path"""
+    now = datetime.utcnow()
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    user_id = "000000000000000000000000"
+    return [
+        {"collection": "users", "filter": {"email": "someone@example.com"}},
+        {"collection": "chat_history", "filter": {"user_id": user_id, "timestamp": {"$gte": now - timedelta(days=7)}}, "sort": [("timestamp", -1)]},
+        {"collection": "chat_history", "filter": {"user_id": user_id, "timestamp": {"$gte": day, "$lt": day + timedelta(days=1)}}, "sort": [("timestamp", 1)]},
+        {"collection": "chat_history", "filter": {"user_id": user_id, "$or": [{"timestamp": {"$lt": now}}, {"timestamp": now, "_id": {"$lt": ObjectId()}}]}, "sort": [("timestamp", -1), ("_id", -1)]},
+        {"collection": "daily_summaries", "filter": {"user_id": user_id, "date": day}},
+        {"collection": "daily_summaries", "filter": {"user_id": user_id, "date": {"$gte": now - timedelta(days=7)}}, "sort": [("date", -1)]},
+        {"collection": "user_summaries", "filter": {"user_id": user_id}},
+        {"collection": "daily_progress", "filter": {"user_id": user_id, "date": {"$gte": now - timedelta(days=30), "$lte": now}}, "sort": [("date", 1)]},
+        {"collection": "conversation_rollups", "filter": {"user_id": user_id, "period": "day", "start": {"$gte": day - timedelta(days=30)}}, "sort": [("start", 1)]},
+        {"collection": "plan_cache", "filter": {"user_id": user_id, "plan_type": "workout", "fingerprint": "0" * 64, "expires_at": {"$gt": now}}},
+        {"collection": "jobs", "filter": {"status": "pending", "run_after": {"$lte": now}}, "sort": [("run_after", 1)]},
+    ]
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return [stage for stage in stages if stage]
+
+async def find_collection_scans(db) -> List[Dict[str, Any]]:
+    """Explain every hot query and return the ones whose winning plan is a COLLSCAN"""
+    offenders = []
+    for query in _hot_queries():
+        cursor = db[query["collection"]].find(query["filter"])
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+        explain = await cursor.explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        if "COLLSCAN" in stages:
+            offenders.append({**query, "stages": stages})
+    return offenders
+
+if __name__ == "__main__":
+    # Exits non-zero when a hot query falls back to a collection scan. CI gets
+    # the same check from `load_test.py --storage motor`, against a scratch
+    # database on a local mongod; this entry point checks MONGODB_URL's.
+    import asyncio
+    import sys
+    from mongodb import MongoDB
+
+    async def check():
+        await MongoDB.connect_to_database()
+        try:
+            offenders = await find_collection_scans(MongoDB.db)
+        finally:
+            await MongoDB.close_database_connection()
+        for offender in offenders:
+            print(f"❌ COLLSCAN on {offender['collection']} for {offender['filter']}: {offender['stages']}")
+        return not offenders
+
+    sys.exit(0 if asyncio.run(check()) else 1)
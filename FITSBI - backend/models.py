@@ -129,6 +129,24 @@ class DailyProgress(BaseModel):
     energy_level: Optional[int]  # 1-10 scale
     notes: Optional[str]
 
+class ProgressIngestRecord(BaseModel):
+    """One day of tracker/wearable data in a bulk upload; only the fields present are written"""
+    date: datetime
+    weight: Optional[float] = Field(default=None, gt=0, lt=700)  # in kg
+    calories_consumed: Optional[int] = Field(default=None, ge=0)
+    calories_burned: Optional[int] = Field(default=None, ge=0)
+    workout_duration: Optional[int] = Field(default=None, ge=0)  # in minutes
+    workout_type: Optional[str] = None
+    steps: Optional[int] = Field(default=None, ge=0)
+    water_intake: Optional[float] = Field(default=None, ge=0)  # in liters
+    sleep_hours: Optional[float] = Field(default=None, ge=0, le=24)
+    sleep_quality: Optional[SleepQuality] = None
+    mood: Optional[str] = None
+    stress_level: Optional[StressLevel] = None
+    energy_level: Optional[int] = Field(default=None, ge=1, le=10)  # 1-10 scale
+    notes: Optional[str] = None
+    source: Optional[str] = None  # device or app the record was synced from
+
 class DailySummary(BaseModel):
     user_id: str
     date: datetime
@@ -0,0 +1,55 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from passlib.context import CryptContext
+
+class HasherBusy(Exception):
+    """Too many hash/verify calls are already waiting; the caller should shed the request"""
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop on a small dedicated thread pool.
+
+    A bcrypt hash or verify is ~100 ms of CPU. bcrypt releases the GIL
+    while it works, so threads keep the loop free for chat traffic, and the
+    pool size caps how many cores logins can take at once. At most
+    `max_pending` calls may wait for a thread; beyond that calls fail fast
+    with HasherBusy instead of queueing unboundedly during a login storm.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None):
+        self.workers = workers or int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+        self.max_pending = max_pending or int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self.context.verify, password, hashed)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+StageFn = Callable[[Dict[str, Any]], Awaitable[Any]]
+TimingHook = Callable[[str, float], None]
+
+class StageGraph:
+    """Run the stages of a chat turn as a dependency graph.
+
+    Each stage is an async function that receives the results of the stages
+    it depends on (keyed by stage name). Every stage starts as soon as its
+    dependencies finish, so independent stages overlap. Stages must be added
+    after their dependencies, which rules out cycles by construction.
+
+    With `sequential=True` stages run one at a time in insertion order, which
+    is how the turn ran before and is kept for benchmarking the difference.
+    """
+
+    def __init__(self, sequential: bool = False, on_stage_done: Optional[TimingHook] = None):
+        self.sequential = sequential
+        self.on_stage_done = on_stage_done
+        self._stages: Dict[str, Any] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self._started_at = None
+
+    def add(self, name: str, fn: StageFn, deps: Iterable[str] = ()):
+        deps = list(deps)
+        if name in self._stages:
+            raise ValueError(f"Stage {name} is already defined")
+        unknown = [dep for dep in deps if dep not in self._stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on undefined stages: {unknown}")
+        self._stages[name] = (fn, deps)
+        return self
+
+    async def _run_stage(self, name: str) -> Any:
+        fn, deps = self._stages[name]
+        if deps:
+            await asyncio.gather(*(self._tasks[dep] for dep in deps))
+        started = time.perf_counter()
+        result = await fn({dep: self.results[dep] for dep in deps})
+        finished = time.perf_counter()
+        self.results[name] = result
+        self.timings[name] = {
+            "start_ms": (started - self._started_at) * 1000,
+            "duration_ms": (finished - started) * 1000,
+        }
+        if self.on_stage_done:
+            self.on_stage_done(name, finished - started)
+        return result
+
+    async def run(self, targets: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Start every stage and return once `targets` (default: all stages) are done.
+
+        Stages outside `targets` keep running in the background; call wait()
+        before relying on them. If a target fails, everything still pending is
+        cancelled and the error is raised.
+        """
+        self._started_at = time.perf_counter()
+        if self.sequential:
+            for name in self._stages:
+                self._tasks[name] = asyncio.ensure_future(self._run_stage(name))
+                await self._tasks[name]
+            return self.results
+
+        for name in self._stages:
+            self._tasks[name] = asyncio.create_task(self._run_stage(name))
+        try:
+            await asyncio.gather(*(self._tasks[name] for name in (targets or self._stages)))
+        except BaseException:
+            self.cancel()
+            raise
+        return self.results
+
+    async def wait(self) -> Dict[str, Any]:
+        """Wait for every stage, including ones still running after run(targets=...)"""
+        try:
+            await asyncio.gather(*self._tasks.values())
+        except BaseException:
+            self.cancel()
+            raise
+        return self.results
+
+    def cancel(self):
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
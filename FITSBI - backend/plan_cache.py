@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List
+
+# Profile fields that change what a generated plan should contain. Anything
+# else (name, timestamps, profile_completion, ...) is left out of the
+# fingerprint so unrelated profile writes keep the cached plan valid.
+PLAN_FIELDS: Dict[str, List[str]] = {
+    "workout": [
+        "age", "gender", "weight", "height", "target_weight", "fitness_goals",
+        "activity_level", "workout_frequency", "preferred_workout_duration",
+        "preferred_workout_time", "medical_conditions", "injuries",
+        "physical_limitations", "available_equipment", "gym_access",
+        "home_workout_space", "sleep_hours", "stress_level",
+    ],
+    "diet": [
+        "age", "gender", "weight", "height", "target_weight", "fitness_goals",
+        "activity_level", "workout_frequency", "medical_conditions", "medications",
+        "dietary_restrictions", "food_allergies", "preferred_diet_type",
+        "daily_water_goal", "location", "climate", "budget_for_fitness",
+    ],
+}
+
+PLAN_CACHE_TTL = timedelta(hours=float(os.getenv("PLAN_CACHE_TTL_HOURS", "168")))
+PLAN_CACHE_MAX_PER_USER = int(os.getenv("PLAN_CACHE_MAX_PER_USER", "3"))  # LRU bound per (user, plan type)
+
+def _normalize(value: Any) -> Any:
+    """Make equivalent profile values hash the same ("Squats" vs "squats", list order, 70 vs 70.0)"""
+    if isinstance(value, str):
+        return value.strip().lower()
+    if isinstance(value, (list, tuple, set)):
+        return sorted(_normalize(item) for item in value)
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), 1)
+    return str(value)
+
+def plan_fingerprint(plan_type: str, user: Dict[str, Any]) -> str:
+    """Stable hash of the profile fields that affect `plan_type`"""
+    relevant = {
+        field: _normalize(user.get(field))
+        for field in PLAN_FIELDS[plan_type]
+        if user.get(field) not in (None, [], "")
+    }
+    payload = json.dumps({"plan_type": plan_type, "profile": relevant}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def affected_plan_types(changed_fields: Iterable[str]) -> List[str]:
+    """Plan types whose cached entries a profile write to `changed_fields` invalidates"""
+    changed = set(changed_fields)
+    return [plan_type for plan_type, fields in PLAN_FIELDS.items() if changed.intersection(fields)]
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+class PrincipalCache:
+    """In-process LRU cache of verified bearer token -> authenticated user.
+
+    An entry lives until the earlier of the token's `exp` and `ttl` seconds,
+    and is dropped as soon as MongoDB reports a change to its user, so a hit
+    skips both the JWT decode and the user lookup. Other workers only learn
+    of a change when their own entry expires, which `ttl` bounds.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = max_entries or int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (principal, user_id, expires_at)
+        self._keys_by_user: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        # Hashed so raw bearer tokens never sit in process memory longer than the request
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        principal, user_id, expires_at = entry
+        if expires_at <= time.time():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(principal)
+
+    def put(self, token: str, principal: Dict[str, Any], user_id: str, token_expires_at: Optional[float] = None):
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        key = self._key(token)
+        self._remove(key)
+        self._entries[key] = (dict(principal), user_id, expires_at)
+        self._keys_by_user.setdefault(user_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: str):
+        """Forget every token of `user_id`; registered with MongoDB as a user-change listener"""
+        keys = self._keys_by_user.pop(str(user_id), set())
+        for key in keys:
+            self._entries.pop(key, None)
+        self.invalidations += len(keys)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._keys_by_user.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_user[entry[1]]
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+principal_cache = PrincipalCache()
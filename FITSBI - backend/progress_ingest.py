@@ -0,0 +1,118 @@
+import json
+from datetime import timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from models import ProgressIngestRecord
+from mongodb import MongoDB
+from rollups import day_start
+
+INGEST_BATCH_SIZE = 1000  # Records validated and written per bulk_write
+MAX_LINE_BYTES = 64 * 1024
+MAX_REPORTED_ERRORS = 100  # The rest are only counted
+
+async def ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """(line number, line) for each non-blank line of a streamed body; None marks a line over MAX_LINE_BYTES"""
+    buffer = b""
+    line_number = 0
+    skipping = False  # Inside an oversized line that was already reported
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if skipping:
+                skipping = False  # This is the oversized line's tail
+                continue
+            line_number += 1
+            if line.strip():
+                yield line_number, line if len(line) <= MAX_LINE_BYTES else None
+        if len(buffer) > MAX_LINE_BYTES and not skipping:
+            line_number += 1
+            yield line_number, None
+            skipping = True
+        if skipping:
+            buffer = b""  # Keep memory bounded until the line ends
+    if buffer.strip() and not skipping:
+        yield line_number + 1, buffer
+
+def parse_record(line: bytes) -> Dict[str, Any]:
+    """Validate one NDJSON line into the fields to $set for its day; raises ValueError"""
+    try:
+        raw = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e.msg}")
+    try:
+        record = ProgressIngestRecord.model_validate(raw)
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+
+    fields = record.model_dump(exclude_none=True, mode="json")
+    date = record.date
+    if date.tzinfo:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    fields["date"] = day_start(date)
+    return fields
+
+class IngestReport:
+    def __init__(self):
+        self.received = 0
+        self.upserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def error(self, line_number: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "upserted": self.upserted,
+            "updated": self.updated,
+            "failed": self.error_count,
+            "errors": self.errors,
+            "errors_truncated": self.error_count > len(self.errors),
+        }
+
+async def _write_batch(user_id: str, batch: List[Tuple[int, Dict[str, Any]]], report: IngestReport):
+    # Several records for one day are merged (later lines win) so the batch holds one upsert per day
+    days: Dict[Any, Dict[str, Any]] = {}
+    lines: Dict[Any, List[int]] = {}
+    for line_number, fields in batch:
+        days.setdefault(fields["date"], {}).update(fields)
+        lines.setdefault(fields["date"], []).append(line_number)
+
+    ordered_days = list(days)
+    result = await MongoDB.upsert_progress_days(user_id, [days[day] for day in ordered_days])
+    report.upserted += result["upserted"]
+    report.updated += result["modified"]
+    for index, message in result["errors"].items():
+        for line_number in lines[ordered_days[index]]:
+            report.error(line_number, message)
+
+async def ingest_progress(user_id: str, chunks: AsyncIterator[bytes], batch_size: int = INGEST_BATCH_SIZE) -> Dict[str, Any]:
+    """Validate and upsert a streamed NDJSON upload in batches.
+
+    Bad records are reported by line number and never stop the upload.
+    Each batch moves the rollups by what its upserts changed, so they stay
+    correct while the user keeps writing.
+    """
+    report = IngestReport()
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    async for line_number, line in ndjson_lines(chunks):
+        report.received += 1
+        if line is None:
+            report.error(line_number, f"line longer than {MAX_LINE_BYTES} bytes")
+            continue
+        try:
+            batch.append((line_number, parse_record(line)))
+        except ValueError as e:
+            report.error(line_number, str(e))
+            continue
+        if len(batch) >= batch_size:
+            await _write_batch(user_id, batch, report)
+            batch = []
+    if batch:
+        await _write_batch(user_id, batch, report)
+    return report.as_dict()
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+
+# Series pulled out of daily_progress documents, one float64 column each
+SERIES_FIELDS = ["weight", "calories_consumed", "calories_burned", "sleep_hours", "energy_level", "steps", "workout_duration"]
+ROLLING_WINDOWS = (7, 30)
+KCAL_PER_KG = 7700  # Energy in a kilogram of body fat, for the calorie-balance estimate
+EPOCH = datetime(1970, 1, 1)
+
+def load_columns(documents: Iterable[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Columnar arrays from progress documents: `day` (days since epoch) plus one column per series, NaN where missing"""
+    rows = [
+        [(document["date"] - EPOCH).days] + [_number(document.get(field)) for field in SERIES_FIELDS]
+        for document in documents
+    ]
+    table = np.array(rows, dtype=np.float64).reshape(-1, len(SERIES_FIELDS) + 1)
+    columns = {"day": table[:, 0].astype(np.int64)}
+    for index, field in enumerate(SERIES_FIELDS, start=1):
+        columns[field] = table[:, index]
+    return columns
+
+def _number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+def daily_grid(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Reindex onto one row per calendar day from first to last entry.
+
+    Days with several entries are averaged per series (ignoring gaps); days
+    with none are NaN, so windows below are measured in calendar days.
+    """
+    days = columns["day"]
+    first = days.min()
+    slot = days - first
+    size = int(slot.max()) + 1
+    grid = {"day": np.arange(first, first + size)}
+    for field in SERIES_FIELDS:
+        values = columns[field]
+        present = ~np.isnan(values)
+        sums = np.bincount(slot[present], weights=values[present], minlength=size)
+        counts = np.bincount(slot[present], minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            grid[field] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return grid
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over `window` calendar days, skipping gaps; NaN where the window is empty"""
+    present = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    upper = np.arange(1, len(values) + 1)
+    lower = np.maximum(upper - window, 0)
+    window_counts = counts[upper] - counts[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_counts > 0, (sums[upper] - sums[lower]) / np.maximum(window_counts, 1), np.nan)
+
+def linear_trend(days: np.ndarray, values: np.ndarray) -> Optional[Dict[str, float]]:
+    """Least-squares slope (per week) and fit of `values` over `days`; None with fewer than 3 points"""
+    present = ~np.isnan(values)
+    if present.sum() < 3:
+        return None
+    x = days[present].astype(np.float64)
+    y = values[present]
+    x_mean, y_mean = x.mean(), y.mean()
+    x_var = np.square(x - x_mean).sum()
+    if x_var == 0:
+        return None
+    slope = ((x - x_mean) * (y - y_mean)).sum() / x_var
+    intercept = y_mean - slope * x_mean
+    residual = np.square(y - (slope * x + intercept)).sum()
+    total = np.square(y - y_mean).sum()
+    return {
+        "per_week": float(slope * 7),
+        "r_squared": float(1 - residual / total) if total > 0 else 1.0,
+        "points": int(present.sum()),
+        "start": float(slope * x[0] + intercept),
+        "end": float(slope * x[-1] + intercept),
+    }
+
+def correlation(a: np.ndarray, b: np.ndarray) -> Optional[float]:
+    """Pearson correlation over the days where both series have a value"""
+    present = ~np.isnan(a) & ~np.isnan(b)
+    if present.sum() < 3:
+        return None
+    a, b = a[present], b[present]
+    if a.std() == 0 or b.std() == 0:
+        return None
+    return float(np.corrcoef(a, b)[0, 1])
+
+def calorie_balance(grid: Dict[str, np.ndarray]) -> Optional[Dict[str, float]]:
+    balance = grid["calories_consumed"] - grid["calories_burned"]
+    logged = ~np.isnan(balance)
+    if not logged.any():
+        return None
+    total = float(balance[logged].sum())
+    return {
+        "days_logged": int(logged.sum()),
+        "mean_daily": float(balance[logged].mean()),
+        "total": total,
+        "estimated_weight_change_kg": total / KCAL_PER_KG,
+    }
+
+def _to_list(values: np.ndarray, digits: int = 2) -> List[Optional[float]]:
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
+
+def compute_trends(documents: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rolling averages, weight trend, calorie balance and sleep/energy correlations for a progress history"""
+    columns = load_columns(documents)
+    if not len(columns["day"]):
+        return {"days": 0}
+    grid = daily_grid(columns)
+    days = grid["day"]
+
+    recent = days >= days[-1] - 89
+    next_day_energy = np.append(grid["energy_level"][1:], np.nan)
+    return {
+        "days": int(len(days)),
+        "start": (EPOCH + timedelta(days=int(days[0]))).strftime("%Y-%m-%d"),
+        "end": (EPOCH + timedelta(days=int(days[-1]))).strftime("%Y-%m-%d"),
+        "weight_trend": {
+            "overall": linear_trend(days, grid["weight"]),
+            "last_90_days": linear_trend(days[recent], grid["weight"][recent]),
+        },
+        "calorie_balance": calorie_balance(grid),
+        "correlations": {
+            "sleep_vs_energy": correlation(grid["sleep_hours"], grid["energy_level"]),
+            "sleep_vs_next_day_energy": correlation(grid["sleep_hours"], next_day_energy),
+            "steps_vs_energy": correlation(grid["steps"], grid["energy_level"]),
+        },
+        "rolling": {
+            f"{field}_{window}d": _to_list(rolling_mean(grid[field], window))
+            for field in ("weight", "calories_consumed", "sleep_hours", "steps")
+            for window in ROLLING_WINDOWS
+        },
+    }
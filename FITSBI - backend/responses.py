@@ -0,0 +1,27 @@
+from typing import Any
+import orjson
+from bson import ObjectId
+from fastapi.responses import Response
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def _default(value: Any):
+    # orjson encodes datetime, date, enums and numpy natively; only BSON types need help
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+class FastJSONResponse(Response):
+    """JSON response encoded by orjson.
+
+    Endpoints that return an instance of this directly skip FastAPI's
+    jsonable_encoder pass, which otherwise walks every document a second
+    time after serialize_document.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
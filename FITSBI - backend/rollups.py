@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Per-user counters kept in `conversation_rollups`, one document per
+# (user, period, period start). Live writes $inc them; rebuilds recompute
+# them from the raw collections with the same increment functions below.
+PERIODS = ("day", "week")
+
+# Progress fields summed per period; averages are sum / count
+PROGRESS_METRICS = [
+    "weight", "calories_consumed", "calories_burned", "workout_duration",
+    "steps", "water_intake", "sleep_hours", "energy_level",
+]
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def period_start(period: str, moment: datetime) -> datetime:
+    """Start of the day, or of the ISO week (Monday), containing `moment`"""
+    start = day_start(moment)
+    if period == "week":
+        start -= timedelta(days=start.weekday())
+    return start
+
+def rollup_key(user_id: str, period: str, start: datetime) -> str:
+    return f"{user_id}:{period}:{start.strftime('%Y-%m-%d')}"
+
+def message_increments(message: Dict[str, Any]) -> Dict[str, int]:
+    increments = {"message_count": 1}
+    if message.get("role") == "user":
+        increments["user_messages"] = 1
+    elif message.get("role") == "assistant":
+        increments["assistant_messages"] = 1
+    if message.get("interrupted"):
+        increments["interrupted_messages"] = 1
+    for field in (message.get("extracted_data") or {}):
+        increments[f"extracted_fields.{field}"] = 1
+    return increments
+
+def progress_increments(progress: Dict[str, Any]) -> Dict[str, float]:
+    increments = {"progress.entries": 1}
+    for metric in PROGRESS_METRICS:
+        value = progress.get(metric)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            increments[f"progress.{metric}_sum"] = value
+            increments[f"progress.{metric}_count"] = 1
+    if progress.get("workout_duration"):
+        increments["progress.workouts"] = 1
+    return increments
+
+def progress_delta(replaced: Iterable[Dict[str, Any]], progress: Dict[str, Any]) -> Dict[str, float]:
+    """Increments that move the rollups from counting the `replaced` documents to counting `progress`"""
+    delta = dict(progress_increments(progress))
+    for document in replaced:
+        for path, amount in progress_increments(document).items():
+            delta[path] = delta.get(path, 0) - amount
+    return {path: amount for path, amount in delta.items() if amount}
+
+def rollup_updates(user_id: str, moment: datetime, increments: Dict[str, float]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(filter, update) pairs that $inc the day and week rollups containing `moment`"""
+    updates = []
+    for period in PERIODS:
+        start = period_start(period, moment)
+        updates.append((
+            {"_id": rollup_key(user_id, period, start)},
+            {
+                "$inc": increments,
+                "$setOnInsert": {"user_id": user_id, "period": period, "start": start},
+                "$currentDate": {"updated_at": True},
+            },
+        ))
+    return updates
+
+def merge_increments(rollups: Dict[str, Dict[str, Any]], user_id: str, moment: datetime, increments: Dict[str, float]):
+    """Accumulate `increments` into in-memory rollup documents, as the $inc updates would in Mongo"""
+    for period in PERIODS:
+        start = period_start(period, moment)
+        key = rollup_key(user_id, period, start)
+        rollup = rollups.setdefault(key, {"_id": key, "user_id": user_id, "period": period, "start": start})
+        for path, amount in increments.items():
+            target = rollup
+            *parents, leaf = path.split(".")
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[leaf] = target.get(leaf, 0) + amount
+
+def combine_updates(updates: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Fold updates that target the same rollup into one, so a batch costs one write per rollup"""
+    combined: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    for query, update in updates:
+        key = query["_id"]
+        if key not in combined:
+            combined[key] = (query, {**update, "$inc": dict(update["$inc"])})
+            continue
+        totals = combined[key][1]["$inc"]
+        for path, amount in update["$inc"].items():
+            totals[path] = totals.get(path, 0) + amount
+    return list(combined.values())
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from log_config import get_logger
+from metrics import SINGLE_FLIGHT_SHARED, TURN_LOCK_WAIT_SECONDS
+from mongodb import MongoDB
+
+logger = get_logger(__name__)
+
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "30"))  # Renewed while held; bounds how long a crashed worker blocks others
+TURN_WAIT_SECONDS = float(os.getenv("TURN_WAIT_SECONDS", "120"))  # How long a turn queues behind the user's earlier turns
+SINGLE_FLIGHT_RESULT_SECONDS = float(os.getenv("SINGLE_FLIGHT_RESULT_SECONDS", "5"))  # How long waiting duplicates on other workers can still read a reply
+POLL_INITIAL = 0.05
+POLL_MAX = 0.5
+
+# Work a running turn handed to after_reply(); the turn is held until it finishes
+_turn_work: ContextVar[Optional[List[asyncio.Task]]] = ContextVar("turn_work", default=None)
+
+class LeaseTimeout(Exception):
+    """Raised when a lease is still held by someone else after the wait allowed for it"""
+
+class Lease:
+    """A Mongo-backed lease on `key`, renewed in the background while held.
+
+    Every Lease gets its own owner id, so two holders in one process exclude
+    each other just like two workers do. If the holder dies the lease lapses
+    after `ttl`; if renewal fails the holder only logs it, since the work is
+    already under way.
+    """
+
+    def __init__(self, key: str, ttl: float = LEASE_SECONDS, fields: Optional[Dict[str, Any]] = None,
+                 reclaim_done: bool = False):
+        self.key = key
+        self.ttl = timedelta(seconds=ttl)
+        self.fields = fields
+        self.reclaim_done = reclaim_done
+        self.owner = uuid.uuid4().hex
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def try_acquire(self) -> bool:
+        if not await MongoDB.acquire_lease(self.key, self.owner, self.ttl, self.fields, self.reclaim_done):
+            return False
+        self._heartbeat = asyncio.create_task(self._renew())
+        return True
+
+    async def acquire(self, wait: float = TURN_WAIT_SECONDS):
+        """Poll with backoff until the lease is ours; LeaseTimeout after `wait` seconds"""
+        deadline = time.monotonic() + wait
+        delay = POLL_INITIAL
+        while not await self.try_acquire():
+            if time.monotonic() + delay > deadline:
+                raise LeaseTimeout(f"{self.key} is still held after {wait:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POLL_MAX)
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.ttl.total_seconds() / 3)
+            try:
+                if not await MongoDB.renew_lease(self.key, self.owner, self.ttl):
+                    logger.warning("Lost lease %s", self.key)
+                    return
+            except Exception as e:
+                logger.error("Error renewing lease %s: %s", self.key, e)
+
+    def _stop_renewing(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    async def release(self):
+        self._stop_renewing()
+        await MongoDB.release_lease(self.key, self.owner)
+
+    async def complete(self, result: Any, keep: float):
+        """Keep the lease for `keep` more seconds as a finished record carrying `result`"""
+        self._stop_renewing()
+        await MongoDB.complete_lease(self.key, self.owner, result, timedelta(seconds=keep))
+
+@asynccontextmanager
+async def exclusive(key: str, ttl: float = LEASE_SECONDS):
+    """Hold `key` if nobody else does; yields False without waiting while another holder is live"""
+    lease = Lease(key, ttl)
+    if not await lease.try_acquire():
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        # Shielded so a cancelled holder still frees the key instead of blocking it for `ttl`
+        await asyncio.shield(lease.release())
+
+def flight_key(user_id: str, message: str) -> str:
+    digest = hashlib.sha256(message.strip().encode()).hexdigest()[:32]
+    return f"flight:{user_id}:{digest}"
+
+class TurnCoordinator:
+    """Runs one user's chat turns one at a time, and identical concurrent turns once.
+
+    - Ordering: an in-process lock per user queues turns on this worker in
+      arrival order, and the `turn:<user>` lease serializes them across
+      workers (there, by polling rather than strictly first come first served).
+    - Single flight: a turn is keyed by user and message. A duplicate on the
+      same worker awaits the running task; one on another worker waits on the
+      `flight:` lease and reads the reply stored in it when the turn is done.
+      Only duplicates that overlap the running turn share it: the same message
+      sent after the reply came back is a new turn.
+    - After the reply: work a turn passes to after_reply() (saving the
+      conversation) runs once the reply has gone back, but still inside the
+      turn, so the user's next turn only starts when it is done.
+    """
+
+    def __init__(self, result_seconds: float = SINGLE_FLIGHT_RESULT_SECONDS, wait: float = TURN_WAIT_SECONDS):
+        self.result_seconds = result_seconds
+        self.wait = wait
+        self._user_locks: Dict[str, asyncio.Lock] = {}
+        self._user_waiters: Dict[str, int] = {}
+        self._flights: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    @asynccontextmanager
+    async def user_turn(self, user_id: str):
+        """Hold the user's turn on this worker and across workers"""
+        started = time.perf_counter()
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_waiters[user_id] = self._user_waiters.get(user_id, 0) + 1
+        try:
+            async with lock:
+                lease = Lease(f"turn:{user_id}")
+                await lease.acquire(self.wait)
+                TURN_LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+                try:
+                    yield
+                finally:
+                    await asyncio.shield(lease.release())
+        finally:
+            self._user_waiters[user_id] -= 1
+            if not self._user_waiters[user_id]:
+                del self._user_waiters[user_id]
+                del self._user_locks[user_id]
+
+    async def run(self, user_id: str, message: str, turn: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `turn()`, shared with every identical call that overlaps it"""
+        key = flight_key(user_id, message)
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fly(key, user_id, turn))
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            SINGLE_FLIGHT_SHARED.labels("task").inc()
+        # A caller that goes away doesn't cancel the turn its duplicates are waiting on
+        return await asyncio.shield(task)
+
+    async def _fly(self, key: str, user_id: str, turn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = Lease(key, fields={"status": "running"}, reclaim_done=True)
+        deadline = time.monotonic() + self.wait
+        delay = POLL_INITIAL
+        if not await flight.try_acquire():
+            # An identical turn is running on another worker: wait for its reply
+            while True:
+                if time.monotonic() + delay > deadline:
+                    raise LeaseTimeout(f"{key} is still in flight after {self.wait:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, POLL_MAX)
+                existing = await MongoDB.get_lease(key)
+                if existing and existing.get("status") == "done":
+                    SINGLE_FLIGHT_SHARED.labels("lease").inc()
+                    return existing.get("result")
+                if existing is None and await flight.try_acquire():
+                    break  # It failed or its worker died; run the turn here
+
+        reply = asyncio.get_running_loop().create_future()
+        self._track(asyncio.create_task(self._hold_turn(user_id, turn, reply)))
+        try:
+            result = await reply
+        except BaseException:
+            await asyncio.shield(flight.release())
+            raise
+        await flight.complete(result, self.result_seconds)
+        return result
+
+    async def _hold_turn(self, user_id: str, turn: Callable[[], Awaitable[Any]], reply: asyncio.Future):
+        """Run `turn` inside the user's turn, set `reply`, then finish its after_reply work"""
+        try:
+            async with self.user_turn(user_id):
+                work: List[asyncio.Task] = []
+                token = _turn_work.set(work)
+                try:
+                    result = await turn()
+                finally:
+                    _turn_work.reset(token)
+                reply.set_result(result)
+                await self._finish_work(user_id, work)
+        except BaseException as e:
+            if not reply.done():
+                reply.set_exception(e)
+            elif not isinstance(e, asyncio.CancelledError):
+                logger.error("Error releasing turn: %s", e, extra={"user_id": user_id})
+
+    @asynccontextmanager
+    async def streaming_turn(self, user_id: str):
+        """Hold the user's turn for a reply the caller streams itself; yields the turn's work list.
+
+        Tasks from after_reply() appended to the list keep the turn held until
+        they finish. The turn is held by a tracked task rather than the caller,
+        and leaving the block never awaits, so a consumer cancelled by a client
+        disconnect can't release it early and drain() still waits for it.
+        """
+        acquired = asyncio.get_running_loop().create_future()
+        released = asyncio.Event()
+        work: List[asyncio.Task] = []
+        self._track(asyncio.create_task(self._hold_streaming_turn(user_id, acquired, released, work)))
+        try:
+            # Shielded so a caller cancelled in the queue doesn't cancel the hand-off
+            await asyncio.shield(acquired)
+            yield work
+        finally:
+            released.set()
+
+    async def _hold_streaming_turn(self, user_id: str, acquired: asyncio.Future, released: asyncio.Event, work: List[asyncio.Task]):
+        try:
+            async with self.user_turn(user_id):
+                acquired.set_result(None)
+                await released.wait()
+                await self._finish_work(user_id, work)
+        except BaseException as e:
+            if not acquired.done():
+                acquired.set_exception(e)
+            elif not isinstance(e, asyncio.CancelledError):
+                logger.error("Error releasing turn: %s", e, extra={"user_id": user_id})
+
+    async def _finish_work(self, user_id: str, work: List[asyncio.Task]):
+        for outcome in await asyncio.gather(*work, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                logger.error("Error finishing turn: %s", outcome, extra={"user_id": user_id})
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def after_reply(self, work: Awaitable[Any]) -> asyncio.Task:
+        """Run `work` after the turn's reply is returned, before the user's next turn starts.
+
+        Outside run() it simply runs detached. Either way drain() waits for it.
+        """
+        task = self._track(asyncio.ensure_future(work))
+        pending = _turn_work.get()
+        if pending is not None:
+            pending.append(task)
+        return task
+
+    async def drain(self):
+        """Wait for turns still finishing after their reply, e.g. before the database closes"""
+        while self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+turn_coordinator = TurnCoordinator()
@@ -0,0 +1,107 @@
+import os
+from typing import Dict, Type
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from memory_store import MemoryClient
+
+load_dotenv()
+
+MONGODB_URL = os.getenv("MONGODB_URL")  # Required with the motor backend; never commit a default with credentials
+DATABASE_NAME = os.getenv("MONGODB_DATABASE", "fitness_ai")
+MONGODB_TLS = os.getenv("MONGODB_TLS", "1") == "1"  # Set to 0 for a local mongod without TLS, e.g. in load tests
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "motor")  # "motor" or "memory"
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+class StorageBackend:
+    """Where the collections behind MongoDB live.
+
+    `connect` returns a client whose `client[name]` databases hand out
+    collections with the Motor API subset MongoDB uses, so the facade runs
+    unchanged on any backend.
+    """
+
+    name = ""
+
+    def connect(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+class MotorBackend(StorageBackend):
+    """The real thing: a Motor client on MONGODB_URL"""
+
+    name = "motor"
+
+    def __init__(self, url: str = None, tls: bool = None):
+        self.url = url or MONGODB_URL
+        if not self.url:
+            raise ValueError("MONGODB_URL is not set: point it at your MongoDB deployment (e.g. in .env), or set STORAGE_BACKEND=memory")
+        self.tls = MONGODB_TLS if tls is None else tls
+        self.client = None
+
+    def connect(self) -> AsyncIOMotorClient:
+        tls_options = {"tls": True, "tlsAllowInvalidCertificates": True} if self.tls else {}
+        self.client = AsyncIOMotorClient(self.url, **tls_options)
+        return self.client
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+class MemoryBackend(StorageBackend):
+    """In-process collections for benchmarks, load tests and CI; nothing survives the process.
+
+    Data outlives close()/connect() on the same backend, the way it would
+    on a server.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.client = MemoryClient()
+
+    def connect(self) -> MemoryClient:
+        return self.client
+
+    def close(self):
+        pass
+
+BACKENDS: Dict[str, Type[StorageBackend]] = {
+    MotorBackend.name: MotorBackend,
+    MemoryBackend.name: MemoryBackend,
+}
+
+def create_backend(name: str = None) -> StorageBackend:
+    """The backend named by `name` or STORAGE_BACKEND"""
+    name = name or STORAGE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+def is_local_url(url: str) -> bool:
+    """True when every host in a mongodb:// URL is this machine (mongodb+srv never is)"""
+    parts = urlsplit(url)
+    if parts.scheme != "mongodb":
+        return False
+    for host in parts.netloc.rsplit("@", 1)[-1].split(","):
+        hostname = host[1:host.find("]")] if host.startswith("[") else host.split(":")[0]
+        if hostname not in LOCAL_HOSTS:
+            return False
+    return True
+
+def scratch_backend(name: str, url: str = None) -> StorageBackend:
+    """A backend benchmarks may drop and seed collections on: in-memory, or a local mongod.
+
+    Anything but a local URL raises ValueError, so a benchmark can't end up
+    on MONGODB_URL (the shared cluster) by accident.
+    """
+    if name == MemoryBackend.name:
+        return MemoryBackend()
+    if name != MotorBackend.name:
+        raise ValueError(f"Unknown storage {name!r}; expected one of {', '.join(BACKENDS)}")
+    if not url or not is_local_url(url):
+        raise ValueError(f"Refusing to run against {url!r}: benchmarks only use a local mongod (mongodb://127.0.0.1:27017)")
+    return MotorBackend(url, tls=False)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend is a flat set of modules; make them importable from the tests.
+# Run from the backend directory with `python -m pytest tests`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
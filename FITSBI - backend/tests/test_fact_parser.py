@@ -0,0 +1,7 @@
+import pytest
+from fact_parser import CORPUS, parse_facts
+
+@pytest.mark.parametrize("message, expected", CORPUS, ids=[message for message, _ in CORPUS])
+def test_corpus_message_parses_exactly(message, expected):
+    # Negatives expect {} (or only the fields actually stated): anything extra lands in the profile
+    assert parse_facts(message) == expected
@@ -0,0 +1,51 @@
+import asyncio
+import time
+import pytest
+from llm_client import LLMClient, LLMError
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+DEADLINE = 0.3
+SLACK = 0.2  # Scheduling jitter allowed past the deadline
+
+def run(scenario):
+    # A call stuck on a slot would hang the suite; fail it instead
+    asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+
+def saturated_client(**options) -> LLMClient:
+    # Nothing listens here; a call that got past the slots would fail with a connection error instead
+    return LLMClient(base_url="http://127.0.0.1:9/v1", api_key="test", timeout=DEADLINE, max_retries=5, **options)
+
+async def timed_failure(call) -> float:
+    started = time.monotonic()
+    with pytest.raises(LLMError, match="deadline"):
+        await call()
+    return time.monotonic() - started
+
+def test_complete_gives_up_waiting_for_a_global_slot_at_the_deadline():
+    async def scenario():
+        client = saturated_client(max_concurrency=1)
+        await client._global_limit.acquire()  # Another call holds the only slot
+        elapsed = await timed_failure(lambda: client.complete(MESSAGES))
+        assert DEADLINE - 0.05 <= elapsed <= DEADLINE + SLACK
+    run(scenario)
+
+def test_stream_gives_up_waiting_for_a_global_slot_at_the_deadline():
+    async def scenario():
+        client = saturated_client(max_concurrency=1)
+        await client._global_limit.acquire()
+
+        async def consume():
+            async for _ in client.stream(MESSAGES):
+                pass
+        elapsed = await timed_failure(consume)
+        assert DEADLINE - 0.05 <= elapsed <= DEADLINE + SLACK
+    run(scenario)
+
+def test_waiting_for_a_model_slot_times_out_and_returns_the_global_slot():
+    async def scenario():
+        client = saturated_client(max_concurrency=1, model_concurrency={"busy-model": 1})
+        await client._model_limit("busy-model").acquire()
+        elapsed = await timed_failure(lambda: client.complete(MESSAGES, model="busy-model"))
+        assert elapsed <= DEADLINE + SLACK
+        assert not client._global_limit.locked(), "the global slot leaked"
+    run(scenario)
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from migrations import ensure_indexes, find_collection_scans
+from storage import is_local_url
+
+# Explains every hot query against a scratch database on a local mongod with
+# the declared indexes built. Skipped when no local mongod is reachable.
+MONGODB_URL = os.getenv("BENCH_MONGODB_URL", "mongodb://127.0.0.1:27017")
+SCRATCH_DATABASE = "fitsbi_test_query_plans"
+
+def local_mongod_available() -> bool:
+    if not is_local_url(MONGODB_URL):
+        return False
+    client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+@pytest.mark.skipif(not local_mongod_available(), reason=f"no local mongod at {MONGODB_URL}")
+def test_hot_queries_use_an_index():
+    async def scenario():
+        client = AsyncIOMotorClient(MONGODB_URL)
+        try:
+            await client.drop_database(SCRATCH_DATABASE)
+            db = client[SCRATCH_DATABASE]
+            await ensure_indexes(db)
+            return await find_collection_scans(db)
+        finally:
+            await client.drop_database(SCRATCH_DATABASE)
+            client.close()
+
+    offenders = asyncio.run(asyncio.wait_for(scenario(), timeout=30))
+    assert offenders == [], "\n".join(f"{o['collection']} {o['filter']}: {' > '.join(o['stages'])}" for o in offenders)
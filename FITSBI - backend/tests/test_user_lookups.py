@@ -0,0 +1,42 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from chatbot import FitnessChatbot
+from llm_client import llm_client
+from mongodb import MongoDB
+from single_flight import turn_coordinator
+from storage import MemoryBackend
+
+# One chat turn reads the user document once and shares it across its stages
+# (UserSnapshot); this pins that on the memory backend with a canned LLM.
+TURNS = [
+    "What should I eat before a morning run?",
+    "I weigh 82kg and I'm 180cm tall",  # Extracted into a profile write
+]
+
+async def fake_complete(messages, call_site, **kwargs):
+    content = json.dumps({"weight": 82, "height": 180}) if call_site == "extraction" else "Keep it light: a banana and some water."
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    monkeypatch.setattr(MongoDB, "backend", MemoryBackend())
+    monkeypatch.setattr(llm_client, "complete", fake_complete)
+
+@pytest.mark.parametrize("message", TURNS)
+def test_turn_reads_the_user_once(memory_db, message):
+    async def scenario():
+        await MongoDB.connect_to_database("fitsbi_test")
+        try:
+            user_id = str(await MongoDB.create_user({"email": "runner@example.com", "name": "Runner", "password": None}))
+            before = MongoDB.user_lookups
+            reply = await FitnessChatbot().generate_response(user_id, message)
+            await turn_coordinator.drain()  # The save runs after the reply, still inside the turn
+            return reply, MongoDB.user_lookups - before
+        finally:
+            await MongoDB.close_database_connection()
+
+    reply, lookups = asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    assert reply
+    assert lookups == 1
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+# Pure rendering of the "User Context" text, shared by the chat path and by
+# MongoDB, which materializes it in `user_contexts` whenever its inputs change.
+# Bump CONTEXT_FORMAT when the rendering changes so stored copies are rebuilt.
+CONTEXT_FORMAT = 1
+MEMORY_DAYS = 7  # Daily summaries older than this fall out of the context
+MEMORY_DAILY_LIMIT = 3
+
+def render_profile(user: Dict[str, Any]) -> str:
+    """Render the profile part of the user context"""
+    context = "=== USER PROFILE ===\n"
+
+    # Basic Demographics
+    if user.get('name'):
+        context += f"Name: {user['name']}\n"
+    if user.get('age'):
+        context += f"Age: {user['age']}\n"
+    if user.get('gender'):
+        context += f"Gender: {user['gender']}\n"
+    if user.get('location'):
+        context += f"Location: {user['location']}\n"
+
+    # Physical Metrics
+    if user.get('height') or user.get('weight'):
+        context += "\nPhysical Metrics:\n"
+        if user.get('height'):
+            context += f"Height: {user['height']}cm\n"
+        if user.get('weight'):
+            context += f"Weight: {user['weight']}kg\n"
+        if user.get('target_weight'):
+            context += f"Target Weight: {user['target_weight']}kg\n"
+
+    # Fitness & Activity
+    if user.get('fitness_goals'):
+        context += f"\nFitness Goals: {', '.join(user['fitness_goals'])}\n"
+    if user.get('activity_level'):
+        context += f"Activity Level: {user['activity_level']}\n"
+    if user.get('workout_frequency'):
+        context += f"Workout Frequency: {user['workout_frequency']} times/week\n"
+
+    # Health Considerations
+    health_info = []
+    if user.get('medical_conditions'):
+        health_info.append(f"Medical Conditions: {', '.join(user['medical_conditions'])}")
+    if user.get('injuries'):
+        health_info.append(f"Injuries: {', '.join(user['injuries'])}")
+    if user.get('medications'):
+        health_info.append(f"Medications: {', '.join(user['medications'])}")
+    if health_info:
+        context += "\nHealth Considerations:\n" + "\n".join(health_info) + "\n"
+
+    # Lifestyle
+    lifestyle_info = []
+    if user.get('sleep_hours'):
+        lifestyle_info.append(f"Sleep: {user['sleep_hours']} hours/night")
+    if user.get('stress_level'):
+        lifestyle_info.append(f"Stress Level: {user['stress_level']}")
+    if user.get('occupation'):
+        lifestyle_info.append(f"Occupation: {user['occupation']}")
+    if lifestyle_info:
+        context += "\nLifestyle:\n" + "\n".join(lifestyle_info) + "\n"
+
+    # Diet & Nutrition
+    if user.get('dietary_restrictions') or user.get('food_allergies'):
+        context += "\nNutrition:\n"
+        if user.get('dietary_restrictions'):
+            context += f"Dietary Restrictions: {', '.join(user['dietary_restrictions'])}\n"
+        if user.get('food_allergies'):
+            context += f"Food Allergies: {', '.join(user['food_allergies'])}\n"
+
+    # Equipment & Preferences
+    if user.get('available_equipment') or user.get('gym_access') is not None:
+        context += "\nFitness Resources:\n"
+        if user.get('available_equipment'):
+            context += f"Equipment: {', '.join(user['available_equipment'])}\n"
+        if user.get('gym_access') is not None:
+            context += f"Gym Access: {'Yes' if user['gym_access'] else 'No'}\n"
+
+    # Profile completion status
+    completion = user.get('profile_completion', 0)
+    context += f"\nProfile Completion: {completion:.0f}%\n"
+
+    return context
+
+def journey_lines(user_summary: Optional[Dict[str, Any]]) -> List[str]:
+    """The user summary (long-term memory) as lines: overall first, detail lines after"""
+    if not user_summary:
+        return []
+    journey = [user_summary.get('overall_summary', '')]
+    if user_summary.get('recent_patterns'):
+        journey.append(f"Recent Patterns: {user_summary['recent_patterns']}")
+    if user_summary.get('goals_progress'):
+        journey.append(f"Goals Progress: {user_summary['goals_progress']}")
+    return journey
+
+def daily_entries(summaries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The newest daily summaries, oldest first, each kept with its date so it can age out"""
+    newest = sorted(summaries or [], key=lambda summary: summary['date'])[-MEMORY_DAILY_LIMIT:]
+    return [
+        {"date": summary['date'], "line": f"{summary['date'].strftime('%Y-%m-%d')}: {summary['summary_text']}"}
+        for summary in newest
+    ]
+
+def current_daily_lines(entries: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[str]:
+    start = (now or datetime.utcnow()) - timedelta(days=MEMORY_DAYS)
+    return [entry["line"] for entry in entries if entry["date"] >= start]
+
+def build_user_context(user: Dict[str, Any], user_summary: Optional[Dict[str, Any]], daily_summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Everything the user context is rendered from, in the shape stored in `user_contexts`"""
+    return {
+        "format": CONTEXT_FORMAT,
+        "profile": render_profile(user),
+        "journey": journey_lines(user_summary),
+        "daily": daily_entries(daily_summaries),
+    }
+
+def render_memory(journey: List[str], daily: List[str]) -> str:
+    """Render the journey summary and daily summary lines the way the user context always has"""
+    context = ""
+    if journey:
+        context += "\n=== USER JOURNEY SUMMARY ===\n"
+        context += f"{journey[0]}\n"
+        if len(journey) > 1:
+            context += "\n" + "\n".join(journey[1:]) + "\n"
+    if daily:
+        context += "\n=== RECENT DAILY SUMMARIES ===\n"
+        context += "\n".join(daily) + "\n"
+    return context
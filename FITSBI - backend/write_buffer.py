@@ -0,0 +1,133 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+DUPLICATE_KEY = 11000
+
+FlushHook = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+class WriteBehindBuffer:
+    """Group-commit inserts into one collection.
+
+    Documents get their `_id` client-side and join an in-memory batch that is
+    written with a single insert_many once it holds `max_batch` documents or
+    `flush_interval` seconds after its first document, whichever comes first.
+    Until Mongo acknowledges them, pending(key) still returns them, so a
+    process always reads its own writes. stop() flushes whatever is left.
+
+    The trade-off: a crash loses at most the unflushed batch, and other
+    workers see a message only once it is flushed.
+    """
+
+    def __init__(self, key_field: str = "user_id", max_batch: int = None, flush_interval: float = None,
+                 max_retries: int = 3):
+        self.key_field = key_field
+        self.max_batch = max_batch or int(os.getenv("CHAT_WRITE_BATCH", "100"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("CHAT_WRITE_FLUSH_MS", "50")) / 1000
+        self.max_retries = max_retries
+        self.collection = None
+        self.on_flush: Optional[FlushHook] = None
+        self.inserted = 0  # Documents acknowledged since start, for throughput reporting
+        self.flushes = 0
+        self._batch: List[Dict[str, Any]] = []
+        self._pending: Dict[Any, Dict[ObjectId, Dict[str, Any]]] = {}  # key -> _id -> document, until acknowledged
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks = set()
+
+    @property
+    def running(self) -> bool:
+        return self.collection is not None
+
+    def start(self, collection, on_flush: Optional[FlushHook] = None):
+        """Begin buffering into `collection`; `on_flush` gets each batch of documents that landed"""
+        self.collection = collection
+        self.on_flush = on_flush
+
+    async def stop(self):
+        """Flush everything buffered, then stop accepting writes"""
+        if self.collection is None:
+            return
+        await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._batch:
+            logger.error("%d buffered documents could not be written before shutdown", len(self._batch))
+        self.collection = None
+
+    def add(self, document: Dict[str, Any]) -> ObjectId:
+        """Buffer `document` for the next group commit and return its `_id`"""
+        document.setdefault("_id", ObjectId())
+        self._batch.append(document)
+        self._pending.setdefault(document[self.key_field], {})[document["_id"]] = document
+        if len(self._batch) >= self.max_batch:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._schedule_flush)
+        return document["_id"]
+
+    def pending(self, key: Any) -> List[Dict[str, Any]]:
+        """Copies of the documents for `key` that are not acknowledged yet"""
+        return [dict(document) for document in self._pending.get(key, {}).values()]
+
+    def _schedule_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self) -> int:
+        """Write the current batch with one insert_many; returns how many documents landed"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        if not batch:
+            return 0
+
+        remaining = batch
+        for attempt in range(self.max_retries):
+            try:
+                await self.collection.insert_many(remaining, ordered=False)
+                remaining = []
+            except BulkWriteError as e:
+                # Duplicate keys mean an earlier attempt already landed that document
+                failed = {error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY}
+                remaining = [document for index, document in enumerate(remaining) if index in failed]
+            except Exception as e:
+                logger.error("Error flushing %d buffered documents: %s", len(remaining), e)
+            if not remaining:
+                break
+            await asyncio.sleep(0.1 * 2 ** attempt)
+
+        failed_ids = {document["_id"] for document in remaining}
+        written = [document for document in batch if document["_id"] not in failed_ids]
+        for document in written:
+            self._acknowledge(document)
+        if remaining:
+            # Keep them buffered (and readable) for the next flush rather than dropping them
+            self._batch = remaining + self._batch
+            if self._timer is None and self.collection is not None:
+                self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._schedule_flush)
+
+        self.inserted += len(written)
+        self.flushes += 1
+        if written and self.on_flush:
+            try:
+                await self.on_flush(written)
+            except Exception as e:
+                logger.error("Error in flush hook: %s", e)
+        return len(written)
+
+    def _acknowledge(self, document: Dict[str, Any]):
+        key = document[self.key_field]
+        documents = self._pending.get(key)
+        if documents is not None:
+            documents.pop(document["_id"], None)
+            if not documents:
+                del self._pending[key]